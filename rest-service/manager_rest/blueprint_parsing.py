@@ -0,0 +1,285 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import json
+import hashlib
+import threading
+import multiprocessing
+
+from dsl_parser import tasks
+from dsl_parser.import_resolver.abstract_import_resolver import \
+    AbstractImportResolver
+
+from manager_rest import config
+from manager_rest import import_resolver_cache
+from manager_rest import utils
+from manager_rest.plan_cache import LRUCache
+
+DEFAULT_BLUEPRINT_PARSING_SETTINGS = {
+    'processes': 2,
+    'timeout': 300,
+    'cache_max_entries': 100,
+    'cache_max_size_MB': 50
+}
+
+_pool = None
+_cache = None
+_lock = threading.Lock()
+
+
+_TERMINATED_ERROR = 'Parsing the blueprint was aborted, since parsing ' \
+                    'another blueprint timed out'
+
+
+class BlueprintParsingError(Exception):
+    pass
+
+
+def _settings():
+    settings = dict(DEFAULT_BLUEPRINT_PARSING_SETTINGS)
+    settings.update(config.instance().blueprint_parsing or {})
+    return settings
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                settings = _settings()
+                _cache = LRUCache(
+                    max_entries=settings['cache_max_entries'],
+                    max_size=settings['cache_max_size_MB'] * 1024 * 1024)
+    return _cache
+
+
+class ParsingPool(object):
+    """
+    A pool of processes parsing blueprints.
+
+    A parsing process can't be stopped on its own, so when parsing times
+    out the whole pool is terminated, and any other parsing in progress in
+    it fails right away rather than when its own timeout expires.
+    """
+
+    def __init__(self, processes):
+        self._pool = multiprocessing.Pool(processes)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._terminated = False
+
+    def parse(self, args, timeout):
+        """
+        :return: the serialized plan, and the digests of the remote imports
+                 resolved while parsing it, by their urls.
+        :raises BlueprintParsingError: if parsing failed, timed out, or the
+                                       pool was terminated meanwhile.
+        """
+        pending = _PendingParse()
+        with self._lock:
+            if self._terminated:
+                raise BlueprintParsingError(_TERMINATED_ERROR)
+            self._pending.add(pending)
+            self._pool.apply_async(_parse_in_process, args,
+                                   callback=pending.complete)
+        try:
+            if not pending.done.wait(timeout):
+                self.terminate()
+                raise BlueprintParsingError(
+                    'Parsing the blueprint timed out after {0} '
+                    'seconds'.format(timeout))
+        finally:
+            with self._lock:
+                self._pending.discard(pending)
+        serialized_plan, imports, error = pending.result
+        if error:
+            raise BlueprintParsingError(error)
+        return serialized_plan, imports
+
+    def terminate(self):
+        with self._lock:
+            self._terminated = True
+            pending = list(self._pending)
+        self._pool.terminate()
+        for parse in pending:
+            parse.complete((None, None, _TERMINATED_ERROR))
+
+    @property
+    def terminated(self):
+        return self._terminated
+
+
+class _PendingParse(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+    def complete(self, result):
+        if not self.done.is_set():
+            self.result = result
+            self.done.set()
+
+
+def _get_pool(processes):
+    global _pool
+    with _lock:
+        if _pool is None or _pool.terminated:
+            _pool = ParsingPool(processes)
+        return _pool
+
+
+def start():
+    """
+    Creates the parsing pool, unless blueprints are parsed inline.
+
+    The pool forks its processes when it's created, so this is called when
+    the app is set up, in the process serving requests and before it starts
+    any threads. Only a pool replacing one which was terminated after a
+    timeout is created later on.
+    """
+    settings = _settings()
+    if settings['processes']:
+        _get_pool(settings['processes'])
+
+
+class _RecordingImportResolver(AbstractImportResolver):
+    """
+    Resolves imports using the wrapped resolver, keeping the digests of the
+    resolved imports by their urls.
+    """
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+        self.imports = {}
+
+    def resolve(self, import_url):
+        content = self.resolver.resolve(import_url)
+        self.imports[import_url] = _content_digest(content)
+        return content
+
+
+def _content_digest(content):
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def _parse(dsl_location, resources_base, resolver, validate_version):
+    resolver = _RecordingImportResolver(resolver)
+    plan = tasks.parse_dsl(dsl_location, resources_base,
+                           resolver=resolver,
+                           validate_version=validate_version)
+    return json.dumps(plan), resolver.imports
+
+
+def _parse_in_process(dsl_location, resources_base, resolver_section,
+                      validate_version):
+    # runs in a parsing process, so the import resolver is created here
+    # rather than passed in, and the plan is returned serialized, which is
+    # also how it's cached
+    try:
+        resolver = import_resolver_cache.create_import_resolver(
+            resolver_section)
+        serialized_plan, imports = _parse(dsl_location, resources_base,
+                                          resolver, validate_version)
+        return serialized_plan, imports, None
+    except Exception, ex:
+        return None, None, str(ex)
+
+
+def _digest(application_path, application_file_name, resources_base,
+            resolver_section, validate_version):
+    sha256 = hashlib.sha256(json.dumps(
+        [application_file_name, resources_base, resolver_section,
+         validate_version], sort_keys=True))
+    utils.update_directory_digest(sha256, application_path)
+    return sha256.hexdigest()
+
+
+def parse_dsl(file_server_root, application_dir, application_file_name,
+              resources_base, resolver, resolver_section, validate_version):
+    """
+    Parses the given blueprint, which was extracted to `application_dir`
+    under the file server root.
+
+    Plans are cached by a digest of the application directory's content
+    and of the parser context, so a blueprint which is uploaded again,
+    even under a different id, isn't parsed again. A cached plan is only
+    used while the remote imports resolved when parsing it, other than the
+    application's own files, are resolved to the same content again by
+    `resolver` - which, like the imports cache, may serve an import for up
+    to its `max_age` without revalidating it. Otherwise, the blueprint
+    is parsed by a pool of `processes` processes, in which parsing may take
+    up to `timeout` seconds; when `processes` is 0, the blueprint is parsed
+    in the calling thread, using the given resolver.
+
+    :raises BlueprintParsingError: if the blueprint couldn't be parsed.
+    """
+    settings = _settings()
+    dsl_location = '{0}{1}'.format(
+        resources_base, os.path.join(application_dir, application_file_name))
+    key = _digest(os.path.join(file_server_root, application_dir),
+                  application_file_name, resources_base, resolver_section,
+                  validate_version)
+    cache = _get_cache()
+    cached = cache.get(key)
+    if cached is not None and _imports_unchanged(cached[1], resolver):
+        serialized_plan = cached[0]
+    else:
+        if settings['processes']:
+            serialized_plan, imports = _parse_in_pool(
+                settings, dsl_location, resources_base, resolver_section,
+                validate_version)
+        else:
+            try:
+                serialized_plan, imports = _parse(
+                    dsl_location, resources_base, resolver, validate_version)
+            except Exception, ex:
+                raise BlueprintParsingError(str(ex))
+        # the application's own files are already part of the key
+        application_url = '{0}{1}/'.format(resources_base, application_dir)
+        imports = dict((url, digest) for url, digest in imports.iteritems()
+                       if not url.startswith(application_url))
+        cache.put(key, (serialized_plan, imports), len(serialized_plan))
+    return json.loads(serialized_plan)
+
+
+def _imports_unchanged(imports, resolver):
+    for import_url, digest in imports.iteritems():
+        try:
+            content = resolver.resolve(import_url)
+        except Exception:
+            return False
+        if _content_digest(content) != digest:
+            return False
+    return True
+
+
+def _parse_in_pool(settings, dsl_location, resources_base, resolver_section,
+                   validate_version):
+    pool = _get_pool(settings['processes'])
+    return pool.parse((dsl_location, resources_base, resolver_section,
+                       validate_version), settings['timeout'])
+
+
+def reset():
+    global _pool, _cache
+    with _lock:
+        if _pool is not None:
+            _pool.terminate()
+        _pool = None
+        _cache = None
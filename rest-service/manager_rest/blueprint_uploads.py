@@ -0,0 +1,89 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import logging
+import threading
+import Queue
+
+from manager_rest import config
+
+_pool = None
+_pool_lock = threading.Lock()
+
+logger = logging.getLogger('manager-rest')
+
+
+class WorkerPool(object):
+    """
+    A fixed number of daemon threads running the submitted jobs in the
+    order in which they were submitted.
+    """
+
+    def __init__(self, size):
+        self._jobs = Queue.Queue()
+        self._threads = []
+        for _ in range(size):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job):
+        self._jobs.put(job)
+
+    def shutdown(self):
+        # jobs which were already submitted are run before the workers exit
+        for _ in self._threads:
+            self._jobs.put(None)
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                job()
+            except Exception:
+                logger.exception('Blueprint upload job failed')
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WorkerPool(config.instance().blueprint_upload_workers)
+    return _pool
+
+
+def submit(job):
+    """
+    Runs the given job in the background, in a pool of
+    `blueprint_upload_workers` threads shared by all blueprint uploads.
+
+    Jobs are only queued in memory, and are lost if the process exits. The
+    blueprints of lost jobs are marked as failed when polled after
+    `blueprint_upload_timeout` seconds (see
+    BlueprintsManager.get_blueprint).
+    """
+    _get_pool().submit(job)
+
+
+def reset():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
@@ -13,10 +13,10 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import copy
 import uuid
 import traceback
-import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from StringIO import StringIO
 
 from flask import g, current_app
@@ -25,9 +25,14 @@ from dsl_parser import constants
 from dsl_parser import exceptions as parser_exceptions
 from dsl_parser import functions
 from dsl_parser import tasks
-from dsl_parser import utils as dsl_parser_utils
+from manager_rest import blueprint_parsing
+from manager_rest import config
+from manager_rest import import_resolver_cache
 from manager_rest import models
 from manager_rest import manager_exceptions
+from manager_rest import outputs_cache
+from manager_rest import plan_cache
+from manager_rest import provider_context_cache
 from manager_rest.workflow_client import workflow_client
 from manager_rest.storage_manager import get_storage_manager
 from manager_rest.utils import maybe_register_teardown
@@ -47,6 +52,90 @@ class BlueprintAlreadyExistsException(Exception):
         self.blueprint_id = blueprint_id
 
 
+def _remove_relationships(relationships, node_instance):
+    """
+    Returns the given relationships without those of the modification's
+    node instance, which target the added or removed node instances.
+    """
+    target_ids = set([rel['target_id']
+                      for rel in node_instance['relationships']])
+    return [rel for rel in relationships if rel['target_id'] not in target_ids]
+
+
+class _DeploymentFunctionsStorage(object):
+    """
+    Serves the storage callbacks of intrinsic functions evaluation for a
+    single deployment.
+
+    All the deployment's node instances are fetched with the first
+    callback, and its nodes with the first node lookup, projected to the
+    fields used by the functions, so an evaluation performs at most two
+    queries regardless of the number of functions evaluated.
+    """
+
+    NODE_INSTANCE_FIELDS = ['id', 'node_id', 'deployment_id',
+                            'runtime_properties']
+    NODE_FIELDS = ['id', 'properties']
+
+    def __init__(self, sm, deployment_id):
+        self._sm = sm
+        self._deployment_id = deployment_id
+        self._node_instances = None
+        self._nodes = None
+
+    def _get_node_instances_by_id(self):
+        if self._node_instances is None:
+            node_instances = self._sm.get_node_instances(
+                include=self.NODE_INSTANCE_FIELDS,
+                filters={'deployment_id': [self._deployment_id]})
+            self._node_instances = dict(
+                (node_instance.id, node_instance)
+                for node_instance in node_instances)
+        return self._node_instances
+
+    def get_node_instances(self, node_id=None):
+        return [node_instance for node_instance
+                in self._get_node_instances_by_id().itervalues()
+                if node_id is None or node_instance.node_id == node_id]
+
+    def get_node_instance(self, node_instance_id):
+        node_instance = self._get_node_instances_by_id().get(node_instance_id)
+        if node_instance is None:
+            # function contexts may refer to node instances of other
+            # deployments, or to missing ones
+            return self._sm.get_node_instance(node_instance_id)
+        return node_instance
+
+    def get_node(self, node_id):
+        if self._nodes is None:
+            nodes = self._sm.get_nodes(
+                include=self.NODE_FIELDS,
+                filters={'deployment_id': [self._deployment_id]})
+            self._nodes = dict((node.id, node) for node in nodes)
+        if node_id not in self._nodes:
+            raise manager_exceptions.NotFoundError(
+                "Node {0} not found".format(node_id))
+        return self._nodes[node_id]
+
+
+def _modification_affected_node_instances(node_instances,
+                                          node_instances_modification):
+    """
+    Returns the given node instances (as they were before the modification)
+    which the modification affects: the removed instances and the existing
+    instances related to the added or removed ones. Other instances of the
+    modified nodes aren't affected, so the result grows with the size of
+    the modification rather than with the size of the modified nodes.
+    """
+    affected_ids = set(
+        instance['id']
+        for key in ('added_and_related', 'removed_and_related')
+        for instance in node_instances_modification[key]
+        if instance.get('modification') != 'added')
+    return [instance for instance in node_instances
+            if instance['id'] in affected_ids]
+
+
 class BlueprintsManager(object):
 
     @property
@@ -63,6 +152,13 @@ class BlueprintsManager(object):
 
     def executions_list(self, include=None, is_include_system_workflows=False,
                         filters=None, pagination=None):
+        filters = self.create_executions_filters(filters,
+                                                 is_include_system_workflows)
+        return self.sm.executions_list(include=include, filters=filters,
+                                       pagination=pagination)
+
+    @staticmethod
+    def create_executions_filters(filters, is_include_system_workflows):
         filters = filters or {}
         is_system_workflow = filters.get('is_system_workflow')
         if is_system_workflow:
@@ -72,10 +168,38 @@ class BlueprintsManager(object):
                 filters['is_system_workflow'].append(value)
         elif not is_include_system_workflows:
             filters['is_system_workflow'] = [False]
-        return self.sm.executions_list(include=include, filters=filters,
-                                       pagination=pagination)
+        return filters
 
     def get_blueprint(self, blueprint_id, include=None):
+        blueprint = self.sm.get_blueprint(blueprint_id, include=include)
+        if blueprint.state in models.BlueprintState.IN_PROGRESS_STATES:
+            blueprint = self._fail_stale_upload(blueprint_id, blueprint,
+                                                include)
+        return blueprint
+
+    def _fail_stale_upload(self, blueprint_id, blueprint, include):
+        """
+        Background uploads are processed by threads of the process which
+        received them, and are lost if it exits or is recycled, leaving the
+        blueprint in progress. Since another live process may still be
+        processing an upload, a blueprint is only marked as failed once it
+        has been polled after not progressing for `blueprint_upload_timeout`
+        seconds.
+        """
+        updated_at = blueprint.updated_at or self.sm.get_blueprint(
+            blueprint_id, include=['updated_at']).updated_at
+        # timestamps are stored as str(datetime), with optional microseconds
+        updated_at = datetime.strptime(updated_at.split('.')[0],
+                                       '%Y-%m-%d %H:%M:%S')
+        timeout = config.instance().blueprint_upload_timeout
+        if datetime.now() - updated_at < timedelta(seconds=timeout):
+            return blueprint
+        self.update_blueprint(
+            blueprint_id,
+            state=models.BlueprintState.FAILED,
+            error='The upload did not progress for {0} seconds, and the '
+                  'process handling it is assumed to have exited'
+                  .format(timeout))
         return self.sm.get_blueprint(blueprint_id, include=include)
 
     def get_deployment(self, deployment_id, include=None):
@@ -92,7 +216,10 @@ class BlueprintsManager(object):
 
         if self._get_transient_deployment_workers_mode_config()['enabled'] and\
                 status in models.Execution.END_STATES:
-            execution = self.get_execution(execution_id)
+            execution = self.get_execution(
+                execution_id,
+                include=['is_system_workflow', 'workflow_id',
+                         'deployment_id'])
 
             # currently, the create and delete deployment environment
             # workflows are still not marked as system workflows, so they're
@@ -123,15 +250,11 @@ class BlueprintsManager(object):
                           application_dir,
                           application_file_name,
                           resources_base,
-                          blueprint_id):
-        application_file = os.path.join(application_dir, application_file_name)
-        dsl_location = '{0}{1}'.format(resources_base, application_file)
-        try:
-            plan = tasks.parse_dsl(
-                dsl_location, resources_base,
-                **self._get_parser_context())
-        except Exception, ex:
-            raise DslParseException(str(ex))
+                          blueprint_id,
+                          sha256=None):
+        plan = self.parse_blueprint(application_dir,
+                                    application_file_name,
+                                    resources_base)
 
         now = str(datetime.now())
 
@@ -141,12 +264,58 @@ class BlueprintsManager(object):
             description=plan.get('description'),
             created_at=now,
             updated_at=now,
-            main_file_name=application_file_name)
+            main_file_name=application_file_name,
+            sha256=sha256,
+            state=models.BlueprintState.READY)
         self.sm.put_blueprint(new_blueprint.id, new_blueprint)
         return new_blueprint
 
+    def parse_blueprint(self,
+                        application_dir,
+                        application_file_name,
+                        resources_base):
+        parser_context = self._get_parser_context()
+        try:
+            return blueprint_parsing.parse_dsl(
+                config.instance().file_server_root,
+                application_dir,
+                application_file_name,
+                resources_base,
+                resolver=parser_context['resolver'],
+                resolver_section=parser_context.get('resolver_section'),
+                validate_version=parser_context['validate_version'])
+        except blueprint_parsing.BlueprintParsingError, ex:
+            raise DslParseException(str(ex))
+
+    def reserve_blueprint(self, blueprint_id):
+        """
+        Stores a blueprint which is uploaded in the background, in the
+        `uploading` state and without a plan, so that its id is taken and
+        its state may be polled until it's `ready` or `failed`.
+        """
+        now = str(datetime.now())
+        blueprint = models.BlueprintState(
+            plan=None,
+            id=blueprint_id,
+            description=None,
+            created_at=now,
+            updated_at=now,
+            main_file_name=None,
+            state=models.BlueprintState.UPLOADING)
+        self.sm.put_blueprint(blueprint.id, blueprint)
+        return blueprint
+
+    def update_blueprint(self, blueprint_id, **changes):
+        values = dict.fromkeys(models.BlueprintState.fields)
+        values.update(changes)
+        values.update(id=blueprint_id, updated_at=str(datetime.now()))
+        self.sm.update_blueprint(blueprint_id,
+                                 models.BlueprintState(**values))
+        return self.sm.get_blueprint(blueprint_id)
+
     def delete_blueprint(self, blueprint_id):
-        blueprint_deployments = self.sm.get_blueprint_deployments(blueprint_id)
+        blueprint_deployments = self.sm.get_blueprint_deployments(
+            blueprint_id, include=['id'])
 
         if len(blueprint_deployments) > 0:
             raise manager_exceptions.DependentExistsError(
@@ -156,32 +325,33 @@ class BlueprintsManager(object):
                         ','.join([dep.id for dep
                                   in blueprint_deployments])))
 
-        return self.sm.delete_blueprint(blueprint_id)
+        deleted_blueprint = self.sm.delete_blueprint(blueprint_id)
+        plan_cache.discard(blueprint_id)
+        return deleted_blueprint
 
     def delete_deployment(self, deployment_id, ignore_live_nodes=False):
         # Verify deployment exists.
-        self.sm.get_deployment(deployment_id)
+        self.sm.get_deployment(deployment_id, include=['id'])
 
         # validate there are no running executions for this deployment
-        deplyment_id_filter = self.create_filters_dict(
-            deployment_id=deployment_id)
-        executions = self.sm.executions_list(filters=deplyment_id_filter)
-        if any(execution.status not in models.Execution.END_STATES for
-           execution in executions):
+        running_filter = self.create_filters_dict(
+            deployment_id=[deployment_id],
+            status=models.Execution.ACTIVE_STATES)
+        running = self.sm.executions_list(filters=running_filter,
+                                          include=['id'])
+        if running:
             raise manager_exceptions.DependentExistsError(
                 "Can't delete deployment {0} - There are running "
                 "executions for this deployment. Running executions ids: {1}"
                 .format(
                     deployment_id,
-                    ','.join([execution.id for execution in
-                              executions if execution.status not
-                              in models.Execution.END_STATES])))
+                    ','.join([execution.id for execution in running])))
 
         if not ignore_live_nodes:
             deplyment_id_filter = self.create_filters_dict(
                 deployment_id=deployment_id)
             node_instances = self.sm.get_node_instances(
-                filters=deplyment_id_filter)
+                filters=deplyment_id_filter, include=['id', 'state'])
             # validate either all nodes for this deployment are still
             # uninitialized or have been deleted
             if any(node.state not in ('uninitialized', 'deleted') for node in
@@ -195,12 +365,15 @@ class BlueprintsManager(object):
                                      ('uninitialized', 'deleted')])))
 
         self._delete_deployment_environment(deployment_id)
-        return self.sm.delete_deployment(deployment_id)
+        deleted = self.sm.delete_deployment(deployment_id)
+        outputs_cache.discard(deployment_id)
+        return deleted
 
     def execute_workflow(self, deployment_id, workflow_id,
                          parameters=None,
                          allow_custom_parameters=False, force=False):
-        deployment = self.get_deployment(deployment_id)
+        deployment = self.get_deployment(
+            deployment_id, include=['id', 'blueprint_id', 'workflows'])
 
         if workflow_id not in deployment.workflows:
             raise manager_exceptions.NonexistentWorkflowError(
@@ -327,7 +500,8 @@ class BlueprintsManager(object):
                 raise RuntimeError(error_msg)
 
             # verify the execution completed successfully
-            execution = self.sm.get_execution(async_task.id)
+            execution = self.sm.get_execution(async_task.id,
+                                              include=['status'])
             if execution.status != models.Execution.TERMINATED:
                 raise RuntimeError(
                     'Failed executing the {0} system workflow for deployment '
@@ -364,7 +538,7 @@ class BlueprintsManager(object):
         :raises manager_exceptions.IllegalActionError
         """
 
-        execution = self.get_execution(execution_id)
+        execution = self.get_execution(execution_id, include=['status'])
         if execution.status not in (models.Execution.PENDING,
                                     models.Execution.STARTED) and \
                 (not force or execution.status != models.Execution
@@ -383,8 +557,7 @@ class BlueprintsManager(object):
         return self.get_execution(execution_id)
 
     def create_deployment(self, blueprint_id, deployment_id, inputs=None):
-        blueprint = self.get_blueprint(blueprint_id)
-        plan = blueprint.plan
+        plan = plan_cache.get_plan(self.sm, blueprint_id)
         try:
             deployment_plan = tasks.prepare_deployment_plan(plan, inputs)
         except parser_exceptions.MissingRequiredInputError, e:
@@ -442,14 +615,20 @@ class BlueprintsManager(object):
         node_instances = [instance.to_dict() for instance
                           in self.sm.get_node_instances(
                           filters=deployment_id_filter)]
+        # the modification is computed from a copy, so that the instances
+        # can be stored as the state before the modification as they are
+        before_modification = copy.deepcopy(node_instances)
         node_instances_modification = tasks.modify_deployment(
             nodes=nodes,
             previous_node_instances=node_instances,
             modified_nodes=modified_nodes)
-
-        node_instances_modification['before_modification'] = [
-            instance.to_dict() for instance in
-            self.sm.get_node_instances(filters=deployment_id_filter)]
+        # rather than a copy of every node instance of the deployment, only
+        # the prior state of the instances the modification affects is
+        # stored with it - this is the delta applied by finishing it and
+        # reverted by rolling it back
+        node_instances_modification['before_modification'] = \
+            _modification_affected_node_instances(
+                before_modification, node_instances_modification)
 
         now = str(datetime.now())
         modification_id = str(uuid.uuid4())
@@ -470,22 +649,16 @@ class BlueprintsManager(object):
                 planned_number_of_instances=modified_node['instances'])
         added_and_related = node_instances_modification['added_and_related']
         added_node_instances = []
+        related_node_instances = []
         for node_instance in added_and_related:
             if node_instance.get('modification') == 'added':
                 added_node_instances.append(node_instance)
             else:
-                current = self.sm.get_node_instance(node_instance['id'])
-                new_relationships = current.relationships
-                new_relationships += node_instance['relationships']
-                self.sm.update_node_instance(models.DeploymentNodeInstance(
-                    id=node_instance['id'],
-                    relationships=new_relationships,
-                    version=current.version,
-                    node_id=None,
-                    host_id=None,
-                    deployment_id=None,
-                    state=None,
-                    runtime_properties=None))
+                related_node_instances.append(node_instance)
+        self._update_node_instances_relationships(
+            related_node_instances,
+            lambda current, node_instance:
+                current + node_instance['relationships'])
         self._create_deployment_node_instances(deployment_id,
                                                added_node_instances)
         return modification
@@ -504,26 +677,16 @@ class BlueprintsManager(object):
             self.sm.update_node(modification.deployment_id, node_id,
                                 number_of_instances=modified_node['instances'])
         node_instances = modification.node_instances
+        removed_node_instance_ids = []
+        related_node_instances = []
         for node_instance in node_instances['removed_and_related']:
             if node_instance.get('modification') == 'removed':
-                self.sm.delete_node_instance(node_instance['id'])
+                removed_node_instance_ids.append(node_instance['id'])
             else:
-                removed_relationship_target_ids = set(
-                    [rel['target_id']
-                     for rel in node_instance['relationships']])
-                current = self.sm.get_node_instance(node_instance['id'])
-                new_relationships = [rel for rel in current.relationships
-                                     if rel['target_id']
-                                     not in removed_relationship_target_ids]
-                self.sm.update_node_instance(models.DeploymentNodeInstance(
-                    id=node_instance['id'],
-                    relationships=new_relationships,
-                    version=current.version,
-                    node_id=None,
-                    host_id=None,
-                    deployment_id=None,
-                    state=None,
-                    runtime_properties=None))
+                related_node_instances.append(node_instance)
+        self.sm.delete_node_instances(removed_node_instance_ids)
+        self._update_node_instances_relationships(
+            related_node_instances, _remove_relationships)
 
         now = str(datetime.now())
         self.sm.update_deployment_modification(
@@ -556,16 +719,26 @@ class BlueprintsManager(object):
                 'in {1} status.'.format(modification_id,
                                         modification.status))
         deplyment_id_filter = self.create_filters_dict(
-            deployment_id=modification.deployment_id)
-        node_instances = self.sm.get_node_instances(
-            filters=deplyment_id_filter)
+            deployment_id=[modification.deployment_id])
+        before_modification = \
+            modification.node_instances['before_modification']
+        # the added instances are removed, and the affected ones are
+        # restored to their state and runtime properties before the
+        # modification. their versions aren't restored, since storing the
+        # instances again assigns them new versions
+        affected_ids = \
+            [instance['id'] for instance in before_modification] + \
+            [instance['id'] for instance
+             in modification.node_instances['added_and_related']
+             if instance.get('modification') == 'added']
+        node_instances = self.sm.get_node_instances_by_ids(affected_ids)
         modification.node_instances['before_rollback'] = [
             instance.to_dict() for instance in node_instances]
-        for instance in node_instances:
-            self.sm.delete_node_instance(instance.id)
-        for instance in modification.node_instances['before_modification']:
-            self.sm.put_node_instance(
-                models.DeploymentNodeInstance(**instance))
+        self.sm.delete_node_instances(
+            [instance.id for instance in node_instances])
+        self.sm.put_node_instances(
+            [models.DeploymentNodeInstance(**instance) for instance
+             in before_modification])
         nodes_num_instances = {node.id: node for node in self.sm.get_nodes(
             filters=deplyment_id_filter,
             include=['id', 'number_of_instances'])}
@@ -597,6 +770,39 @@ class BlueprintsManager(object):
             node_instances=None,
             context=None)
 
+    def _update_node_instances_relationships(self, node_instances,
+                                             new_relationships):
+        """
+        Updates the relationships of the given node instances (as returned
+        by the dsl parser modification) using a single bulk read and a
+        single bulk write.
+
+        :param new_relationships: a function receiving the current
+               relationships of a node instance and the parser's node
+               instance, and returning the new relationships.
+        """
+        if not node_instances:
+            return
+        current_node_instances = self.sm.get_node_instances_by_ids(
+            [node_instance['id'] for node_instance in node_instances],
+            include=['id', 'relationships', 'version'])
+        updates = [
+            models.DeploymentNodeInstance(
+                id=current.id,
+                relationships=new_relationships(current.relationships,
+                                                node_instance),
+                version=current.version,
+                node_id=None,
+                host_id=None,
+                deployment_id=None,
+                state=None,
+                runtime_properties=None)
+            for current, node_instance
+            in zip(current_node_instances, node_instances)]
+        for result in self.sm.update_node_instances(updates):
+            if isinstance(result, manager_exceptions.ManagerException):
+                raise result
+
     def _get_node_instance_ids(self, deployment_id):
         deplyment_id_filter = self.create_filters_dict(
             deployment_id=deployment_id)
@@ -606,12 +812,13 @@ class BlueprintsManager(object):
     def _create_deployment_node_instances(self,
                                           deployment_id,
                                           dsl_node_instances):
+        node_instances = []
         for node_instance in dsl_node_instances:
             instance_id = node_instance['id']
             node_id = node_instance['name']
             relationships = node_instance.get('relationships', [])
             host_id = node_instance.get('host_id')
-            instance = models.DeploymentNodeInstance(
+            node_instances.append(models.DeploymentNodeInstance(
                 id=instance_id,
                 node_id=node_id,
                 host_id=host_id,
@@ -619,61 +826,77 @@ class BlueprintsManager(object):
                 deployment_id=deployment_id,
                 state='uninitialized',
                 runtime_properties={},
-                version=None)
-            self.sm.put_node_instance(instance)
+                version=None))
+        self.sm.put_node_instances(node_instances)
+
+    def get_deployment_outputs(self, deployment_id):
+        """
+        :return: a (outputs, etag) tuple of the evaluated outputs of the
+                 given deployment, which are cached until any of the
+                 deployment's node instances changes.
+        """
+        return outputs_cache.get_outputs(self.sm, deployment_id,
+                                         self.evaluate_deployment_outputs)
 
     def evaluate_deployment_outputs(self, deployment_id):
         deployment = self.get_deployment(
             deployment_id, include=['outputs'])
-
-        def get_node_instances(node_id=None):
-            filters = self.create_filters_dict(deployment_id=deployment_id,
-                                               node_id=node_id)
-            return self.sm.get_node_instances(filters=filters)
-
-        def get_node_instance(node_instance_id):
-            return self.sm.get_node_instance(node_instance_id)
-
-        def get_node(node_id):
-            return self.sm.get_node(deployment_id, node_id)
+        storage = _DeploymentFunctionsStorage(self.sm, deployment_id)
 
         try:
             return functions.evaluate_outputs(
                 outputs_def=deployment.outputs,
-                get_node_instances_method=get_node_instances,
-                get_node_instance_method=get_node_instance,
-                get_node_method=get_node)
+                get_node_instances_method=storage.get_node_instances,
+                get_node_instance_method=storage.get_node_instance,
+                get_node_method=storage.get_node)
         except parser_exceptions.FunctionEvaluationError, e:
             raise manager_exceptions.DeploymentOutputsEvaluationError(str(e))
 
     def evaluate_functions(self, deployment_id, context, payload):
         self.get_deployment(deployment_id, include=['id'])
+        storage = _DeploymentFunctionsStorage(self.sm, deployment_id)
+        return self._evaluate_functions(storage, context, payload)
 
-        def get_node_instances(node_id=None):
-            filters = self.create_filters_dict(deployment_id=deployment_id,
-                                               node_id=node_id)
-            return self.sm.get_node_instances(filters=filters)
-
-        def get_node_instance(node_instance_id):
-            return self.sm.get_node_instance(node_instance_id)
-
-        def get_node(node_id):
-            return self.sm.get_node(deployment_id, node_id)
+    def evaluate_functions_batch(self, deployment_id, items):
+        """
+        Evaluates the payloads of many items against the same snapshot of
+        the deployment's nodes and node instances, each item independently
+        of the others.
+
+        :param items: a list of (context, payload) tuples.
+        :return: a list, in the same order as the given items, of either
+                 the evaluated payload or the ManagerException (e.g. a
+                 FunctionsEvaluationError, or a NotFoundError for a missing
+                 node instance) describing why it couldn't be evaluated.
+        """
+        self.get_deployment(deployment_id, include=['id'])
+        storage = _DeploymentFunctionsStorage(self.sm, deployment_id)
+        results = []
+        for context, payload in items:
+            try:
+                results.append(
+                    self._evaluate_functions(storage, context, payload))
+            except manager_exceptions.ManagerException, e:
+                results.append(e)
+        return results
 
+    @staticmethod
+    def _evaluate_functions(storage, context, payload):
         try:
             return functions.evaluate_functions(
                 payload=payload,
                 context=context,
-                get_node_instances_method=get_node_instances,
-                get_node_instance_method=get_node_instance,
-                get_node_method=get_node)
+                get_node_instances_method=storage.get_node_instances,
+                get_node_instance_method=storage.get_node_instance,
+                get_node_method=storage.get_node)
         except parser_exceptions.FunctionEvaluationError, e:
             raise manager_exceptions.FunctionsEvaluationError(str(e))
 
     def _create_deployment_nodes(self, blueprint_id, deployment_id, plan):
+        nodes = []
         for raw_node in plan['nodes']:
             num_instances = raw_node['instances']['deploy']
-            self.sm.put_node(models.DeploymentNode(
+            nodes.append(models.DeploymentNode(
                 id=raw_node['name'],
                 deployment_id=deployment_id,
                 blueprint_id=blueprint_id,
@@ -689,6 +912,7 @@ class BlueprintsManager(object):
                 plugins_to_install=raw_node.get('plugins_to_install'),
                 relationships=self._prepare_node_relationships(raw_node)
             ))
+        self.sm.put_nodes(nodes)
 
     @staticmethod
     def _merge_and_validate_execution_parameters(
@@ -764,12 +988,12 @@ class BlueprintsManager(object):
 
     def _verify_deployment_environment_created_successfully(self,
                                                             deployment_id):
-        deployment_id_filter = self.create_filters_dict(
-            deployment_id=deployment_id)
+        env_creation_filter = self.create_filters_dict(
+            deployment_id=[deployment_id],
+            workflow_id=['create_deployment_environment'])
         env_creation = next(
-            (execution for execution in
-             self.sm.executions_list(filters=deployment_id_filter)
-             if execution.workflow_id == 'create_deployment_environment'),
+            iter(self.sm.executions_list(filters=env_creation_filter,
+                                         include=['id', 'status'])),
             None)
 
         if not env_creation:
@@ -835,7 +1059,8 @@ class BlueprintsManager(object):
             deployment, wf_id, deployment_env_creation_task_name, kwargs)
 
     def _delete_deployment_environment(self, deployment_id):
-        deployment = self.sm.get_deployment(deployment_id)
+        deployment = self.sm.get_deployment(deployment_id,
+                                            include=['id', 'blueprint_id'])
         wf_id = 'delete_deployment_environment'
         deployment_env_deletion_task_name = \
             'cloudify_system_workflows.deployment_environment.delete'
@@ -847,21 +1072,15 @@ class BlueprintsManager(object):
                                      transient_workers_config):
         is_transient_workers_enabled = transient_workers_config['enabled']
 
-        def _get_running_executions(deployment_id=None, include_system=True):
-            deplyment_id_filter = self.create_filters_dict(
-                deployment_id=deployment_id)
-            executions = self.executions_list(
-                filters=deplyment_id_filter,
-                is_include_system_workflows=include_system)
-            running = [
-                e.id for e in executions if
-                self.sm.get_execution(e.id).status
-                not in models.Execution.END_STATES]
-            return running
-
         # validate no execution is currently in progress
         if not force:
-            running = _get_running_executions(deployment_id)
+            running_filter = self.create_filters_dict(
+                deployment_id=[deployment_id],
+                status=models.Execution.ACTIVE_STATES)
+            running = [e.id for e in self.executions_list(
+                filters=running_filter,
+                is_include_system_workflows=True,
+                include=['id'])]
             if len(running) > 0:
                 raise manager_exceptions.ExistingRunningExecutionError(
                     'The following executions are currently running for this '
@@ -879,19 +1098,21 @@ class BlueprintsManager(object):
 
             if global_parallel_executions_limit != \
                     LIMITLESS_GLOBAL_PARALLEL_EXECUTIONS_VALUE:
-                running = _get_running_executions()
-                if len(running) >= global_parallel_executions_limit:
+                running_count = self.sm.executions_count(
+                    filters={'status': models.Execution.ACTIVE_STATES})
+                if running_count >= global_parallel_executions_limit:
                     raise manager_exceptions. \
                         GlobalParallelRunningExecutionsLimitReachedError(
                             'New workflows may not be executed at this time,'
                             'because global parallel running executions limit '
                             'has been reached ({0} running executions; '
                             'global limit {1}). Please try again soon'
-                            .format(len(running),
+                            .format(running_count,
                                     global_parallel_executions_limit))
 
     def _get_transient_deployment_workers_mode_config(self):
-        provider_context = self.sm.get_provider_context().context
+        provider_context = \
+            provider_context_cache.get_provider_context(self.sm).context
         transient_workers_config = provider_context['cloudify'].get(
             'transient_deployment_workers_mode', {})
 
@@ -925,17 +1146,18 @@ class BlueprintsManager(object):
     def _get_parser_context(self):
         if not hasattr(current_app, 'parser_context'):
             self._update_parser_context_in_app(
-                self.sm.get_provider_context().context)
+                provider_context_cache.get_provider_context(self.sm).context)
         return current_app.parser_context
 
     def _update_parser_context_in_app(self, context):
         raw_parser_context = self._extract_parser_context(context)
-        resolver = dsl_parser_utils.create_import_resolver(
+        resolver = import_resolver_cache.create_import_resolver(
             raw_parser_context['resolver_section'])
         validate_definitions_version = raw_parser_context[
             'validate_definitions_version']
         current_app.parser_context = {
             'resolver': resolver,
+            'resolver_section': raw_parser_context['resolver_section'],
             'validate_version': validate_definitions_version
         }
 
@@ -944,6 +1166,7 @@ class BlueprintsManager(object):
             self.sm.update_provider_context(provider_context)
         else:
             self.sm.put_provider_context(provider_context)
+        provider_context_cache.invalidate()
         self._update_parser_context_in_app(provider_context.context)
 
 
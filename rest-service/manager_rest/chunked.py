@@ -17,8 +17,9 @@
 
 # Chunked is handled by gunicorn
 def decode(input_stream, buffer_size=8192):
+    # a short read doesn't mean the body has ended - only an empty one does
     while True:
         read_buffer = input_stream.read(buffer_size)
-        yield read_buffer
-        if len(read_buffer) < buffer_size:
+        if not read_buffer:
             return
+        yield read_buffer
@@ -20,6 +20,19 @@ class Config(object):
     def __init__(self):
         self._db_address = 'localhost'
         self._db_port = 9200
+        self._db_connection_pool = {}
+        self._db_refresh_policy = {}
+        self._db_sqlite_path = None
+        self._storage_manager_module = None
+        self._file_storage = {}
+        self._provider_context_cache_ttl = 0
+        self._blueprint_plan_cache = {}
+        self._deployment_outputs_cache = {}
+        self._blueprint_upload_workers = 4
+        self._blueprint_upload_timeout = 3600
+        self._blueprint_parsing = {}
+        self._import_resolver_cache = {}
+        self._plugin_zips = {}
         self._amqp_address = 'localhost'
         self.amqp_username = 'guest'
         self.amqp_password = 'guest'
@@ -30,6 +43,7 @@ class Config(object):
         self._file_server_blueprints_folder = None
         self._file_server_uploaded_blueprints_folder = None
         self._file_server_resources_uri = None
+        self._file_server_max_upload_size_MB = None
         self._rest_service_log_level = None
         self._rest_service_log_path = None
         self._rest_service_log_file_size_MB = None
@@ -63,6 +77,110 @@ class Config(object):
     def db_port(self, value):
         self._db_port = value
 
+    @property
+    def db_connection_pool(self):
+        return self._db_connection_pool
+
+    @db_connection_pool.setter
+    def db_connection_pool(self, value):
+        self._db_connection_pool = value
+
+    @property
+    def db_refresh_policy(self):
+        return self._db_refresh_policy
+
+    @db_refresh_policy.setter
+    def db_refresh_policy(self, value):
+        self._db_refresh_policy = value
+
+    @property
+    def db_sqlite_path(self):
+        return self._db_sqlite_path
+
+    @db_sqlite_path.setter
+    def db_sqlite_path(self, value):
+        self._db_sqlite_path = value
+
+    @property
+    def storage_manager_module(self):
+        return self._storage_manager_module
+
+    @storage_manager_module.setter
+    def storage_manager_module(self, value):
+        self._storage_manager_module = value
+
+    @property
+    def file_storage(self):
+        return self._file_storage
+
+    @file_storage.setter
+    def file_storage(self, value):
+        self._file_storage = value
+
+    @property
+    def provider_context_cache_ttl(self):
+        return self._provider_context_cache_ttl
+
+    @provider_context_cache_ttl.setter
+    def provider_context_cache_ttl(self, value):
+        self._provider_context_cache_ttl = value
+
+    @property
+    def blueprint_plan_cache(self):
+        return self._blueprint_plan_cache
+
+    @blueprint_plan_cache.setter
+    def blueprint_plan_cache(self, value):
+        self._blueprint_plan_cache = value
+
+    @property
+    def deployment_outputs_cache(self):
+        return self._deployment_outputs_cache
+
+    @deployment_outputs_cache.setter
+    def deployment_outputs_cache(self, value):
+        self._deployment_outputs_cache = value
+
+    @property
+    def blueprint_upload_workers(self):
+        return self._blueprint_upload_workers
+
+    @blueprint_upload_workers.setter
+    def blueprint_upload_workers(self, value):
+        self._blueprint_upload_workers = value
+
+    @property
+    def blueprint_upload_timeout(self):
+        return self._blueprint_upload_timeout
+
+    @blueprint_upload_timeout.setter
+    def blueprint_upload_timeout(self, value):
+        self._blueprint_upload_timeout = value
+
+    @property
+    def blueprint_parsing(self):
+        return self._blueprint_parsing
+
+    @blueprint_parsing.setter
+    def blueprint_parsing(self, value):
+        self._blueprint_parsing = value
+
+    @property
+    def import_resolver_cache(self):
+        return self._import_resolver_cache
+
+    @import_resolver_cache.setter
+    def import_resolver_cache(self, value):
+        self._import_resolver_cache = value
+
+    @property
+    def plugin_zips(self):
+        return self._plugin_zips
+
+    @plugin_zips.setter
+    def plugin_zips(self, value):
+        self._plugin_zips = value
+
     @property
     def amqp_address(self):
         return self._amqp_address
@@ -111,6 +229,14 @@ class Config(object):
     def file_server_resources_uri(self, value):
         self._file_server_resources_uri = value
 
+    @property
+    def file_server_max_upload_size_MB(self):
+        return self._file_server_max_upload_size_MB
+
+    @file_server_max_upload_size_MB.setter
+    def file_server_max_upload_size_MB(self, value):
+        self._file_server_max_upload_size_MB = value
+
     @property
     def rest_service_log_path(self):
         return self._rest_service_log_path
@@ -46,6 +46,7 @@ def setup_resources(api):
         'ProviderContext': 'provider/context',
         'Version': 'version',
         'EvaluateFunctions': 'evaluate/functions',
+        'EvaluateFunctionsBatch': 'evaluate/functions/batch',
         'Tokens': 'tokens',
         'Plugins': 'plugins',
         'PluginsId': 'plugins/<string:plugin_id>',
@@ -0,0 +1,254 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import socket
+import threading
+import urllib
+
+from urllib3.connection import HTTPConnection
+from elasticsearch import Elasticsearch
+from elasticsearch import exceptions as es_exceptions
+from elasticsearch.connection import Urllib3HttpConnection
+
+from manager_rest import config
+
+DEFAULT_CONNECTION_POOL_SETTINGS = {
+    'maxsize': 25,
+    'block': False,
+    'keepalive': True,
+    'timeout': 30,
+    'max_retries': 3,
+    'retry_on_timeout': False,
+    'sniff_on_start': False,
+    'sniff_on_connection_fail': False,
+    'sniffer_timeout': None
+}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class PooledHttpConnection(Urllib3HttpConnection):
+    """
+    urllib3 based elasticsearch connection which keeps usage statistics of
+    its underlying connection pool.
+    """
+
+    def __init__(self, block=False, keepalive=True, **kwargs):
+        super(PooledHttpConnection, self).__init__(**kwargs)
+        self.pool.block = block
+        if keepalive:
+            # extending rather than replacing urllib3's default socket
+            # options, which disable Nagle's algorithm
+            socket_options = self.pool.conn_kw.get(
+                'socket_options', HTTPConnection.default_socket_options)
+            self.pool.conn_kw['socket_options'] = list(socket_options) + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        self._stats_lock = threading.Lock()
+        self.in_use = 0
+        self.errors = 0
+
+    def perform_request(self, *args, **kwargs):
+        with self._stats_lock:
+            self.in_use += 1
+        try:
+            return super(PooledHttpConnection, self).perform_request(
+                *args, **kwargs)
+        except es_exceptions.ConnectionError:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._stats_lock:
+                self.in_use -= 1
+
+    def stream_request(self, method, url, body=None, headers=None):
+        """
+        Performs a request whose response body is streamed as is, possibly
+        compressed, rather than read and decoded.
+
+        :return: a (status, headers, body) tuple, where body is a
+                 StreamedBody over the raw response body chunks.
+        :raises elasticsearch.exceptions.TransportError: for error responses,
+                the same as perform_request.
+        """
+        url = self.url_prefix + url
+        request_headers = dict(self.headers)
+        request_headers.update(headers or {})
+        with self._stats_lock:
+            self.in_use += 1
+        try:
+            response = self.pool.urlopen(method, url, body,
+                                         retries=False,
+                                         headers=request_headers,
+                                         preload_content=False,
+                                         decode_content=False)
+        except Exception as e:
+            with self._stats_lock:
+                self.in_use -= 1
+                self.errors += 1
+            raise es_exceptions.ConnectionError('N/A', str(e), e)
+        streamed_body = StreamedBody(self, response)
+        if not 200 <= response.status < 300:
+            raw_data = streamed_body.read()
+            self._raise_error(response.status, raw_data.decode('utf-8'))
+        return response.status, dict(response.getheaders()), streamed_body
+
+    def _release(self):
+        with self._stats_lock:
+            self.in_use -= 1
+
+    def stats(self):
+        idle = len([conn for conn in list(self.pool.pool.queue) if conn])
+        return {
+            'in_use': self.in_use,
+            'idle': idle,
+            'created': self.pool.num_connections,
+            'errors': self.errors,
+            'maxsize': self.pool.pool.maxsize
+        }
+
+
+class StreamedBody(object):
+    """
+    Iterates over the raw chunks of a streamed response body, and releases
+    the connection once the body is exhausted or closed.
+
+    A connection whose response body wasn't read to its end (e.g. when the
+    client disconnected mid-stream) is closed before being released, as
+    the unread bytes would otherwise be read as the response to the next
+    request made over it.
+    """
+
+    def __init__(self, connection, response):
+        self._connection = connection
+        self._response = response
+        self._exhausted = False
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._response.stream(STREAM_CHUNK_SIZE,
+                                               decode_content=False):
+                yield chunk
+            self._exhausted = True
+        finally:
+            self.close()
+
+    def read(self):
+        """
+        Reads the whole (remaining) body, decoded, and releases the
+        connection.
+        """
+        try:
+            data = self._response.read(decode_content=True)
+            self._exhausted = True
+            return data
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            if not self._exhausted:
+                # the pool reconnects a closed connection on its next use
+                self._response.close()
+            self._response.release_conn()
+            self._connection._release()
+
+
+def _connection_pool_settings():
+    settings = dict(DEFAULT_CONNECTION_POOL_SETTINGS)
+    settings.update(config.instance().db_connection_pool or {})
+    return settings
+
+
+def _create_client(host, port):
+    settings = _connection_pool_settings()
+    return Elasticsearch(
+        hosts=[{'host': host, 'port': port}],
+        connection_class=PooledHttpConnection,
+        maxsize=settings['maxsize'],
+        block=settings['block'],
+        keepalive=settings['keepalive'],
+        timeout=settings['timeout'],
+        max_retries=settings['max_retries'],
+        retry_on_timeout=settings['retry_on_timeout'],
+        sniff_on_start=settings['sniff_on_start'],
+        sniff_on_connection_fail=settings['sniff_on_connection_fail'],
+        sniffer_timeout=settings['sniffer_timeout'])
+
+
+def get_client(host=None, port=None):
+    """
+    Returns the process-wide elasticsearch client for the given host and port
+    (defaulting to the configured storage address), creating it on first
+    use. The client is thread safe and is shared by all requests served by
+    the current process; a forked process gets its own client.
+    """
+    host = host or config.instance().db_address
+    port = port or config.instance().db_port
+    key = (host, port, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _create_client(host, port)
+                _clients[key] = client
+    return client
+
+
+def stream_search(index, body=None, doc_type=None, headers=None):
+    """
+    Searches the given index using a connection of the process-wide client,
+    streaming the raw search response rather than decoding it.
+
+    :param body: the serialized search request body.
+    :param headers: additional request headers, e.g. `Accept-Encoding`.
+    :return: a (status, headers, body) tuple, see
+             PooledHttpConnection.stream_request.
+    """
+    path = '/'.join(urllib.quote(part, safe=',*')
+                    for part in (index, doc_type) if part)
+    connection = get_client().transport.get_connection()
+    return connection.stream_request('POST' if body else 'GET',
+                                     '/{0}/_search'.format(path),
+                                     body=body,
+                                     headers=headers)
+
+
+def reset():
+    with _clients_lock:
+        _clients.clear()
+
+
+def pool_stats():
+    """
+    :return: connection pool statistics aggregated over all the elasticsearch
+             clients of the current process.
+    """
+    stats = {'in_use': 0, 'idle': 0, 'created': 0, 'errors': 0, 'maxsize': 0}
+    for (_, _, pid), client in _clients.items():
+        if pid != os.getpid():
+            continue
+        pool = client.transport.connection_pool
+        for connection, _ in pool.connection_opts:
+            for key, value in connection.stats().iteritems():
+                stats[key] += value
+    return stats
@@ -14,12 +14,16 @@
 #  * limitations under the License.
 
 
+import threading
+from contextlib import contextmanager
+
 import elasticsearch.exceptions
-from elasticsearch import Elasticsearch
 
 from manager_rest import config
+from manager_rest import es_client
 from manager_rest import manager_exceptions
-from manager_rest.models import (BlueprintState,
+from manager_rest.models import (ListResult,
+                                 BlueprintState,
                                  Deployment,
                                  DeploymentModification,
                                  Execution,
@@ -38,8 +42,39 @@ DEPLOYMENT_MODIFICATION_TYPE = 'deployment_modification'
 EXECUTION_TYPE = 'execution'
 PROVIDER_CONTEXT_TYPE = 'provider_context'
 PROVIDER_CONTEXT_ID = 'CONTEXT'
+# an empty document per deployment, whose version is bumped whenever any of
+# the deployment's node instances changes
+DEPLOYMENT_CHANGES_TYPE = 'deployment_changes'
 
 DEFAULT_SEARCH_SIZE = 10000
+BULK_CHUNK_SIZE = 1000
+DEFAULT_SCROLL_SIZE = 500
+SCROLL_KEEPALIVE = '1m'
+
+MODEL_DOC_TYPES = {
+    BlueprintState: BLUEPRINT_TYPE,
+    Deployment: DEPLOYMENT_TYPE,
+    DeploymentModification: DEPLOYMENT_MODIFICATION_TYPE,
+    Execution: EXECUTION_TYPE,
+    DeploymentNode: NODE_TYPE,
+    DeploymentNodeInstance: NODE_INSTANCE_TYPE,
+    Plugin: PLUGIN_TYPE
+}
+
+# refresh policies which may be set per document type:
+# immediate - the index is refreshed as part of every write, so the write is
+#             visible to searches as soon as the write returns.
+# batched - writes don't refresh the index; a single refresh is issued once
+#           the current request (or batch of writes) is over.
+# deferred - writes don't refresh the index at all and become visible to
+#            searches on the next periodic index refresh.
+# Regardless of the policy, a document is always visible to get-by-id calls
+# (which are realtime in elasticsearch) as soon as its write returns.
+REFRESH_IMMEDIATE = 'immediate'
+REFRESH_BATCHED = 'batched'
+REFRESH_DEFERRED = 'deferred'
+REFRESH_POLICIES = (REFRESH_IMMEDIATE, REFRESH_BATCHED, REFRESH_DEFERRED)
+DEFAULT_REFRESH_POLICY_KEY = 'default'
 
 MUTATE_PARAMS = {
     'refresh': True
@@ -48,14 +83,58 @@ MUTATE_PARAMS = {
 
 class ESStorageManager(object):
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, refresh_policy=None):
         self.es_host = host
         self.es_port = port
+        self._refresh_policy = self._verify_refresh_policy(
+            refresh_policy or {})
+        self._pending_refresh = threading.local()
+
+    @staticmethod
+    def _verify_refresh_policy(refresh_policy):
+        illegal = [policy for policy in refresh_policy.itervalues()
+                   if policy not in REFRESH_POLICIES]
+        if illegal:
+            raise ValueError('Illegal storage refresh policies: {0} - legal '
+                             'policies are: {1}'.format(illegal,
+                                                        REFRESH_POLICIES))
+        return refresh_policy
+
+    def _get_refresh_policy(self, doc_type):
+        return self._refresh_policy.get(
+            doc_type,
+            self._refresh_policy.get(DEFAULT_REFRESH_POLICY_KEY,
+                                     REFRESH_IMMEDIATE))
+
+    def _mutate_params(self, doc_type):
+        policy = self._get_refresh_policy(doc_type)
+        if policy == REFRESH_IMMEDIATE:
+            return MUTATE_PARAMS
+        if policy == REFRESH_BATCHED:
+            self._pending_refresh.value = True
+        return {}
+
+    def searchable_on_write(self, model_class):
+        """
+        :return: whether writes of the given model are visible to searches
+                 as soon as they return, i.e. whether its refresh policy is
+                 immediate.
+        """
+        return self._get_refresh_policy(
+            MODEL_DOC_TYPES[model_class]) == REFRESH_IMMEDIATE
+
+    def refresh_pending(self):
+        """
+        Refreshes the storage index if writes with a batched refresh policy
+        were made by the current thread since the last refresh.
+        """
+        if getattr(self._pending_refresh, 'value', False):
+            self._pending_refresh.value = False
+            self._connection.indices.refresh(index=STORAGE_INDEX_NAME)
 
     @property
     def _connection(self):
-        return Elasticsearch(hosts=[{'host': self.es_host,
-                                     'port': self.es_port}])
+        return es_client.get_client(self.es_host, self.es_port)
 
     def _list_docs(self, doc_type, model_class, body=None, fields=None):
         include = list(fields) if fields else True
@@ -63,7 +142,12 @@ class ESStorageManager(object):
                                                 doc_type=doc_type,
                                                 body=body,
                                                 _source=include)
-        docs = map(lambda hit: hit['_source'], search_result['hits']['hits'])
+        items = self._deserialize_hits(doc_type, model_class,
+                                       search_result['hits']['hits'])
+        return ListResult(items, search_result['hits']['total'])
+
+    def _deserialize_hits(self, doc_type, model_class, hits):
+        docs = map(lambda hit: hit['_source'], hits)
 
         # ES doesn't return _version if using its search API.
         if doc_type == NODE_INSTANCE_TYPE:
@@ -72,6 +156,85 @@ class ESStorageManager(object):
         return [self._fill_missing_fields_and_deserialize(doc, model_class)
                 for doc in docs]
 
+    def scroll_list(self, model_class, include=None, filters=None,
+                    cursor=None, size=DEFAULT_SCROLL_SIZE):
+        """
+        Lists items page by page, using an elasticsearch scroll as the
+        cursor. Unlike the regular list methods, the number of items which
+        may be listed this way is not limited.
+
+        :param model_class: the model class of the listed items.
+        :param include: fields to include in the listed items.
+        :param filters: filters for the listed items.
+        :param cursor: a cursor returned by a previous call, or `None` to
+                       start a new listing. When a cursor is passed, the
+                       include, filters and size of the call which started
+                       the listing apply.
+        :param size: the number of items in each page.
+        :return: a tuple of the items in the page and the cursor for the
+                 next page, which is `None` once all items have been listed.
+        """
+        doc_type = MODEL_DOC_TYPES[model_class]
+        if cursor:
+            result = self._scroll(cursor)
+        else:
+            body = self._build_request_body(filters=filters,
+                                            skip_size=True)
+            body['size'] = size
+            result = self._connection.search(
+                index=STORAGE_INDEX_NAME,
+                doc_type=doc_type,
+                body=body,
+                _source=list(include) if include else True,
+                scroll=SCROLL_KEEPALIVE)
+
+        hits = result['hits']['hits']
+        next_cursor = result.get('_scroll_id')
+        if not hits or (not cursor and len(hits) < size):
+            self._clear_scroll(next_cursor)
+            next_cursor = None
+        return self._deserialize_hits(doc_type, model_class, hits), \
+            next_cursor
+
+    def _scroll(self, cursor):
+        try:
+            return self._connection.scroll(scroll_id=cursor,
+                                           scroll=SCROLL_KEEPALIVE)
+        except (elasticsearch.exceptions.NotFoundError,
+                elasticsearch.exceptions.RequestError):
+            # an expired scroll is not found, and a malformed scroll id is a
+            # bad request. other errors are elasticsearch's own failures
+            raise manager_exceptions.BadParametersError(
+                'Cursor {0} has expired or is invalid'.format(cursor))
+
+    def iter_list(self, model_class, include=None, filters=None):
+        """
+        Iterates over all the items matching the given filters, fetching them
+        from storage a page at a time.
+        """
+        items, cursor = self.scroll_list(model_class,
+                                         include=include,
+                                         filters=filters)
+        try:
+            while True:
+                for item in items:
+                    yield item
+                if cursor is None:
+                    return
+                items, cursor = self.scroll_list(model_class, cursor=cursor)
+        finally:
+            # the iteration may be stopped before the scroll is exhausted
+            self._clear_scroll(cursor)
+
+    def _clear_scroll(self, scroll_id):
+        if not scroll_id:
+            return
+        try:
+            self._connection.clear_scroll(scroll_id=scroll_id)
+        except elasticsearch.exceptions.NotFoundError:
+            # the scroll has already expired
+            pass
+
     def _get_doc(self, doc_type, doc_id, fields=None):
         try:
             if fields:
@@ -107,16 +270,74 @@ class ESStorageManager(object):
             self._connection.create(index=STORAGE_INDEX_NAME,
                                     doc_type=doc_type, id=doc_id,
                                     body=value,
-                                    **MUTATE_PARAMS)
+                                    **self._mutate_params(doc_type))
         except elasticsearch.exceptions.ConflictError:
             raise manager_exceptions.ConflictError(
                 '{0} {1} already exists'.format(doc_type, doc_id))
 
+    def _bulk(self, doc_type, operations):
+        """
+        Performs the given operations using the elasticsearch bulk API, in
+        chunks of up to BULK_CHUNK_SIZE operations per request. The index is
+        refreshed (according to the refresh policy) only once, along with the
+        last chunk.
+
+        :param doc_type: The document type of all operations.
+        :param operations: A list of (action, metadata, body) tuples, where
+                           action is one of `create`, `index`, `update` or
+                           `delete`, metadata is a dictionary containing
+                           (at least) the document `_id` and body is the
+                           document (None for `delete`).
+        :return: A list of the bulk response items (dictionaries containing
+                 `_id`, `status` and, on success, `_version` or, on failure,
+                 `error`), in the same order as the operations.
+        """
+        results = []
+        mutate_params = self._mutate_params(doc_type)
+        for start in range(0, len(operations), BULK_CHUNK_SIZE):
+            chunk = operations[start:start + BULK_CHUNK_SIZE]
+            body = []
+            for action, metadata, doc in chunk:
+                body.append({action: metadata})
+                if doc is not None:
+                    body.append(doc)
+            is_last_chunk = start + BULK_CHUNK_SIZE >= len(operations)
+            response = self._connection.bulk(
+                body=body,
+                index=STORAGE_INDEX_NAME,
+                doc_type=doc_type,
+                **(mutate_params if is_last_chunk else {}))
+            results.extend(item.values()[0] for item in response['items'])
+        return results
+
+    def _put_docs_if_not_exist(self, doc_type, docs):
+        """
+        Stores the given documents using a single bulk request. Documents
+        which don't already exist are stored even if others already exist.
+
+        :param docs: A list of (doc_id, value) tuples.
+        :raises manager_exceptions.ConflictError: if any of the documents
+                already exists.
+        """
+        if not docs:
+            return
+        results = self._bulk(doc_type, [('create', {'_id': doc_id}, value)
+                                        for doc_id, value in docs])
+        conflicts = [item['_id'] for item in results if item['status'] == 409]
+        failures = [(item['_id'], item.get('error')) for item in results
+                    if item['status'] >= 300 and item['status'] != 409]
+        if failures:
+            raise RuntimeError('Failed storing {0} documents: {1}'
+                               .format(doc_type, failures))
+        if conflicts:
+            raise manager_exceptions.ConflictError(
+                '{0} {1} already exist'.format(doc_type, conflicts))
+
     def _delete_doc(self, doc_type, doc_id, model_class, id_field='id'):
         try:
             res = self._connection.delete(STORAGE_INDEX_NAME, doc_type,
                                           doc_id,
-                                          **MUTATE_PARAMS)
+                                          **self._mutate_params(doc_type))
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "{0} {1} not found".format(doc_type, doc_id))
@@ -151,12 +372,13 @@ class ESStorageManager(object):
         influence the score.
         2. Based on the `pagination` param, it sets the `size` and `from`
         parameters of the built query to make use of elasticsearch paging
-        capabilities.
+        capabilities, and the `sort` parameter to order the results.
 
         :param filters: A dictionary containing filter keys and their expected
                         value.
-        :param pagination: A dictionary with optional `page_size` and `offset`
-                           keys.
+        :param pagination: A dictionary with optional `page_size`, `offset`
+                           and `sort` keys, where `sort` is a list of
+                           (field, order) tuples.
         :param skip_size: If set to `True`, will not add `size` to the
                           body result.
         :return: An elasticsearch Query DSL body.
@@ -168,6 +390,9 @@ class ESStorageManager(object):
                 body['size'] = pagination.get('page_size', DEFAULT_SEARCH_SIZE)
             if 'offset' in pagination:
                 body['from'] = pagination['offset']
+            if pagination.get('sort'):
+                body['sort'] = [{field: {'order': order}}
+                                for field, order in pagination['sort']]
         elif not skip_size:
             body['size'] = DEFAULT_SEARCH_SIZE
         if filters:
@@ -206,6 +431,12 @@ class ESStorageManager(object):
                                     filters=filters,
                                     include=include)
 
+    def executions_count(self, filters=None):
+        body = self._build_request_body(filters=filters, skip_size=True)
+        return self._connection.count(index=STORAGE_INDEX_NAME,
+                                      doc_type=EXECUTION_TYPE,
+                                      body=body)['count']
+
     def get_blueprint_deployments(self, blueprint_id, include=None):
         deployment_filters = {'blueprint_id': blueprint_id}
         return self._get_items_list(DEPLOYMENT_TYPE,
@@ -217,9 +448,35 @@ class ESStorageManager(object):
         doc = self._get_doc(NODE_INSTANCE_TYPE,
                             node_instance_id,
                             fields=include)
-        node = DeploymentNodeInstance(version=doc['_version'],
-                                      **doc['_source'])
-        return node
+        doc['_source']['version'] = doc['_version']
+        return self._fill_missing_fields_and_deserialize(
+            doc['_source'], DeploymentNodeInstance)
+
+    def get_node_instances_by_ids(self, node_instance_ids, include=None):
+        """
+        Gets many node instances, along with their versions, using a single
+        multi-get request.
+
+        :raises manager_exceptions.NotFoundError: if any of the node
+                instances doesn't exist.
+        """
+        if not node_instance_ids:
+            return []
+        params = {'_source': list(include)} if include else {}
+        docs = self._connection.mget(index=STORAGE_INDEX_NAME,
+                                     doc_type=NODE_INSTANCE_TYPE,
+                                     body={'ids': list(node_instance_ids)},
+                                     **params)['docs']
+        missing = [doc['_id'] for doc in docs if not doc['found']]
+        if missing:
+            raise manager_exceptions.NotFoundError(
+                'Node instances {0} not found'.format(missing))
+        node_instances = []
+        for doc in docs:
+            doc['_source']['version'] = doc['_version']
+            node_instances.append(self._fill_missing_fields_and_deserialize(
+                doc['_source'], DeploymentNodeInstance))
+        return node_instances
 
     def get_node(self, deployment_id, node_id, include=None):
         storage_node_id = self._storage_node_id(deployment_id, node_id)
@@ -303,6 +560,12 @@ class ESStorageManager(object):
         doc_data = node.to_dict()
         self._put_doc_if_not_exists(NODE_TYPE, storage_node_id, doc_data)
 
+    def put_nodes(self, nodes):
+        self._put_docs_if_not_exist(
+            NODE_TYPE,
+            [(self._storage_node_id(node.deployment_id, node.id),
+              node.to_dict()) for node in nodes])
+
     def put_node_instance(self, node_instance):
         node_instance_id = node_instance.id
         doc_data = node_instance.to_dict()
@@ -310,8 +573,23 @@ class ESStorageManager(object):
         self._put_doc_if_not_exists(NODE_INSTANCE_TYPE,
                                     str(node_instance_id),
                                     doc_data)
+        self._bump_deployment_changes([node_instance.deployment_id])
         return 1
 
+    def put_node_instances(self, node_instances):
+        docs = []
+        for node_instance in node_instances:
+            doc_data = node_instance.to_dict()
+            del(doc_data['version'])
+            docs.append((str(node_instance.id), doc_data))
+        try:
+            self._put_docs_if_not_exist(NODE_INSTANCE_TYPE, docs)
+        finally:
+            # some of the node instances may be stored even on failure
+            self._bump_deployment_changes(
+                [node_instance.deployment_id
+                 for node_instance in node_instances])
+
     def delete_blueprint(self, blueprint_id):
         return self._delete_doc(BLUEPRINT_TYPE, blueprint_id,
                                 BlueprintState)
@@ -319,6 +597,22 @@ class ESStorageManager(object):
     def delete_plugin(self, plugin_id):
         return self._delete_doc(PLUGIN_TYPE, plugin_id, Plugin)
 
+    def update_blueprint(self, blueprint_id, blueprint):
+        update_doc_data = dict(
+            (field, value) for field, value in blueprint.to_dict().iteritems()
+            if value is not None and field != 'id')
+        update_doc = {'doc': update_doc_data}
+
+        try:
+            self._connection.update(index=STORAGE_INDEX_NAME,
+                                    doc_type=BLUEPRINT_TYPE,
+                                    id=str(blueprint_id),
+                                    body=update_doc,
+                                    **self._mutate_params(BLUEPRINT_TYPE))
+        except elasticsearch.exceptions.NotFoundError:
+            raise manager_exceptions.NotFoundError(
+                "Blueprint {0} not found".format(blueprint_id))
+
     def update_execution_status(self, execution_id, status, error):
         update_doc_data = {'status': status,
                            'error': error}
@@ -329,7 +623,7 @@ class ESStorageManager(object):
                                     doc_type=EXECUTION_TYPE,
                                     id=str(execution_id),
                                     body=update_doc,
-                                    **MUTATE_PARAMS)
+                                    **self._mutate_params(EXECUTION_TYPE))
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "Execution {0} not found".format(execution_id))
@@ -341,7 +635,8 @@ class ESStorageManager(object):
                                     doc_type=PROVIDER_CONTEXT_TYPE,
                                     id=PROVIDER_CONTEXT_ID,
                                     body=doc_data,
-                                    **MUTATE_PARAMS)
+                                    **self._mutate_params(
+                                        PROVIDER_CONTEXT_TYPE))
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 'Provider Context not found')
@@ -354,6 +649,9 @@ class ESStorageManager(object):
         self._delete_doc_by_query(NODE_INSTANCE_TYPE, query)
         self._delete_doc_by_query(NODE_TYPE, query)
         self._delete_doc_by_query(DEPLOYMENT_MODIFICATION_TYPE, query)
+        # the counter is bumped rather than deleted, so that it never
+        # repeats for a deployment re-created with the same id
+        self._bump_deployment_changes([deployment_id])
         return self._delete_doc(DEPLOYMENT_TYPE, deployment_id, Deployment)
 
     def delete_execution(self, execution_id):
@@ -363,9 +661,39 @@ class ESStorageManager(object):
         return self._delete_doc(NODE_TYPE, node_id, DeploymentNode)
 
     def delete_node_instance(self, node_instance_id):
-        return self._delete_doc(NODE_INSTANCE_TYPE,
-                                node_instance_id,
-                                DeploymentNodeInstance)
+        deployment_ids = self._node_instances_deployment_ids(
+            [node_instance_id])
+        deleted = self._delete_doc(NODE_INSTANCE_TYPE,
+                                   node_instance_id,
+                                   DeploymentNodeInstance)
+        self._bump_deployment_changes(deployment_ids)
+        return deleted
+
+    def delete_node_instances(self, node_instance_ids):
+        """
+        Deletes many node instances using a single bulk request. Node
+        instances which exist are deleted even if others don't.
+
+        :raises manager_exceptions.NotFoundError: if any of the node
+                instances doesn't exist.
+        """
+        if not node_instance_ids:
+            return
+        deployment_ids = self._node_instances_deployment_ids(
+            node_instance_ids)
+        results = self._bulk(NODE_INSTANCE_TYPE,
+                             [('delete', {'_id': node_instance_id}, None)
+                              for node_instance_id in node_instance_ids])
+        self._bump_deployment_changes(deployment_ids)
+        missing = [item['_id'] for item in results if item['status'] == 404]
+        failures = [(item['_id'], item.get('error')) for item in results
+                    if item['status'] >= 300 and item['status'] != 404]
+        if failures:
+            raise RuntimeError('Failed deleting {0} documents: {1}'
+                               .format(NODE_INSTANCE_TYPE, failures))
+        if missing:
+            raise manager_exceptions.NotFoundError(
+                'Node instances {0} not found'.format(missing))
 
     def update_node(self, deployment_id, node_id,
                     number_of_instances=None,
@@ -383,41 +711,141 @@ class ESStorageManager(object):
                                     doc_type=NODE_TYPE,
                                     id=storage_node_id,
                                     body=update_doc,
-                                    **MUTATE_PARAMS)
+                                    **self._mutate_params(NODE_TYPE))
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "Node {0} not found".format(node_id))
 
     def update_node_instance(self, node):
-        new_state = node.state
-        new_runtime_props = node.runtime_properties
-        new_relationships = node.relationships
-
-        current = self.get_node_instance(node.id)
-        # Validate version - this is not 100% safe since elasticsearch
-        # update doesn't accept the version field.
-        if node.version != 0 and current.version != node.version:
-            raise manager_exceptions.ConflictError(
-                'Node instance update conflict [current_version={0}, updated_'
-                'version={1}]'.format(current.version, node.version))
-
-        if new_state is not None:
-            current.state = new_state
-
-        if new_runtime_props is not None:
-            current.runtime_properties = new_runtime_props
+        """
+        Updates the given fields of a node instance in a single request,
+        using the elasticsearch document version to reject the update if the
+        node instance has changed since it was read. A version of 0 skips
+        the check.
 
-        if new_relationships is not None:
-            current.relationships = new_relationships
+        :return: the updated node instance.
+        """
+        changes = {}
+        if node.state is not None:
+            changes['state'] = node.state
+        if node.runtime_properties is not None:
+            changes['runtime_properties'] = node.runtime_properties
+        if node.relationships is not None:
+            changes['relationships'] = node.relationships
+
+        with self._node_instance_update_errors(node.id, node.version):
+            result = self._connection.update(
+                index=STORAGE_INDEX_NAME,
+                doc_type=NODE_INSTANCE_TYPE,
+                id=node.id,
+                body={'doc': changes},
+                fields='_source',
+                **self._version_params(NODE_INSTANCE_TYPE, node.version))
+        updated = result['get']['_source']
+
+        # partial updates merge objects recursively, so runtime properties
+        # which were removed by this update are still there - in that case
+        # the merged document is replaced, provided that nothing else has
+        # updated it in the meantime
+        if node.runtime_properties is not None and \
+                updated['runtime_properties'] != node.runtime_properties:
+            updated['runtime_properties'] = node.runtime_properties
+            with self._node_instance_update_errors(node.id,
+                                                   result['_version']):
+                result = self._connection.index(
+                    index=STORAGE_INDEX_NAME,
+                    doc_type=NODE_INSTANCE_TYPE,
+                    id=node.id,
+                    body=updated,
+                    **self._version_params(NODE_INSTANCE_TYPE,
+                                           result['_version']))
+
+        updated['version'] = result['_version']
+        self._bump_deployment_changes([updated['deployment_id']])
+        return self._fill_missing_fields_and_deserialize(
+            updated, DeploymentNodeInstance)
+
+    def update_node_instances(self, node_instances):
+        """
+        Updates many node instances using a single multi-get request and a
+        single bulk request. Each node instance is updated independently of
+        the others, and is written with the version it was read with, so
+        that concurrent updates are reported as conflicts rather than lost.
+        A version of 0 skips the comparison with the requested version.
+
+        :return: a list, in the same order as the given node instances, of
+                 either the updated node instance or the ManagerException
+                 describing why it wasn't updated.
+        """
+        if not node_instances:
+            return []
+        docs = self._connection.mget(
+            index=STORAGE_INDEX_NAME,
+            doc_type=NODE_INSTANCE_TYPE,
+            body={'ids': [node.id for node in node_instances]})['docs']
+
+        results = [None] * len(node_instances)
+        operations = []
+        updated_docs = []
+        for index, (node, doc) in enumerate(zip(node_instances, docs)):
+            if not doc['found']:
+                results[index] = manager_exceptions.NotFoundError(
+                    'Node instance {0} not found'.format(node.id))
+                continue
+            if node.version and node.version != doc['_version']:
+                results[index] = self._node_instance_conflict(node.version)
+                continue
+            updated = doc['_source']
+            if node.state is not None:
+                updated['state'] = node.state
+            if node.runtime_properties is not None:
+                updated['runtime_properties'] = node.runtime_properties
+            if node.relationships is not None:
+                updated['relationships'] = node.relationships
+            operations.append(('index',
+                               {'_id': node.id, '_version': doc['_version']},
+                               updated))
+            updated_docs.append((index, node, updated))
+
+        items = self._bulk(NODE_INSTANCE_TYPE, operations)
+        for (index, node, updated), item in zip(updated_docs, items):
+            if item['status'] == 409:
+                results[index] = self._node_instance_conflict(node.version)
+            elif item['status'] >= 300:
+                results[index] = manager_exceptions.ManagerException(
+                    500, manager_exceptions.INTERNAL_SERVER_ERROR_CODE,
+                    'Failed updating node instance {0}: {1}'.format(
+                        node.id, item.get('error')))
+            else:
+                updated['version'] = item['_version']
+                results[index] = self._fill_missing_fields_and_deserialize(
+                    updated, DeploymentNodeInstance)
+        self._bump_deployment_changes([updated['deployment_id']
+                                       for _, _, updated in updated_docs])
+        return results
+
+    def _version_params(self, doc_type, version):
+        params = dict(self._mutate_params(doc_type))
+        if version:
+            params['version'] = version
+        return params
 
-        updated = current.to_dict()
-        del updated['version']
+    @staticmethod
+    @contextmanager
+    def _node_instance_update_errors(node_instance_id, version):
+        try:
+            yield
+        except elasticsearch.exceptions.NotFoundError:
+            raise manager_exceptions.NotFoundError(
+                'Node instance {0} not found'.format(node_instance_id))
+        except elasticsearch.exceptions.ConflictError:
+            raise ESStorageManager._node_instance_conflict(version)
 
-        self._connection.index(index=STORAGE_INDEX_NAME,
-                               doc_type=NODE_INSTANCE_TYPE,
-                               id=node.id,
-                               body=updated,
-                               **MUTATE_PARAMS)
+    @staticmethod
+    def _node_instance_conflict(version):
+        return manager_exceptions.ConflictError(
+            'Node instance update conflict [updated_version={0}]'
+            .format(version))
 
     def put_provider_context(self, provider_context):
         doc_data = provider_context.to_dict()
@@ -431,6 +859,58 @@ class ESStorageManager(object):
                                              ProviderContext,
                                              fields=include)
 
+    def get_provider_context_version(self):
+        """
+        Returns the elasticsearch document version of the provider context,
+        which is bumped on every write. Fetching it is a realtime get which
+        skips the document source.
+        """
+        try:
+            doc = self._connection.get(index=STORAGE_INDEX_NAME,
+                                       doc_type=PROVIDER_CONTEXT_TYPE,
+                                       id=PROVIDER_CONTEXT_ID,
+                                       _source=False)
+        except elasticsearch.exceptions.NotFoundError:
+            raise manager_exceptions.NotFoundError(
+                '{0} {1} not found'.format(PROVIDER_CONTEXT_TYPE,
+                                           PROVIDER_CONTEXT_ID))
+        return doc['_version']
+
+    def get_deployment_changes(self, deployment_id):
+        """
+        Returns a counter of the changes made to the node instances of the
+        given deployment, which is the elasticsearch document version of the
+        deployment's changes document. Fetching it is a realtime get which
+        skips the document source.
+        """
+        try:
+            doc = self._connection.get(index=STORAGE_INDEX_NAME,
+                                       doc_type=DEPLOYMENT_CHANGES_TYPE,
+                                       id=deployment_id,
+                                       _source=False)
+        except elasticsearch.exceptions.NotFoundError:
+            return 0
+        return doc['_version']
+
+    def _bump_deployment_changes(self, deployment_ids):
+        # the changes documents are only ever read by realtime gets, so
+        # writing them never refreshes the index
+        body = []
+        for deployment_id in set(deployment_ids):
+            body.extend([{'index': {'_id': deployment_id}}, {}])
+        if body:
+            self._connection.bulk(body=body,
+                                  index=STORAGE_INDEX_NAME,
+                                  doc_type=DEPLOYMENT_CHANGES_TYPE)
+
+    def _node_instances_deployment_ids(self, node_instance_ids):
+        docs = self._connection.mget(index=STORAGE_INDEX_NAME,
+                                     doc_type=NODE_INSTANCE_TYPE,
+                                     body={'ids': list(node_instance_ids)},
+                                     _source=['deployment_id'])['docs']
+        return [doc['_source']['deployment_id'] for doc in docs
+                if doc['found']]
+
     def put_deployment_modification(self, modification_id, modification):
         self._put_doc_if_not_exists(DEPLOYMENT_MODIFICATION_TYPE,
                                     modification_id,
@@ -459,7 +939,8 @@ class ESStorageManager(object):
                                     doc_type=DEPLOYMENT_MODIFICATION_TYPE,
                                     id=modification_id,
                                     body=update_doc,
-                                    **MUTATE_PARAMS)
+                                    **self._mutate_params(
+                                        DEPLOYMENT_MODIFICATION_TYPE))
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "Modification {0} not found".format(modification_id))
@@ -480,5 +961,6 @@ class ESStorageManager(object):
 def create():
     return ESStorageManager(
         config.instance().db_address,
-        config.instance().db_port
+        config.instance().db_port,
+        refresh_policy=config.instance().db_refresh_policy
     )
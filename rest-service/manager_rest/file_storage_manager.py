@@ -15,7 +15,11 @@
 
 import os
 import json
-from manager_rest.models import (BlueprintState,
+import functools
+import threading
+from manager_rest import config
+from manager_rest.models import (ListResult,
+                                 BlueprintState,
                                  Deployment,
                                  DeploymentModification,
                                  Execution,
@@ -36,27 +40,325 @@ EXECUTIONS = 'executions'
 PLUGINS = 'plugins'
 PROVIDER_CONTEXT = 'provider_context'
 PROVIDER_CONTEXT_ID = '1'
+PROVIDER_CONTEXT_VERSION = 'provider_context_version'
+DEFAULT_SCROLL_SIZE = 500
+
+MODEL_KEYS = {
+    BlueprintState: BLUEPRINTS,
+    Deployment: DEPLOYMENTS,
+    DeploymentModification: DEPLOYMENT_MODIFICATIONS,
+    Execution: EXECUTIONS,
+    DeploymentNode: NODES,
+    DeploymentNodeInstance: NODE_INSTANCES,
+    Plugin: PLUGINS
+}
+
+COLLECTION_MODELS = dict((key, model_class)
+                         for model_class, key in MODEL_KEYS.iteritems())
+COLLECTION_MODELS[PROVIDER_CONTEXT] = ProviderContext
+
+DEFAULT_FILE_STORAGE_SETTINGS = {
+    'path': STORAGE_FILE_PATH,
+    'in_memory': False,
+    'compaction_threshold': 1000
+}
+# fields of the common list filters, which are indexed in memory
+INDEXED_FIELDS = ('deployment_id', 'node_id', 'blueprint_id', 'status')
 
 
 def paginate_list(list_of_objects, pagination=None):
+    total = len(list_of_objects)
     if pagination:
+        # sorting by the least significant field first, relying on the
+        # sort being stable
+        for field, order in reversed(pagination.get('sort', [])):
+            list_of_objects = sorted(list_of_objects,
+                                     key=lambda obj: getattr(obj, field),
+                                     reverse=order == 'desc')
         if pagination.get("offset"):
             list_of_objects = list_of_objects[pagination.get("offset"):]
-        if pagination.get("page_size"):
+        if pagination.get("page_size") is not None:
             list_of_objects = list_of_objects[:pagination.get("page_size")]
+    return ListResult(list_of_objects, total)
+
+
+def project(obj, include=None):
+    """
+    Clears the fields of a loaded object which are not in `include`, the same
+    way elasticsearch based storage leaves fields missing from `_source`
+    empty.
+    """
+    if include:
+        for field in obj.fields:
+            if field not in include:
+                setattr(obj, field, None)
+    return obj
+
+
+def project_list(list_of_objects, include=None):
+    if include:
+        for obj in list_of_objects:
+            project(obj, include)
     return list_of_objects
 
 
+class _ResidentCollection(object):
+    """
+    A collection of the resident data, as seen by a single storage manager
+    operation. Objects are deserialized whenever they are accessed, so
+    they are never shared between operations, and changes are kept aside
+    until the operation dumps its data.
+    """
+
+    def __init__(self, store, name):
+        self._store = store
+        self._name = name
+        self._model_class = COLLECTION_MODELS[name]
+        self.changes = {}
+
+    def __contains__(self, key):
+        if key in self.changes:
+            return self.changes[key] is not None
+        return key in self._store.docs[self._name]
+
+    def __getitem__(self, key):
+        if key in self.changes:
+            if self.changes[key] is None:
+                raise KeyError(key)
+            return self.changes[key]
+        return self._model_class(**json.loads(
+            self._store.docs[self._name][key]))
+
+    def __setitem__(self, key, value):
+        self.changes[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.changes[key] = None
+
+    def keys(self, candidates=None):
+        with self._store.lock:
+            keys = set(self._store.docs[self._name]) if candidates is None \
+                else candidates
+        keys.update(self.changes)
+        return [key for key in sorted(keys) if key in self]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def matching(self, filters=None):
+        """
+        Returns the objects matching the given filters, deserializing only
+        the objects found through the indexes of the filtered fields.
+        """
+        candidates = self._store.lookup(self._name, filters)
+        return FileStorageManager.filter_data(
+            [self[key] for key in self.keys(candidates)], filters)
+
+
+class _ResidentStore(object):
+    """
+    Keeps the storage data resident in memory, serialized per object.
+
+    Every dump of changed data is appended to a journal next to the
+    snapshot file, and synced to disk before it's applied. Once the journal
+    grows past the compaction threshold, the snapshot is rewritten and the
+    journal is truncated.
+    The snapshot is written to a temporary file which is then renamed
+    over it, so a crash never leaves a partially written snapshot behind,
+    and replaying the journal over a snapshot which already contains its
+    changes is harmless.
+    """
+
+    def __init__(self, path, compaction_threshold):
+        self.path = path
+        self.journal_path = '{0}.journal'.format(path)
+        self.compaction_threshold = compaction_threshold
+        self.lock = threading.RLock()
+        self.docs = dict((name, {}) for name in COLLECTION_MODELS)
+        self.provider_context_version = 0
+        self.indexes = dict(
+            (name, dict((field, {}) for field in INDEXED_FIELDS
+                        if field in model_class.fields))
+            for name, model_class in COLLECTION_MODELS.iteritems())
+        self._journal = None
+        self._journal_length = 0
+        self._recover()
+
+    def _recover(self):
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                snapshot = json.load(f)
+            for name in COLLECTION_MODELS:
+                for key, value in snapshot.get(name, {}).iteritems():
+                    self._set(name, key, json.dumps(value))
+            self.provider_context_version = \
+                snapshot.get(PROVIDER_CONTEXT_VERSION, 0)
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        name, key, value = json.loads(line)
+                    except ValueError:
+                        # the last entry was partially written by a crash
+                        break
+                    self._apply_entry(name, key, value)
+                    self._journal_length += 1
+        self._journal = open(self.journal_path, 'a')
+
+    def close(self):
+        with self.lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def view(self):
+        data = dict((name, _ResidentCollection(self, name))
+                    for name in COLLECTION_MODELS)
+        data[PROVIDER_CONTEXT_VERSION] = self.provider_context_version
+        return data
+
+    def apply(self, data):
+        entries = []
+        for name in COLLECTION_MODELS:
+            for key, obj in data[name].changes.iteritems():
+                entries.append((name, key, None if obj is None
+                                else obj.to_dict()))
+        if data[PROVIDER_CONTEXT_VERSION] != self.provider_context_version:
+            entries.append((PROVIDER_CONTEXT_VERSION, None,
+                            data[PROVIDER_CONTEXT_VERSION]))
+        if not entries:
+            return
+        with self.lock:
+            self._journal.write(''.join(json.dumps(entry) + '\n'
+                                        for entry in entries))
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            for name, key, value in entries:
+                self._apply_entry(name, key, value)
+            self._journal_length += len(entries)
+            if self._journal_length >= self.compaction_threshold:
+                self.compact()
+
+    def compact(self):
+        with self.lock:
+            tmp_path = '{0}.tmp'.format(self.path)
+            with open(tmp_path, 'w') as f:
+                f.write('{')
+                for name, docs in self.docs.iteritems():
+                    f.write('{0}: {{'.format(json.dumps(name)))
+                    f.write(', '.join('{0}: {1}'.format(json.dumps(key), doc)
+                                      for key, doc in docs.iteritems()))
+                    f.write('}, ')
+                f.write('{0}: {1}}}'.format(
+                    json.dumps(PROVIDER_CONTEXT_VERSION),
+                    self.provider_context_version))
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, self.path)
+            self._journal.close()
+            self._journal = open(self.journal_path, 'w')
+            self._journal_length = 0
+
+    def _apply_entry(self, name, key, value):
+        if name == PROVIDER_CONTEXT_VERSION:
+            self.provider_context_version = value
+        elif value is None:
+            self._discard(name, key)
+        else:
+            self._set(name, key, json.dumps(value))
+
+    def _set(self, name, key, doc):
+        self._discard(name, key)
+        self.docs[name][key] = doc
+        values = json.loads(doc)
+        for field, index in self.indexes[name].iteritems():
+            index.setdefault(values.get(field), set()).add(key)
+
+    def _discard(self, name, key):
+        doc = self.docs[name].pop(key, None)
+        if doc is None:
+            return
+        values = json.loads(doc)
+        for field, index in self.indexes[name].iteritems():
+            keys = index.get(values.get(field))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[values.get(field)]
+
+    def lookup(self, name, filters=None):
+        """
+        :return: the keys of the objects which may match the given filters,
+                 according to the indexes of the filtered fields, or None if
+                 none of the filtered fields is indexed.
+        """
+        candidates = None
+        with self.lock:
+            for field, values in (filters or {}).iteritems():
+                index = self.indexes[name].get(field)
+                # plain string filters are matched as substrings
+                if index is None or not isinstance(values, (list, tuple)):
+                    continue
+                keys = set()
+                for value in values:
+                    keys.update(index.get(value, ()))
+                candidates = keys if candidates is None \
+                    else candidates & keys
+        return candidates
+
+
+def _writes(func):
+    """
+    Serializes the decorated storage operation with the other writes of
+    the storage manager, since each write reads the data, modifies it and
+    dumps it back, and writes made concurrently (e.g. by background
+    blueprint uploads) would otherwise overwrite each other's changes.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock:
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
 class FileStorageManager(object):
     """
     file based storage manager for tests.
+
+    In memory mode, the data is kept resident between operations, and the
+    storage file is only rewritten periodically, with changes journaled in
+    between (see _ResidentStore). In this mode existing data is recovered
+    rather than removed. The resident data is private to the process, so
+    this mode must not be used by a server running several worker
+    processes (e.g. gunicorn workers), whose data would diverge.
     """
 
-    def __init__(self, storage_path):
+    def __init__(self, storage_path, in_memory=False,
+                 compaction_threshold=1000):
         self._storage_path = storage_path
-        if os.path.isfile(storage_path):
+        self._store = None
+        self._write_lock = threading.RLock()
+        # changes counters are only needed by the process which makes the
+        # changes, so they are not stored
+        self._deployment_changes = {}
+        if in_memory:
+            self._store = _ResidentStore(storage_path, compaction_threshold)
+        elif os.path.isfile(storage_path):
             os.remove(storage_path)
 
+    def refresh_pending(self):
+        # writes are always immediately visible in file storage
+        pass
+
+    def searchable_on_write(self, model_class):
+        return True
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+
     def _init_file(self):
         data = {
             NODES: {},
@@ -67,10 +369,13 @@ class FileStorageManager(object):
             EXECUTIONS: {},
             PLUGINS: {},
             PROVIDER_CONTEXT: {},
+            PROVIDER_CONTEXT_VERSION: 0,
         }
         self._dump_data(data)
 
     def _load_data(self):
+        if self._store is not None:
+            return self._store.view()
         if not os.path.isfile(self._storage_path):
             self._init_file()
         with open(self._storage_path, 'r') as f:
@@ -97,6 +402,8 @@ class FileStorageManager(object):
             deserialized_data[PROVIDER_CONTEXT] = \
                 {key: ProviderContext(**val)
                  for key, val in data[PROVIDER_CONTEXT].iteritems()}
+            deserialized_data[PROVIDER_CONTEXT_VERSION] = \
+                data.get(PROVIDER_CONTEXT_VERSION, 0)
             deserialized_data[DEPLOYMENT_MODIFICATIONS] = \
                 {key: DeploymentModification(**val) for key, val in
                  data[DEPLOYMENT_MODIFICATIONS].iteritems()}
@@ -104,7 +411,15 @@ class FileStorageManager(object):
             return deserialized_data
 
     def _dump_data(self, data):
-        with open(self._storage_path, 'w') as f:
+        if self._store is not None:
+            self._store.apply(data)
+            return
+        # the file is replaced rather than rewritten in place, so that
+        # threads reading it concurrently (e.g. while blueprints are uploaded
+        # in the background) never read a partially written file
+        tmp_path = '{0}.{1}.tmp'.format(self._storage_path,
+                                        threading.current_thread().ident)
+        with open(tmp_path, 'w') as f:
             serialized_data = dict()
             serialized_data[NODES] = {key: val.to_dict() for key, val in
                                       data[NODES].iteritems()}
@@ -126,44 +441,56 @@ class FileStorageManager(object):
             serialized_data[PROVIDER_CONTEXT] = \
                 {key: val.to_dict() for key, val in data[PROVIDER_CONTEXT]
                     .iteritems()}
+            serialized_data[PROVIDER_CONTEXT_VERSION] = \
+                data.get(PROVIDER_CONTEXT_VERSION, 0)
             serialized_data[DEPLOYMENT_MODIFICATIONS] = \
                 {key: val.to_dict() for key, val in data[
                     DEPLOYMENT_MODIFICATIONS].iteritems()}
             json.dump(serialized_data, f)
+        os.rename(tmp_path, self._storage_path)
 
-    def get_node_instance(self, node_id, **_):
+    def get_node_instance(self, node_id, include=None):
         data = self._load_data()
         if node_id in data[NODE_INSTANCES]:
-            return data[NODE_INSTANCES][node_id]
+            return project(data[NODE_INSTANCES][node_id], include)
         raise manager_exceptions.NotFoundError(
             "Node {0} not found".format(node_id))
 
-    def get_node_instances(self, filters=None, pagination=None, **_):
-        instances = self._load_data()[NODE_INSTANCES].values()
-        result = self.filter_data(instances, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+    def get_node_instances_by_ids(self, node_instance_ids, include=None):
+        node_instances = self._load_data()[NODE_INSTANCES]
+        missing = [node_instance_id for node_instance_id in node_instance_ids
+                   if node_instance_id not in node_instances]
+        if missing:
+            raise manager_exceptions.NotFoundError(
+                "Nodes {0} not found".format(missing))
+        return project_list([node_instances[node_instance_id]
+                             for node_instance_id in node_instance_ids],
+                            include)
+
+    def get_node_instances(self, include=None, filters=None, pagination=None):
+        result = self._filter(NODE_INSTANCES, filters)
+        return project_list(paginate_list(result, pagination=pagination),
+                            include)
 
-    def get_nodes(self, filters=None, pagination=None, **_):
-        nodes = self._load_data()[NODES].values()
-        result = self.filter_data(nodes, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+    def get_nodes(self, include=None, filters=None, pagination=None):
+        result = self._filter(NODES, filters)
+        return project_list(paginate_list(result, pagination=pagination),
+                            include)
 
     def get_plugins(self, include=None, filters=None, pagination=None):
-        plugins = self._load_data()[PLUGINS].values()
-        result = self.filter_data(plugins, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        result = self._filter(PLUGINS, filters)
+        return project_list(paginate_list(result, pagination=pagination),
+                            include)
 
-    def get_node(self, deployment_id, node_id, **_):
+    def get_node(self, deployment_id, node_id, include=None):
         data = self._load_data()
         node_id = '{}_{}'.format(deployment_id, node_id)
         if node_id in data[NODES]:
-            return data[NODES][node_id]
+            return project(data[NODES][node_id], include)
         raise manager_exceptions.NotFoundError(
             "Deployment {0} not found".format(deployment_id))
 
+    @_writes
     def put_node(self, node):
         data = self._load_data()
         node_id = '{0}_{1}'.format(node.deployment_id, node.id)
@@ -174,6 +501,22 @@ class FileStorageManager(object):
         self._dump_data(data)
         return 1
 
+    @_writes
+    def put_nodes(self, nodes):
+        data = self._load_data()
+        conflicts = []
+        for node in nodes:
+            node_id = '{0}_{1}'.format(node.deployment_id, node.id)
+            if node_id in data[NODES]:
+                conflicts.append(node_id)
+            else:
+                data[NODES][node_id] = node
+        self._dump_data(data)
+        if conflicts:
+            raise manager_exceptions.ConflictError(
+                'Nodes {0} already exist'.format(conflicts))
+
+    @_writes
     def put_node_instance(self, node):
         data = self._load_data()
         node_id = node.id
@@ -182,8 +525,41 @@ class FileStorageManager(object):
                 'Node {0} already exists'.format(node_id))
         data[NODE_INSTANCES][str(node_id)] = node
         self._dump_data(data)
+        self._bump_deployment_changes([node.deployment_id])
         return 1
 
+    @_writes
+    def put_node_instances(self, node_instances):
+        data = self._load_data()
+        conflicts = []
+        for node_instance in node_instances:
+            node_instance_id = str(node_instance.id)
+            if node_instance_id in data[NODE_INSTANCES]:
+                conflicts.append(node_instance_id)
+            else:
+                data[NODE_INSTANCES][node_instance_id] = node_instance
+        self._dump_data(data)
+        self._bump_deployment_changes(
+            [node_instance.deployment_id for node_instance in node_instances])
+        if conflicts:
+            raise manager_exceptions.ConflictError(
+                'Node instances {0} already exist'.format(conflicts))
+
+    @_writes
+    def update_blueprint(self, blueprint_id, blueprint):
+        data = self._load_data()
+        if blueprint_id not in data[BLUEPRINTS]:
+            raise manager_exceptions.NotFoundError(
+                "Blueprint {0} not found".format(blueprint_id))
+
+        updated_blueprint = data[BLUEPRINTS][blueprint_id]
+        for field, value in blueprint.to_dict().iteritems():
+            if value is not None and field != 'id':
+                setattr(updated_blueprint, field, value)
+        data[BLUEPRINTS][blueprint_id] = updated_blueprint
+        self._dump_data(data)
+
+    @_writes
     def update_execution_status(self, execution_id, status, error):
         data = self._load_data()
         if execution_id not in data[EXECUTIONS]:
@@ -196,6 +572,7 @@ class FileStorageManager(object):
         data[EXECUTIONS][execution_id] = execution
         self._dump_data(data)
 
+    @_writes
     def update_node(self, deployment_id, node_id,
                     number_of_instances=None,
                     planned_number_of_instances=None):
@@ -209,8 +586,10 @@ class FileStorageManager(object):
             node.number_of_instances = number_of_instances
         if planned_number_of_instances is not None:
             node.planned_number_of_instances = planned_number_of_instances
+        data[NODES][storage_node_id] = node
         self._dump_data(data)
 
+    @_writes
     def update_node_instance(self, node_update):
         data = self._load_data()
         if node_update.id not in data[NODE_INSTANCES]:
@@ -227,12 +606,43 @@ class FileStorageManager(object):
 
         data[NODE_INSTANCES][node.id] = node
         self._dump_data(data)
+        self._bump_deployment_changes([node.deployment_id])
+        return node
 
-    def blueprints_list(self, filters=None, pagination=None, **_):
-        blueprints = self._load_data()[BLUEPRINTS].values()
-        result = self.filter_data(blueprints, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+    @_writes
+    def update_node_instances(self, node_updates):
+        data = self._load_data()
+        results = []
+        for node_update in node_updates:
+            if node_update.id not in data[NODE_INSTANCES]:
+                results.append(manager_exceptions.NotFoundError(
+                    "Node {0} not found".format(node_update.id)))
+                continue
+            node = data[NODE_INSTANCES][node_update.id]
+            if node_update.state is not None:
+                node.state = node_update.state
+            if node_update.runtime_properties is not None:
+                node.runtime_properties = node_update.runtime_properties
+            if node_update.relationships is not None:
+                node.relationships = node_update.relationships
+            data[NODE_INSTANCES][node.id] = node
+            results.append(node)
+        self._dump_data(data)
+        self._bump_deployment_changes(
+            [result.deployment_id for result in results
+             if not isinstance(result, manager_exceptions.ManagerException)])
+        return results
+
+    def blueprints_list(self, include=None, filters=None, pagination=None):
+        result = self._filter(BLUEPRINTS, filters)
+        return project_list(paginate_list(result, pagination=pagination),
+                            include)
+
+    def _filter(self, object_type, filters=None):
+        items = self._load_data()[object_type]
+        if self._store is not None:
+            return items.matching(filters)
+        return self.filter_data(items.values(), filters)
 
     @staticmethod
     def filter_data(items_lst, filters=None):
@@ -249,64 +659,70 @@ class FileStorageManager(object):
             result = items_lst
         return result
 
-    def deployments_list(self, filters=None, pagination=None, **_):
-        deployments = self._load_data()[DEPLOYMENTS].values()
-        result = self.filter_data(deployments, filters)
-        return paginate_list(result,
-                             pagination=pagination)
-
-    def executions_list(self, filters=None, pagination=None, **_):
-        executions = self._load_data()[EXECUTIONS].values()
-        result = self.filter_data(executions, filters)
-        return paginate_list(result,
-                             pagination=pagination)
-
-    def get_blueprint_deployments(self, blueprint_id, **_):
-        return self.deployments_list(filters={'blueprint_id': blueprint_id})
+    def deployments_list(self, include=None, filters=None, pagination=None):
+        result = self._filter(DEPLOYMENTS, filters)
+        return project_list(paginate_list(result, pagination=pagination),
+                            include)
+
+    def executions_list(self, include=None, filters=None, pagination=None):
+        result = self._filter(EXECUTIONS, filters)
+        return project_list(paginate_list(result, pagination=pagination),
+                            include)
+
+    def scroll_list(self, model_class, include=None, filters=None,
+                    cursor=None, size=DEFAULT_SCROLL_SIZE):
+        # the cursor is the offset of the next page, which is good enough
+        # for the tests this storage manager is used in
+        try:
+            offset = int(cursor) if cursor else 0
+        except ValueError:
+            raise manager_exceptions.BadParametersError(
+                'Cursor {0} has expired or is invalid'.format(cursor))
+        items = self._filter(MODEL_KEYS[model_class], filters)
+        next_offset = offset + size
+        next_cursor = str(next_offset) if next_offset < len(items) else None
+        return project_list(items[offset:next_offset], include), next_cursor
+
+    def iter_list(self, model_class, include=None, filters=None):
+        for item in self._filter(MODEL_KEYS[model_class], filters):
+            yield project(item, include)
+
+    def executions_count(self, filters=None):
+        return len(self.executions_list(filters=filters))
+
+    def get_blueprint_deployments(self, blueprint_id, include=None):
+        return self.deployments_list(include=include,
+                                     filters={'blueprint_id': blueprint_id})
 
     def get_blueprint(self, blueprint_id, include=None):
         data = self._load_data()
         if blueprint_id in data[BLUEPRINTS]:
-            bp = data[BLUEPRINTS][blueprint_id]
-            if include:
-                for field in BlueprintState.fields:
-                    if field not in include:
-                        setattr(bp, field, None)
-            return bp
+            return project(data[BLUEPRINTS][blueprint_id], include)
         raise manager_exceptions.NotFoundError(
             "Blueprint {0} not found".format(blueprint_id))
 
     def get_plugin(self, plugin_id, include=None):
         data = self._load_data()
         if plugin_id in data[PLUGINS]:
-            plugin = data[PLUGINS][plugin_id]
-            if include:
-                for field in Plugin.fields:
-                    if field not in include:
-                        setattr(plugin, field, None)
-            return plugin
+            return project(data[PLUGINS][plugin_id], include)
         raise manager_exceptions.NotFoundError(
             "Plugin {0} not found".format(plugin_id))
 
     def get_deployment(self, deployment_id, include=None):
         data = self._load_data()
         if deployment_id in data[DEPLOYMENTS]:
-            dep = data[DEPLOYMENTS][deployment_id]
-            if include:
-                for field in Deployment.fields:
-                    if field not in include:
-                        setattr(dep, field, None)
-            return dep
+            return project(data[DEPLOYMENTS][deployment_id], include)
         raise manager_exceptions.NotFoundError(
             "Deployment {0} not found".format(deployment_id))
 
-    def get_execution(self, execution_id, **_):
+    def get_execution(self, execution_id, include=None):
         data = self._load_data()
         if execution_id in data[EXECUTIONS]:
-            return data[EXECUTIONS][execution_id]
+            return project(data[EXECUTIONS][execution_id], include)
         raise manager_exceptions.NotFoundError(
             "Execution {0} not found".format(execution_id))
 
+    @_writes
     def put_blueprint(self, blueprint_id, blueprint):
         data = self._load_data()
         if str(blueprint_id) in data[BLUEPRINTS]:
@@ -315,6 +731,7 @@ class FileStorageManager(object):
         data[BLUEPRINTS][str(blueprint_id)] = blueprint
         self._dump_data(data)
 
+    @_writes
     def put_deployment(self, deployment_id, deployment):
         data = self._load_data()
         if str(deployment_id) in data[DEPLOYMENTS]:
@@ -323,6 +740,7 @@ class FileStorageManager(object):
         data[DEPLOYMENTS][str(deployment_id)] = deployment
         self._dump_data(data)
 
+    @_writes
     def put_execution(self, execution_id, execution):
         data = self._load_data()
         if str(execution_id) in data[EXECUTIONS]:
@@ -331,6 +749,7 @@ class FileStorageManager(object):
         data[EXECUTIONS][str(execution_id)] = execution
         self._dump_data(data)
 
+    @_writes
     def put_plugin(self, plugin):
         data = self._load_data()
         if str(plugin.id) in data[PLUGINS]:
@@ -345,6 +764,7 @@ class FileStorageManager(object):
     def delete_plugin(self, plugin_id):
         return self._delete_object(plugin_id, PLUGINS, 'Plugin')
 
+    @_writes
     def delete_deployment(self, deployment_id):
         data = self._load_data()
         for instance in data[NODE_INSTANCES].values():
@@ -361,6 +781,7 @@ class FileStorageManager(object):
             if modification.deployment_id == deployment_id:
                 del data[DEPLOYMENT_MODIFICATIONS][modification.id]
         self._dump_data(data)
+        self._bump_deployment_changes([deployment_id])
         return self._delete_object(deployment_id, DEPLOYMENTS, 'Deployment')
 
     def delete_execution(self, execution_id):
@@ -370,8 +791,30 @@ class FileStorageManager(object):
         return self._delete_object(node_id, NODES, 'Node')
 
     def delete_node_instance(self, node_instance_id):
-        return self._delete_object(node_instance_id, NODE_INSTANCES, 'Node')
+        node_instance = self._delete_object(node_instance_id, NODE_INSTANCES,
+                                            'Node')
+        self._bump_deployment_changes([node_instance.deployment_id])
+        return node_instance
 
+    @_writes
+    def delete_node_instances(self, node_instance_ids):
+        data = self._load_data()
+        missing = []
+        deployment_ids = []
+        for node_instance_id in node_instance_ids:
+            if node_instance_id in data[NODE_INSTANCES]:
+                deployment_ids.append(
+                    data[NODE_INSTANCES][node_instance_id].deployment_id)
+                del(data[NODE_INSTANCES][node_instance_id])
+            else:
+                missing.append(node_instance_id)
+        self._dump_data(data)
+        self._bump_deployment_changes(deployment_ids)
+        if missing:
+            raise manager_exceptions.NotFoundError(
+                "Nodes {0} not found".format(missing))
+
+    @_writes
     def _delete_object(self, object_id, object_type, object_type_name):
         data = self._load_data()
         if object_id in data[object_type]:
@@ -382,29 +825,50 @@ class FileStorageManager(object):
         raise manager_exceptions.NotFoundError(
             "{0} {1} not found".format(object_type_name, object_id))
 
+    def get_deployment_changes(self, deployment_id):
+        return self._deployment_changes.get(deployment_id, 0)
+
+    def _bump_deployment_changes(self, deployment_ids):
+        for deployment_id in set(deployment_ids):
+            self._deployment_changes[deployment_id] = \
+                self._deployment_changes.get(deployment_id, 0) + 1
+
+    @_writes
     def put_provider_context(self, provider_context):
         data = self._load_data()
         if PROVIDER_CONTEXT_ID in data[PROVIDER_CONTEXT]:
             raise manager_exceptions.ConflictError(
                 'Provider context already set')
         data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID] = provider_context
+        data[PROVIDER_CONTEXT_VERSION] += 1
         self._dump_data(data)
 
+    @_writes
     def update_provider_context(self, provider_context):
         data = self._load_data()
         if PROVIDER_CONTEXT_ID not in data[PROVIDER_CONTEXT]:
             raise manager_exceptions.NotFoundError('Provider Context not '
                                                    'found')
         data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID] = provider_context
+        data[PROVIDER_CONTEXT_VERSION] += 1
         self._dump_data(data)
 
-    def get_provider_context(self, **_):
+    def get_provider_context(self, include=None):
+        data = self._load_data()
+        if PROVIDER_CONTEXT_ID in data[PROVIDER_CONTEXT]:
+            return project(data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID],
+                           include)
+        raise manager_exceptions.NotFoundError(
+            "Provider context not set")
+
+    def get_provider_context_version(self):
         data = self._load_data()
         if PROVIDER_CONTEXT_ID in data[PROVIDER_CONTEXT]:
-            return data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID]
+            return data[PROVIDER_CONTEXT_VERSION]
         raise manager_exceptions.NotFoundError(
             "Provider context not set")
 
+    @_writes
     def put_deployment_modification(self, modification_id, modification):
         data = self._load_data()
         if str(modification_id) in data[DEPLOYMENT_MODIFICATIONS]:
@@ -417,17 +881,18 @@ class FileStorageManager(object):
     def get_deployment_modification(self, modification_id, include=None):
         data = self._load_data()
         if modification_id in data[DEPLOYMENT_MODIFICATIONS]:
-            return data[DEPLOYMENT_MODIFICATIONS][modification_id]
+            return project(data[DEPLOYMENT_MODIFICATIONS][modification_id],
+                           include)
         raise manager_exceptions.NotFoundError(
             "Deployment modification {0} not found".format(modification_id))
 
     def deployment_modifications_list(self, include=None,
                                       filters=None, pagination=None):
-        modifications = self._load_data()[DEPLOYMENT_MODIFICATIONS].values()
-        result = self.filter_data(modifications, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        result = self._filter(DEPLOYMENT_MODIFICATIONS, filters)
+        return project_list(paginate_list(result, pagination=pagination),
+                            include)
 
+    @_writes
     def update_deployment_modification(self, modification):
             modification_id = modification.id
             data = self._load_data()
@@ -444,8 +909,15 @@ class FileStorageManager(object):
             if modification.node_instances is not None:
                 updated_modification.node_instances = \
                     modification.node_instances
+            data[DEPLOYMENT_MODIFICATIONS][modification_id] = \
+                updated_modification
             self._dump_data(data)
 
 
 def create():
-    return FileStorageManager(STORAGE_FILE_PATH)
+    settings = dict(DEFAULT_FILE_STORAGE_SETTINGS)
+    settings.update(config.instance().file_storage or {})
+    return FileStorageManager(
+        settings['path'],
+        in_memory=settings['in_memory'],
+        compaction_threshold=settings['compaction_threshold'])
@@ -14,8 +14,10 @@
 #  * limitations under the License.
 import os
 import shutil
+import hashlib
 import tempfile
 import contextlib
+from io import BytesIO
 
 from urllib2 import urlopen, URLError
 
@@ -25,6 +27,84 @@ from manager_rest import manager_exceptions
 from manager_rest import chunked
 from manager_rest import config
 
+UPLOAD_BUFFER_SIZE = 64 * 1024
+
+
+def save_uploaded_archive(archive_target_path, url_key, kind):
+    """
+    Saves the archive passed in the request body, or the one found at the
+    URL passed in the `url_key` query parameter, to `archive_target_path`.
+
+    The archive is written in buffers of `UPLOAD_BUFFER_SIZE` bytes rather
+    than read into memory as a whole, and may be no larger than the
+    configured `file_server_max_upload_size_MB`.
+
+    :return: the sha256 hex digest of the saved archive.
+    """
+    max_size_MB = config.instance().file_server_max_upload_size_MB
+    content_length = request.content_length or 0
+    is_chunked = 'Transfer-Encoding' in request.headers
+
+    if url_key in request.args:
+        if content_length or is_chunked:
+            raise manager_exceptions.BadParametersError(
+                "Can't pass both a {0} URL via query parameters "
+                "and {0} data via the request body at the same time"
+                .format(kind))
+        data_url = request.args[url_key]
+        try:
+            with contextlib.closing(urlopen(data_url)) as urlf:
+                return _write_archive(urlf, archive_target_path,
+                                      max_size_MB, kind)
+        except URLError:
+            raise manager_exceptions.ParamUrlNotFoundError(
+                "URL {0} not found - can't download {1} archive"
+                .format(data_url, kind))
+        except ValueError:
+            raise manager_exceptions.BadParametersError(
+                "URL {0} is malformed - can't download {1} archive"
+                .format(data_url, kind))
+
+    if _exceeds(content_length, max_size_MB):
+        _raise_too_large(max_size_MB, kind)
+    if is_chunked:
+        # gunicorn removes the chunked encoding from the input stream
+        stream = request.input_stream
+    elif content_length:
+        stream = request.stream
+        if getattr(stream, 'is_exhausted', False):
+            # the body was already read into memory, e.g. to be logged
+            # as json, so that it can only be taken from the cached data
+            stream = BytesIO(request.get_data())
+    else:
+        raise manager_exceptions.BadParametersError(
+            'Missing {0} archive in request body or '
+            '"{1}" in query parameters'.format(kind, url_key))
+    return _write_archive(stream, archive_target_path, max_size_MB, kind)
+
+
+def _write_archive(stream, archive_target_path, max_size_MB, kind):
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(archive_target_path, 'wb') as f:
+        for buf in chunked.decode(stream, UPLOAD_BUFFER_SIZE):
+            size += len(buf)
+            if _exceeds(size, max_size_MB):
+                _raise_too_large(max_size_MB, kind)
+            sha256.update(buf)
+            f.write(buf)
+    return sha256.hexdigest()
+
+
+def _exceeds(size, max_size_MB):
+    return bool(max_size_MB) and size > max_size_MB * 1024 * 1024
+
+
+def _raise_too_large(max_size_MB, kind):
+    raise manager_exceptions.PayloadTooLargeError(
+        'The {0} archive is larger than the maximum upload size of '
+        '{1}MB'.format(kind, max_size_MB))
+
 
 class UploadedDataManager(object):
 
@@ -32,11 +112,12 @@ class UploadedDataManager(object):
         file_server_root = config.instance().file_server_root
         archive_target_path = tempfile.mktemp(dir=file_server_root)
         try:
-            self._save_file_locally(archive_target_path)
+            sha256 = self._save_file_locally(archive_target_path)
             doc, dest_file_name = self._prepare_and_process_doc(
                 data_id,
                 file_server_root,
-                archive_target_path)
+                archive_target_path,
+                sha256)
             self._move_archive_to_uploaded_dir(doc.id,
                                                file_server_root,
                                                archive_target_path,
@@ -48,40 +129,9 @@ class UploadedDataManager(object):
                 os.remove(archive_target_path)
 
     def _save_file_locally(self, archive_target_path):
-        url_key = self._get_data_url_key()
-        if url_key in request.args:
-            if request.data or 'Transfer-Encoding' in request.headers:
-                raise manager_exceptions.BadParametersError(
-                    "Can't pass both a {0} URL via query parameters "
-                    "and {0} data via the request body at the same time"
-                    .format(self._get_kind()))
-            data_url = request.args[url_key]
-            try:
-                with contextlib.closing(urlopen(data_url)) as urlf:
-                    with open(archive_target_path, 'w') as f:
-                        f.write(urlf.read())
-            except URLError:
-                raise manager_exceptions.ParamUrlNotFoundError(
-                    "URL {0} not found - can't download {1} archive"
-                    .format(data_url, self._get_kind()))
-            except ValueError:
-                raise manager_exceptions.BadParametersError(
-                    "URL {0} is malformed - can't download {1} archive"
-                    .format(data_url, self._get_kind()))
-
-        elif 'Transfer-Encoding' in request.headers:
-            with open(archive_target_path, 'w') as f:
-                for buffered_chunked in chunked.decode(request.input_stream):
-                    f.write(buffered_chunked)
-        else:
-            if not request.data:
-                raise manager_exceptions.BadParametersError(
-                    'Missing {0} archive in request body or '
-                    '"{1}" in query parameters'.format(self._get_kind(),
-                                                       url_key))
-            uploaded_file_data = request.data
-            with open(archive_target_path, 'w') as f:
-                f.write(uploaded_file_data)
+        return save_uploaded_archive(archive_target_path,
+                                     self._get_data_url_key(),
+                                     self._get_kind())
 
     def _move_archive_to_uploaded_dir(self,
                                       data_id,
@@ -118,5 +168,5 @@ class UploadedDataManager(object):
         raise NotImplementedError('Subclass responsibility')
 
     def _prepare_and_process_doc(self, data_id, file_server_root,
-                                 archive_target_path):
+                                 archive_target_path, sha256):
         raise NotImplementedError('Subclass responsibility')
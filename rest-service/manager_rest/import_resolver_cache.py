@@ -0,0 +1,260 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+
+import requests
+from dsl_parser import utils as dsl_parser_utils
+from dsl_parser.import_resolver.abstract_import_resolver import \
+    AbstractImportResolver
+from dsl_parser.import_resolver.default_import_resolver import \
+    DefaultImportResolver
+
+from manager_rest import config
+from manager_rest.plan_cache import LRUCache
+
+DEFAULT_IMPORT_RESOLVER_CACHE_SETTINGS = {
+    'enabled': True,
+    # a directory in which fetched imports are kept across restarts and
+    # shared by processes, in addition to each process' memory
+    'path': None,
+    # seconds for which a cached import is used without revalidation
+    'max_age': 3600,
+    # seconds to wait for an import's server when fetching or revalidating
+    'timeout': 5,
+    # bounds of the imports kept in each process' memory
+    'max_entries': 500,
+    'max_size_MB': 50,
+    # import urls mapped to files, relative to the file server root, with
+    # which the cache is seeded - by default, the url of the cloudify
+    # types.yaml of this version, which the manager's resources include
+    'seed': {
+        'http://www.getcloudify.org/spec/cloudify/3.3/types.yaml':
+            'cloudify/types/types.yaml'
+    }
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+logger = logging.getLogger('manager-rest')
+
+
+class CachingImportResolver(AbstractImportResolver):
+    """
+    Resolves remote imports using the wrapped resolver, serving the
+    imports it resolved before from an `ImportCache`.
+
+    Imports from the file server aren't cached, since they're the
+    blueprints' own files, which change when a blueprint is deleted and
+    uploaded again under the same id.
+    """
+
+    def __init__(self, resolver, cache):
+        self.resolver = resolver
+        self._cache = cache
+
+    def resolve(self, import_url):
+        file_server_base_uri = config.instance().file_server_base_uri
+        if file_server_base_uri and import_url.startswith(
+                file_server_base_uri):
+            return self.resolver.resolve(import_url)
+        return self._cache.resolve(import_url, self.resolver)
+
+
+class ImportCache(object):
+    """
+    Thread safe cache of remote import documents. A cached import is used
+    as is for `max_age` seconds, after which it's revalidated by a
+    conditional request, using the ETag and Last-Modified headers it was
+    served with. When revalidation fails, the cached import is still used.
+
+    Imports are kept in memory in an `LRUCache` of up to `max_entries`
+    imports and `max_size` bytes, and when a `path` is given, also in files
+    under it, from which imports evicted from memory are loaded again.
+    """
+
+    def __init__(self, path=None, max_age=3600, timeout=5, max_entries=500,
+                 max_size=50 * 1024 * 1024):
+        self.path = path
+        self.max_age = max_age
+        self.timeout = timeout
+        self._entries = LRUCache(max_entries=max_entries, max_size=max_size)
+        if self.path and not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def seed(self, import_url, file_path):
+        if self._get_entry(import_url) is not None:
+            return
+        with open(file_path) as f:
+            content = f.read().decode('utf-8')
+        self._put_entry(import_url, _entry(None, content))
+
+    def resolve(self, import_url, resolver):
+        entry = self._get_entry(import_url)
+        if entry is not None and \
+                time.time() - entry['fetched_at'] < self.max_age:
+            return entry['content']
+        try:
+            new_entry = self._fetch(import_url, resolver, entry)
+        except Exception, ex:
+            if entry is None:
+                raise
+            logger.warning('Failed revalidating import {0}, using the '
+                           'cached import instead: {1}'.format(import_url,
+                                                               ex))
+            return entry['content']
+        self._put_entry(import_url, new_entry)
+        return new_entry['content']
+
+    def _fetch(self, import_url, resolver, entry):
+        if not isinstance(resolver, DefaultImportResolver):
+            # the requests made by a custom resolver are unknown, so what
+            # it resolves can't be revalidated - only fetched again
+            return _entry(None, resolver.resolve(import_url))
+
+        errors = []
+        for url in _candidate_urls(import_url, resolver.rules):
+            headers = {}
+            if entry is not None and entry['url'] == url:
+                if entry['etag']:
+                    headers['If-None-Match'] = entry['etag']
+                if entry['last_modified']:
+                    headers['If-Modified-Since'] = entry['last_modified']
+            try:
+                response = requests.get(url, headers=headers,
+                                        timeout=self.timeout)
+            except requests.RequestException, ex:
+                errors.append('{0}: {1}'.format(url, ex))
+                continue
+            if response.status_code == 304 and headers:
+                return dict(entry, fetched_at=time.time())
+            if 200 <= response.status_code < 300:
+                return _entry(url, response.text,
+                              etag=response.headers.get('ETag'),
+                              last_modified=response.headers.get(
+                                  'Last-Modified'))
+            errors.append('{0}: status code {1}'.format(
+                url, response.status_code))
+
+        if entry is not None:
+            raise RuntimeError('; '.join(errors))
+        # the resolver's own error is raised for imports which were never
+        # resolved, after its retries
+        return _entry(None, resolver.resolve(import_url))
+
+    def _get_entry(self, import_url):
+        entry = self._entries.get(import_url)
+        if entry is None and self.path:
+            try:
+                with open(self._entry_path(import_url)) as f:
+                    entry = json.load(f)
+            except (IOError, ValueError):
+                return None
+            self._put_in_memory(import_url, entry)
+        return entry
+
+    def _put_entry(self, import_url, entry):
+        self._put_in_memory(import_url, entry)
+        if self.path:
+            entry_path = self._entry_path(import_url)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.rename(tmp_path, entry_path)
+
+    def _put_in_memory(self, import_url, entry):
+        self._entries.put(import_url, entry, len(entry['content']))
+
+    def _entry_path(self, import_url):
+        return os.path.join(self.path, '{0}.json'.format(
+            hashlib.sha256(import_url.encode('utf-8')).hexdigest()))
+
+
+def _entry(url, content, etag=None, last_modified=None):
+    return {
+        'url': url,
+        'content': content,
+        'etag': etag,
+        'last_modified': last_modified,
+        'fetched_at': time.time()
+    }
+
+
+def _candidate_urls(import_url, rules):
+    # the urls the default resolver tries, in the same order
+    urls = []
+    for rule in rules or []:
+        prefix, replacement = rule.items()[0]
+        if import_url.startswith(prefix):
+            url = replacement + import_url[len(prefix):]
+            if url not in urls:
+                urls.append(url)
+    if import_url not in urls:
+        urls.append(import_url)
+    return urls
+
+
+def _settings():
+    settings = dict(DEFAULT_IMPORT_RESOLVER_CACHE_SETTINGS)
+    settings.update(config.instance().import_resolver_cache or {})
+    return settings
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = _settings()
+                cache = ImportCache(
+                    path=settings['path'],
+                    max_age=settings['max_age'],
+                    timeout=settings['timeout'],
+                    max_entries=settings['max_entries'],
+                    max_size=settings['max_size_MB'] * 1024 * 1024)
+                for import_url, file_path in settings['seed'].iteritems():
+                    try:
+                        cache.seed(import_url, os.path.join(
+                            config.instance().file_server_root, file_path))
+                    except IOError, ex:
+                        logger.warning('Failed seeding the imports cache '
+                                       'with {0}: {1}'.format(import_url, ex))
+                _cache = cache
+    return _cache
+
+
+def create_import_resolver(resolver_section):
+    """
+    Creates the import resolver configured by the given resolver section
+    of the provider context, wrapped by a `CachingImportResolver` unless
+    the imports cache is disabled.
+    """
+    resolver = dsl_parser_utils.create_import_resolver(resolver_section)
+    if not _settings()['enabled']:
+        return resolver
+    return CachingImportResolver(resolver, _get_cache())
+
+
+def reset():
+    global _cache
+    with _cache_lock:
+        _cache = None
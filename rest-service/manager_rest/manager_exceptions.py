@@ -107,6 +107,15 @@ class UnsupportedContentTypeError(ManagerException):
             **kwargs)
 
 
+class PayloadTooLargeError(ManagerException):
+    PAYLOAD_TOO_LARGE_ERROR_CODE = 'payload_too_large_error'
+
+    def __init__(self, *args, **kwargs):
+        super(PayloadTooLargeError, self).__init__(
+            413, PayloadTooLargeError.PAYLOAD_TOO_LARGE_ERROR_CODE,
+            *args, **kwargs)
+
+
 class BadParametersError(ManagerException):
     BAD_PARAMETERS_ERROR_CODE = 'bad_parameters_error'
 
@@ -174,6 +183,15 @@ class DeploymentModificationAlreadyEndedError(ManagerException):
             .DEPLOYMENT_MODIFICATION_ALREADY_ENDED_ERROR, *args, **kwargs)
 
 
+class BlueprintNotReadyError(ManagerException):
+    BLUEPRINT_NOT_READY_ERROR_CODE = 'blueprint_not_ready_error'
+
+    def __init__(self, *args, **kwargs):
+        super(BlueprintNotReadyError, self).__init__(
+            400, BlueprintNotReadyError.BLUEPRINT_NOT_READY_ERROR_CODE,
+            *args, **kwargs)
+
+
 class DeploymentEnvironmentCreationInProgressError(ManagerException):
     DEPLOYMENT_ENVIRONMENT_CREATION_IN_PROGRESS_ERROR_CODE = \
         'deployment_environment_creation_in_progress_error'
@@ -29,11 +29,29 @@ class SerializableObject(object):
         return json.dumps(self.to_dict())
 
 
+class ListResult(list):
+    """
+    A page of listed items, along with the total number of items which
+    matched the listing.
+    """
+
+    def __init__(self, items, total):
+        super(ListResult, self).__init__(items)
+        self.total = total
+
+
 class BlueprintState(SerializableObject):
 
+    UPLOADING = 'uploading'
+    PARSING = 'parsing'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    IN_PROGRESS_STATES = [UPLOADING, PARSING]
+
     fields = {
         'plan', 'id', 'description', 'created_at', 'updated_at',
-        'main_file_name'
+        'main_file_name', 'sha256', 'state', 'error'
     }
 
     def __init__(self, **kwargs):
@@ -43,6 +61,9 @@ class BlueprintState(SerializableObject):
         self.created_at = kwargs['created_at']
         self.updated_at = kwargs['updated_at']
         self.main_file_name = kwargs['main_file_name']
+        self.sha256 = kwargs.get('sha256')
+        self.state = kwargs.get('state')
+        self.error = kwargs.get('error')
 
 
 class Deployment(SerializableObject):
@@ -98,6 +119,7 @@ class Execution(SerializableObject):
     FORCE_CANCELLING = 'force_cancelling'
 
     END_STATES = [TERMINATED, FAILED, CANCELLED]
+    ACTIVE_STATES = [PENDING, STARTED, CANCELLING, FORCE_CANCELLING]
 
     fields = {'id', 'status', 'deployment_id', 'workflow_id', 'blueprint_id',
               'created_at', 'error', 'parameters', 'is_system_workflow'}
@@ -181,7 +203,8 @@ class Plugin(SerializableObject):
     fields = {'id', 'package_name', 'archive_name', 'package_source',
               'package_version', 'supported_platform', 'distribution',
               'distribution_version', 'distribution_release', 'wheels',
-              'excluded_wheels', 'supported_py_versions', 'uploaded_at'}
+              'excluded_wheels', 'supported_py_versions', 'uploaded_at',
+              'sha256'}
 
     def __init__(self, **kwargs):
         self.id = kwargs['id']
@@ -197,3 +220,4 @@ class Plugin(SerializableObject):
         self.excluded_wheels = kwargs['excluded_wheels']
         self.supported_py_versions = kwargs['supported_py_versions']
         self.uploaded_at = kwargs['uploaded_at']
+        self.sha256 = kwargs.get('sha256')
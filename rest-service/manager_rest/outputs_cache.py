@@ -0,0 +1,93 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import hashlib
+import json
+import threading
+
+from manager_rest import config
+from manager_rest.models import DeploymentNodeInstance
+from manager_rest.plan_cache import LRUCache
+
+DEFAULT_OUTPUTS_CACHE_SETTINGS = {
+    'max_entries': 1000,
+    'max_size_MB': 50
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = dict(DEFAULT_OUTPUTS_CACHE_SETTINGS)
+                settings.update(
+                    config.instance().deployment_outputs_cache or {})
+                _cache = LRUCache(
+                    max_entries=settings['max_entries'],
+                    max_size=settings['max_size_MB'] * 1024 * 1024)
+    return _cache
+
+
+def get_outputs(sm, deployment_id, evaluate_outputs):
+    """
+    Returns the evaluated outputs of the given deployment, served from an
+    in-process cache keyed by the deployment's changes counter, which is
+    bumped in storage whenever any of the deployment's node instances
+    changes, so that an unchanged deployment costs a single counter lookup.
+
+    The counter is read in realtime while the node instances are searched,
+    so outputs are only cached when node instance writes are searchable as
+    soon as they return (i.e. not with a batched or deferred elasticsearch
+    refresh policy). Otherwise, outputs evaluated between a write and the
+    following refresh would be cached from the old node instances under
+    the new counter.
+
+    The returned outputs are shared by all callers and must not be modified.
+
+    :param sm: the storage manager to read the changes counter from.
+    :param evaluate_outputs: a function which evaluates the outputs of the
+                             deployment whose id it's called with.
+    :return: a (outputs, etag) tuple, where etag is a digest of the outputs.
+    """
+    # the counter is read before the outputs are evaluated, so that a
+    # concurrent change can only cause a redundant evaluation and never a
+    # stale entry
+    if not sm.searchable_on_write(DeploymentNodeInstance):
+        outputs = evaluate_outputs(deployment_id)
+        serialized = json.dumps(outputs, sort_keys=True)
+        return outputs, hashlib.sha1(serialized).hexdigest()
+    changes = sm.get_deployment_changes(deployment_id)
+    cache = _get_cache()
+    entry = cache.get(deployment_id)
+    if entry is None or entry[0] != changes:
+        outputs = evaluate_outputs(deployment_id)
+        serialized = json.dumps(outputs, sort_keys=True)
+        entry = (changes, outputs, hashlib.sha1(serialized).hexdigest())
+        cache.put(deployment_id, entry, len(serialized))
+    return entry[1], entry[2]
+
+
+def discard(deployment_id):
+    _get_cache().discard_matching(lambda key: key == deployment_id)
+
+
+def reset():
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,128 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import json
+import threading
+from collections import OrderedDict
+
+from manager_rest import config
+from manager_rest import manager_exceptions
+from manager_rest.models import BlueprintState
+
+DEFAULT_PLAN_CACHE_SETTINGS = {
+    'max_entries': 50,
+    'max_size_MB': 100
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class LRUCache(object):
+    """
+    Thread safe least-recently-used cache, bounded both by its number of
+    entries and by the total size of its values, as reported by the caller
+    when a value is added.
+    """
+
+    def __init__(self, max_entries, max_size):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._entries[key] = entry
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            self._discard(key)
+            if size > self.max_size or self.max_entries <= 0:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or \
+                    self.size > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def discard_matching(self, predicate):
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = dict(DEFAULT_PLAN_CACHE_SETTINGS)
+                settings.update(config.instance().blueprint_plan_cache or {})
+                _cache = LRUCache(
+                    max_entries=settings['max_entries'],
+                    max_size=settings['max_size_MB'] * 1024 * 1024)
+    return _cache
+
+
+def get_plan(sm, blueprint_id):
+    """
+    Returns the plan of the given blueprint, served from an in-process cache
+    keyed by the blueprint id and its `updated_at` timestamp, so that only a
+    small projection of the blueprint document is read on a cache hit.
+
+    The returned plan is shared by all callers and must not be modified.
+    """
+    blueprint = sm.get_blueprint(blueprint_id,
+                                 include=['id', 'updated_at', 'state'])
+    # blueprints stored before upload states were introduced have no state
+    if blueprint.state not in (None, BlueprintState.READY):
+        raise manager_exceptions.BlueprintNotReadyError(
+            "Blueprint {0} is not ready - its upload state is {1}"
+            .format(blueprint_id, blueprint.state))
+    cache = _get_cache()
+    plan = cache.get((blueprint.id, blueprint.updated_at))
+    if plan is None:
+        blueprint = sm.get_blueprint(blueprint_id,
+                                     include=['id', 'updated_at', 'plan'])
+        plan = blueprint.plan
+        # the serialized size is used as an estimate of the plan's memory
+        # footprint, which is computed only once per blueprint
+        cache.put((blueprint.id, blueprint.updated_at), plan,
+                  len(json.dumps(plan)))
+    return plan
+
+
+def discard(blueprint_id):
+    _get_cache().discard_matching(lambda key: key[0] == blueprint_id)
+
+
+def reset():
+    global _cache
+    with _cache_lock:
+        _cache = None
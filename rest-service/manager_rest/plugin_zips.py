@@ -0,0 +1,187 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import zipfile
+import contextlib
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from manager_rest import config
+from manager_rest import utils
+
+DEFAULT_PLUGIN_ZIPS_SETTINGS = {
+    # plugins are zipped by threads, as compression releases the GIL
+    'workers': 4,
+    # files which are already compressed are stored in the zips as is,
+    # rather than deflated again
+    'store_compressed_files': True,
+    # a folder in which plugin zips are kept by their content digest, so
+    # that blueprints bundling the same plugins don't zip them again; a
+    # relative path is relative to the file server root
+    'cache_folder': 'plugin_zips_cache',
+    # bounds of the cache folder, beyond which the least recently used
+    # zips are removed from it
+    'cache_max_entries': 100,
+    'cache_max_size_MB': 500
+}
+COMPRESSED_FILE_EXTENSIONS = frozenset([
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.whl', '.egg', '.jar',
+    '.war', '.png', '.jpg', '.jpeg', '.gif'
+])
+
+
+def _settings():
+    settings = dict(DEFAULT_PLUGIN_ZIPS_SETTINGS)
+    settings.update(config.instance().plugin_zips or {})
+    return settings
+
+
+def zip_plugins(plugins_directory):
+    """
+    Zips each of the plugin directories under `plugins_directory` to a zip
+    named after it, next to it.
+
+    The content digest of a plugin directory is kept as its zip's comment,
+    and a plugin isn't zipped again when its zip already has the same
+    digest, or when a zip with the same digest is found in the cache folder.
+    """
+    settings = _settings()
+    plugin_dirs = sorted(
+        os.path.join(plugins_directory, directory)
+        for directory in os.listdir(plugins_directory)
+        if os.path.isdir(os.path.join(plugins_directory, directory)))
+    if not plugin_dirs:
+        return
+    cache_folder = _cache_folder(settings)
+    if cache_folder and not os.path.isdir(cache_folder):
+        os.makedirs(cache_folder)
+    pool = ThreadPool(max(1, min(settings['workers'], len(plugin_dirs))))
+    try:
+        pool.map(partial(_zip_plugin, settings, cache_folder), plugin_dirs)
+    finally:
+        pool.close()
+        pool.join()
+    if cache_folder:
+        _evict(cache_folder, settings['cache_max_entries'],
+               settings['cache_max_size_MB'] * 1024 * 1024)
+
+
+def _cache_folder(settings):
+    if not settings['cache_folder']:
+        return None
+    return os.path.join(config.instance().file_server_root,
+                        settings['cache_folder'])
+
+
+def _evict(cache_folder, max_entries, max_size):
+    # the cache is used concurrently by other uploads, which may remove
+    # the same zips
+    zips = []
+    for name in os.listdir(cache_folder):
+        if not name.endswith('.zip'):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_folder, name))
+        except OSError:
+            continue
+        zips.append((stat.st_mtime, stat.st_size, name))
+    zips.sort(reverse=True)
+    size = 0
+    for index, (_, zip_size, name) in enumerate(zips):
+        size += zip_size
+        if index >= max_entries or size > max_size:
+            try:
+                os.remove(os.path.join(cache_folder, name))
+            except OSError:
+                pass
+
+
+def _zip_plugin(settings, cache_folder, plugin_dir):
+    target_zip_path = '{0}.zip'.format(plugin_dir)
+    store_compressed_files = settings['store_compressed_files']
+    sha256 = hashlib.sha256(json.dumps(
+        [os.path.basename(plugin_dir), store_compressed_files]))
+    utils.update_directory_digest(sha256, plugin_dir)
+    digest = sha256.hexdigest()
+
+    if _zip_digest(target_zip_path) == digest:
+        return
+    cached_zip_path = None
+    if cache_folder:
+        cached_zip_path = os.path.join(cache_folder,
+                                       '{0}.zip'.format(digest))
+        try:
+            # the modification time marks the zip as recently used
+            os.utime(cached_zip_path, None)
+            _link(cached_zip_path, target_zip_path)
+            return
+        except (OSError, IOError):
+            # not cached, or evicted meanwhile
+            pass
+    _zip_dir(plugin_dir, target_zip_path, digest, store_compressed_files)
+    if cached_zip_path:
+        _link(target_zip_path, cached_zip_path)
+
+
+def _zip_digest(zip_path):
+    try:
+        with contextlib.closing(zipfile.ZipFile(zip_path)) as zipf:
+            return zipf.comment
+    except (IOError, zipfile.BadZipfile):
+        return None
+
+
+def _zip_dir(dir_to_zip, target_zip_path, comment, store_compressed_files):
+    tmp_path = '{0}.{1}.tmp'.format(target_zip_path, uuid.uuid4())
+    try:
+        with contextlib.closing(zipfile.ZipFile(
+                tmp_path, 'w', zipfile.ZIP_DEFLATED)) as zipf:
+            rootlen = len(dir_to_zip) - len(os.path.basename(dir_to_zip))
+            for base, dirs, files in os.walk(dir_to_zip):
+                dirs.sort()
+                for entry in sorted(files):
+                    fn = os.path.join(base, entry)
+                    extension = os.path.splitext(entry)[1].lower()
+                    if store_compressed_files and \
+                            extension in COMPRESSED_FILE_EXTENSIONS:
+                        compress_type = zipfile.ZIP_STORED
+                    else:
+                        compress_type = zipfile.ZIP_DEFLATED
+                    zipf.write(fn, fn[rootlen:], compress_type)
+            zipf.comment = comment
+        os.rename(tmp_path, target_zip_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _link(source_path, target_path):
+    # zips are never modified once written, so they may be shared by hard
+    # links, and are replaced atomically
+    tmp_path = '{0}.{1}.tmp'.format(target_path, uuid.uuid4())
+    try:
+        try:
+            os.link(source_path, tmp_path)
+        except OSError:
+            shutil.copyfile(source_path, tmp_path)
+        os.rename(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
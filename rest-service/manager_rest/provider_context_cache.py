@@ -0,0 +1,67 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import copy
+import threading
+import time
+
+from manager_rest import config
+
+_lock = threading.Lock()
+_entry = None
+
+
+class _CacheEntry(object):
+
+    def __init__(self, provider_context, version):
+        self.provider_context = provider_context
+        self.version = version
+        self.validated_at = time.time()
+
+
+def get_provider_context(sm):
+    """
+    Returns the provider context, served from an in-process cache.
+
+    The cached context is validated against the version stamp kept in
+    storage, which is cheap to read compared to the context itself, so
+    updates made by other REST worker processes are picked up on the next
+    read. When `provider_context_cache_ttl` is configured, the cached context
+    is served without validation for that many seconds.
+
+    :param sm: the storage manager to read the provider context from.
+    :return: a copy of the provider context, which callers may modify.
+    """
+    global _entry
+    entry = _entry
+    ttl = config.instance().provider_context_cache_ttl
+    if entry is None or not ttl or \
+            time.time() - entry.validated_at >= ttl:
+        # the version is read before the context, so that a concurrent
+        # update can only cause a redundant fetch and never a stale entry
+        version = sm.get_provider_context_version()
+        if entry is None or entry.version != version:
+            entry = _CacheEntry(sm.get_provider_context(), version)
+        else:
+            entry.validated_at = time.time()
+        with _lock:
+            _entry = entry
+    return copy.deepcopy(entry.provider_context)
+
+
+def invalidate():
+    global _entry
+    with _lock:
+        _entry = None
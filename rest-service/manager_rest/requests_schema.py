@@ -70,3 +70,12 @@ class EvaluateFunctionsRequest(object):
         'context': fields.Raw,
         'payload': fields.Raw
     }
+
+
+@swagger.model
+class EvaluateFunctionsBatchRequest(object):
+
+    resource_fields = {
+        'deployment_id': fields.String,
+        'items': fields.Raw
+    }
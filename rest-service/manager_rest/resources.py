@@ -15,25 +15,25 @@
 #
 
 import os
-import zipfile
+import json
+import types
+import zlib
 import urllib
 import tempfile
 import shutil
 import uuid
-import contextlib
 from contextlib import contextmanager
-from functools import wraps
+from functools import wraps, partial
 from os import path
-from urllib2 import urlopen, URLError
 
 from setuptools import archive_util
 
-import elasticsearch
 from flask import (
     request,
     make_response,
     current_app as app,
-    g
+    Response,
+    stream_with_context
 )
 from flask.ext.restful import Resource, marshal, reqparse
 from flask_restful_swagger import swagger
@@ -43,13 +43,16 @@ from flask_securest.rest_security import SECURED_MODE, SecuredResource
 from dsl_parser import utils as dsl_parser_utils
 
 from manager_rest import config
+from manager_rest import es_client
 from manager_rest import models
 from manager_rest import responses
 from manager_rest import requests_schema
-from manager_rest import chunked
 from manager_rest import archiving
 from manager_rest import manager_exceptions
 from manager_rest import utils
+from manager_rest import blueprint_uploads
+from manager_rest import plugin_zips
+from manager_rest.files import save_uploaded_archive
 from manager_rest.storage_manager import get_storage_manager
 from manager_rest.blueprints_manager import (DslParseException,
                                              get_blueprints_manager,
@@ -57,6 +60,8 @@ from manager_rest.blueprints_manager import (DslParseException,
 from manager_rest import get_version_data
 
 CONVENTION_APPLICATION_BLUEPRINT_FILE = 'blueprint.yaml'
+STREAM_CHUNK_SIZE = 64 * 1024
+GZIP_COMPRESSION_LEVEL = 6
 
 SUPPORTED_ARCHIVE_TYPES = ['zip', 'tar', 'tar.gz', 'tar.bz2']
 
@@ -131,6 +136,8 @@ class marshal_with(object):
 
             response = f(*args, **kwargs)
 
+            if isinstance(response, types.GeneratorType):
+                return self.stream(response, fields_to_include)
             if isinstance(response, tuple):
                 data, code, headers = unpack(response)
                 data = self.wrap_with_response_object(data)
@@ -141,6 +148,40 @@ class marshal_with(object):
 
         return wrapper
 
+    def stream(self, items, fields_to_include):
+        """
+        Streams the items yielded by a generator as a JSON list, marshalling
+        them one at a time instead of building the whole list in memory.
+        """
+        def marshal_item(item):
+            return json.dumps(
+                marshal(self.wrap_with_response_object(item),
+                        fields_to_include))
+
+        # fetching the first item before the response is returned, so that
+        # storage errors are reported with a proper error response
+        first_item = next(items, None)
+
+        def generate():
+            if first_item is None:
+                yield '[]'
+                return
+            chunk = ['[', marshal_item(first_item)]
+            chunk_size = len(chunk[1])
+            for item in items:
+                marshalled_item = marshal_item(item)
+                chunk.extend((',', marshalled_item))
+                chunk_size += len(marshalled_item) + 1
+                if chunk_size >= STREAM_CHUNK_SIZE:
+                    yield ''.join(chunk)
+                    chunk = []
+                    chunk_size = 0
+            chunk.append(']')
+            yield ''.join(chunk)
+
+        return Response(stream_with_context(generate()),
+                        mimetype='application/json')
+
     def wrap_with_response_object(self, data):
         if isinstance(data, dict):
             return self.response_class(**data)
@@ -199,17 +240,33 @@ def make_streaming_response(res_id, res_path, content_length, archive_type):
     return response
 
 
+def remove_blueprint_files(file_server_root, blueprint_id):
+    # blueprints which failed uploading, or are still being uploaded, may
+    # not have all of their files on the file server
+    for folder in (config.instance().file_server_blueprints_folder,
+                   config.instance().file_server_uploaded_blueprints_folder):
+        shutil.rmtree(os.path.join(file_server_root, folder, blueprint_id),
+                      ignore_errors=True)
+
+
 class BlueprintsUpload(object):
-    def do_request(self, blueprint_id):
+    def do_request(self, blueprint_id, async_upload=False):
         file_server_root = config.instance().file_server_root
+        application_file_name = request.args.get('application_file_name')
+        if async_upload:
+            return self._do_async_request(file_server_root, blueprint_id,
+                                          application_file_name)
         archive_target_path = tempfile.mktemp(dir=file_server_root)
         try:
-            self._save_file_locally(archive_target_path)
+            sha256 = self._save_file_locally(archive_target_path)
             application_dir = self._extract_file_to_file_server(
                 file_server_root, archive_target_path)
-            blueprint = self._prepare_and_submit_blueprint(file_server_root,
-                                                           application_dir,
-                                                           blueprint_id)
+            blueprint = self._prepare_and_submit_blueprint(
+                file_server_root,
+                application_dir,
+                blueprint_id,
+                sha256,
+                application_file_name)
             self._move_archive_to_uploaded_blueprints_dir(blueprint.id,
                                                           file_server_root,
                                                           archive_target_path)
@@ -218,6 +275,95 @@ class BlueprintsUpload(object):
             if os.path.exists(archive_target_path):
                 os.remove(archive_target_path)
 
+    def _do_async_request(self, file_server_root, blueprint_id,
+                          application_file_name):
+        # only receiving the archive is done in the request - extracting
+        # and parsing it are left to the blueprint uploads worker pool
+        blueprints_manager = get_blueprints_manager()
+        blueprints_manager.reserve_blueprint(blueprint_id)
+        archive_target_path = tempfile.mktemp(dir=file_server_root)
+        try:
+            sha256 = self._save_file_locally(archive_target_path)
+            blueprint = blueprints_manager.update_blueprint(blueprint_id,
+                                                            sha256=sha256)
+        except Exception:
+            if os.path.exists(archive_target_path):
+                os.remove(archive_target_path)
+            get_storage_manager().delete_blueprint(blueprint_id)
+            raise
+        blueprint_uploads.submit(partial(
+            self._process_uploaded_archive,
+            app._get_current_object(),
+            file_server_root,
+            archive_target_path,
+            blueprint_id,
+            application_file_name))
+        return blueprint, 202
+
+    def _process_uploaded_archive(self, flask_app, file_server_root,
+                                  archive_target_path, blueprint_id,
+                                  application_file_name):
+        with flask_app.app_context():
+            blueprints_manager = get_blueprints_manager()
+            application_dir = None
+            try:
+                application_dir = self._extract_file_to_file_server(
+                    file_server_root, archive_target_path)
+                application_dir, application_file_name = \
+                    self._extract_application_file(file_server_root,
+                                                   application_dir,
+                                                   application_file_name)
+                blueprints_manager.update_blueprint(
+                    blueprint_id, state=models.BlueprintState.PARSING)
+                try:
+                    plan = blueprints_manager.parse_blueprint(
+                        application_dir,
+                        application_file_name,
+                        '{0}/'.format(config.instance().file_server_base_uri))
+                except DslParseException, ex:
+                    raise manager_exceptions.InvalidBlueprintError(
+                        'Invalid blueprint - {0}'.format(ex.message))
+                shutil.move(os.path.join(file_server_root, application_dir),
+                            self._blueprint_dir(file_server_root,
+                                                blueprint_id))
+                application_dir = None
+                self._process_plugins(file_server_root, blueprint_id)
+                self._move_archive_to_uploaded_blueprints_dir(
+                    blueprint_id, file_server_root, archive_target_path)
+                # the blueprint becomes ready only once all of its files
+                # are in place
+                blueprints_manager.update_blueprint(
+                    blueprint_id,
+                    plan=plan,
+                    description=plan.get('description'),
+                    main_file_name=application_file_name,
+                    state=models.BlueprintState.READY)
+            except Exception, ex:
+                flask_app.logger.exception(
+                    'Failed uploading blueprint {0}'.format(blueprint_id))
+                if application_dir:
+                    shutil.rmtree(os.path.join(file_server_root,
+                                               application_dir),
+                                  ignore_errors=True)
+                remove_blueprint_files(file_server_root, blueprint_id)
+                try:
+                    blueprints_manager.update_blueprint(
+                        blueprint_id,
+                        state=models.BlueprintState.FAILED,
+                        error=str(ex))
+                except manager_exceptions.NotFoundError:
+                    # the blueprint was deleted while being uploaded
+                    pass
+            finally:
+                if os.path.exists(archive_target_path):
+                    os.remove(archive_target_path)
+
+    @staticmethod
+    def _blueprint_dir(file_server_root, blueprint_id):
+        return os.path.join(file_server_root,
+                            config.instance().file_server_blueprints_folder,
+                            blueprint_id)
+
     @staticmethod
     def _move_archive_to_uploaded_blueprints_dir(blueprint_id,
                                                  file_server_root,
@@ -241,68 +387,13 @@ class BlueprintsUpload(object):
                                       "blueprints", blueprint_id, "plugins")
         if not path.isdir(plugins_directory):
             return
-        plugins = [path.join(plugins_directory, directory)
-                   for directory in os.listdir(plugins_directory)
-                   if path.isdir(path.join(plugins_directory, directory))]
-
-        for plugin_dir in plugins:
-            final_zip_name = '{0}.zip'.format(path.basename(plugin_dir))
-            target_zip_path = path.join(file_server_root,
-                                        "blueprints", blueprint_id,
-                                        'plugins', final_zip_name)
-            self._zip_dir(plugin_dir, target_zip_path)
-
-    @staticmethod
-    def _zip_dir(dir_to_zip, target_zip_path):
-        zipf = zipfile.ZipFile(target_zip_path, 'w', zipfile.ZIP_DEFLATED)
-        try:
-            plugin_dir_base_name = path.basename(dir_to_zip)
-            rootlen = len(dir_to_zip) - len(plugin_dir_base_name)
-            for base, dirs, files in os.walk(dir_to_zip):
-                for entry in files:
-                    fn = os.path.join(base, entry)
-                    zipf.write(fn, fn[rootlen:])
-        finally:
-            zipf.close()
+        plugin_zips.zip_plugins(plugins_directory)
 
     @staticmethod
     def _save_file_locally(archive_file_name):
-
-        if 'blueprint_archive_url' in request.args:
-
-            if request.data or 'Transfer-Encoding' in request.headers:
-                raise manager_exceptions.BadParametersError(
-                    "Can't pass both a blueprint URL via query parameters "
-                    "and blueprint data via the request body at the same time")
-
-            blueprint_url = request.args['blueprint_archive_url']
-            try:
-                with contextlib.closing(urlopen(blueprint_url)) as urlf:
-                    with open(archive_file_name, 'w') as f:
-                        f.write(urlf.read())
-                return
-            except URLError:
-                raise manager_exceptions.ParamUrlNotFoundError(
-                    "URL {0} not found - can't download blueprint archive"
-                    .format(blueprint_url))
-            except ValueError:
-                raise manager_exceptions.BadParametersError(
-                    "URL {0} is malformed - can't download blueprint archive"
-                    .format(blueprint_url))
-
-        # save uploaded file
-        if 'Transfer-Encoding' in request.headers:
-            with open(archive_file_name, 'w') as f:
-                for buffered_chunked in chunked.decode(request.input_stream):
-                    f.write(buffered_chunked)
-        else:
-            if not request.data:
-                raise manager_exceptions.BadParametersError(
-                    'Missing application archive in request body or '
-                    '"blueprint_archive_url" in query parameters')
-            uploaded_file_data = request.data
-            with open(archive_file_name, 'w') as f:
-                f.write(uploaded_file_data)
+        return save_uploaded_archive(archive_file_name,
+                                     'blueprint_archive_url',
+                                     'blueprint')
 
     @staticmethod
     def _extract_file_to_file_server(file_server_root,
@@ -341,10 +432,12 @@ class BlueprintsUpload(object):
 
     def _prepare_and_submit_blueprint(self, file_server_root,
                                       app_dir,
-                                      blueprint_id):
+                                      blueprint_id,
+                                      sha256=None,
+                                      application_file_name=None):
 
         app_dir, app_file_name = self._extract_application_file(
-            file_server_root, app_dir)
+            file_server_root, app_dir, application_file_name)
 
         file_server_base_url = '{0}/'.format(
             config.instance().file_server_base_uri)
@@ -355,15 +448,13 @@ class BlueprintsUpload(object):
                 app_dir,
                 app_file_name,
                 file_server_base_url,
-                blueprint_id)
+                blueprint_id,
+                sha256=sha256)
 
             # moving the app directory in the file server to be under a
             # directory named after the blueprint id
             shutil.move(os.path.join(file_server_root, app_dir),
-                        os.path.join(
-                            file_server_root,
-                            config.instance().file_server_blueprints_folder,
-                            blueprint.id))
+                        self._blueprint_dir(file_server_root, blueprint.id))
             self._process_plugins(file_server_root, blueprint.id)
             return blueprint
         except DslParseException, ex:
@@ -372,13 +463,14 @@ class BlueprintsUpload(object):
                 'Invalid blueprint - {0}'.format(ex.message))
 
     @staticmethod
-    def _extract_application_file(file_server_root, application_dir):
+    def _extract_application_file(file_server_root, application_dir,
+                                  application_file_name=None):
 
         full_application_dir = path.join(file_server_root, application_dir)
 
-        if 'application_file_name' in request.args:
+        if application_file_name is not None:
             application_file_name = urllib.unquote(
-                request.args['application_file_name']).decode('utf-8')
+                application_file_name).decode('utf-8')
             application_file = path.join(full_application_dir,
                                          application_file_name)
             if not path.isfile(application_file):
@@ -540,16 +632,8 @@ class BlueprintsId(SecuredResource):
         blueprint = get_blueprints_manager().delete_blueprint(blueprint_id)
 
         # Delete blueprint resources from file server
-        blueprint_folder = os.path.join(
-            config.instance().file_server_root,
-            config.instance().file_server_blueprints_folder,
-            blueprint.id)
-        shutil.rmtree(blueprint_folder)
-        uploaded_blueprint_folder = os.path.join(
-            config.instance().file_server_root,
-            config.instance().file_server_uploaded_blueprints_folder,
-            blueprint.id)
-        shutil.rmtree(uploaded_blueprint_folder)
+        remove_blueprint_files(config.instance().file_server_root,
+                               blueprint.id)
 
         return blueprint, 200
 
@@ -970,7 +1054,8 @@ class Nodes(SecuredResource):
         if deployment_id and node_id:
             try:
                 nodes = [get_storage_manager().get_node(deployment_id,
-                                                        node_id)]
+                                                        node_id,
+                                                        include=_include)]
             except manager_exceptions.NotFoundError:
                 nodes = []
         else:
@@ -1131,8 +1216,7 @@ class NodeInstancesId(SecuredResource):
             runtime_properties=request.json.get('runtime_properties'),
             state=request.json.get('state'),
             version=request.json['version'])
-        get_storage_manager().update_node_instance(node)
-        return get_storage_manager().get_node_instance(node_instance_id)
+        return get_storage_manager().update_node_instance(node)
 
 
 class DeploymentsIdOutputs(SecuredResource):
@@ -1146,36 +1230,75 @@ class DeploymentsIdOutputs(SecuredResource):
     @marshal_with(responses.DeploymentOutputs)
     def get(self, deployment_id, **kwargs):
         """Get deployment outputs"""
-        outputs = get_blueprints_manager().evaluate_deployment_outputs(
+        outputs, etag = get_blueprints_manager().get_deployment_outputs(
             deployment_id)
-        return dict(deployment_id=deployment_id, outputs=outputs)
-
-
-def _elasticsearch_connection():
-    if 'es_connection' not in g:
-        es_host = config.instance().db_address
-        es_port = config.instance().db_port
-        g.es_connection = elasticsearch.Elasticsearch(
-            hosts=[{"host": es_host, "port": es_port}])
-    return g.es_connection
+        headers = {'ETag': '"{0}"'.format(etag)}
+        if request.if_none_match.contains(etag):
+            return dict(deployment_id=deployment_id, outputs=None), 304, \
+                headers
+        return dict(deployment_id=deployment_id, outputs=outputs), 200, \
+            headers
 
 
 def _check_index_exists(index_name):
     if not hasattr(app, 'cloudify_events_index_exists'):
-        es = _elasticsearch_connection()
+        es = es_client.get_client()
         app.cloudify_events_index_exists = \
             es.indices.exists(index=[index_name])
     return app.cloudify_events_index_exists
 
 
 def _query_elastic_search(index=None, doc_type=None, body=None):
-    """Query ElasticSearch with the provided index and query body.
+    """Query ElasticSearch with the provided index and raw query body.
 
     Returns:
-    Elasticsearch result as is (Python dict).
+    A response streaming the Elasticsearch result as is, without decoding
+    it, gzip compressed if the client accepts it.
     """
-    es = _elasticsearch_connection()
-    return es.search(index=index, doc_type=doc_type, body=body)
+    accepts_gzip = request.accept_encodings['gzip'] > 0
+    status, es_headers, es_body = es_client.stream_search(
+        index=index,
+        doc_type=doc_type,
+        body=body or None,
+        headers={'Accept-Encoding': 'gzip'} if accepts_gzip else None)
+    es_headers = dict((name.lower(), value)
+                      for name, value in es_headers.iteritems())
+    headers = {'Vary': 'Accept-Encoding'}
+    chunks = es_body
+    if es_headers.get('content-encoding') == 'gzip':
+        # elasticsearch only compresses responses when asked to
+        headers['Content-Encoding'] = 'gzip'
+    elif accepts_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        chunks = _gzip_chunks(es_body)
+    if chunks is es_body and 'content-length' in es_headers:
+        headers['Content-Length'] = es_headers['content-length']
+    response = Response(chunks, status=status, headers=headers,
+                        mimetype='application/json', direct_passthrough=True)
+    response.call_on_close(es_body.close)
+    return response
+
+
+def _raw_json_request_body():
+    """
+    Returns the raw body of a JSON request, to be forwarded as is, once it
+    has been verified to be valid JSON.
+    """
+    verify_json_content_type()
+    # malformed bodies are rejected with a 400 error, the same as when the
+    # body is parsed
+    request.get_json()
+    return request.data
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(GZIP_COMPRESSION_LEVEL, zlib.DEFLATED,
+                                  16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
 
 
 class Events(SecuredResource):
@@ -1190,9 +1313,8 @@ class Events(SecuredResource):
         """
         List events for the provided Elasticsearch query
         """
-        verify_json_content_type()
         return _query_elastic_search(index=self._set_index_name(),
-                                     body=request.json)
+                                     body=_raw_json_request_body())
 
     @swagger.operation(
         nickname='events',
@@ -1253,9 +1375,8 @@ class Search(SecuredResource):
         """
         Search using an Elasticsearch query
         """
-        verify_json_content_type()
         return _query_elastic_search(index='cloudify_storage',
-                                     body=request.json)
+                                     body=_raw_json_request_body())
 
 
 class Status(SecuredResource):
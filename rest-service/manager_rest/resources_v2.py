@@ -33,31 +33,107 @@ from manager_rest.resources import (marshal_with,
                                     make_streaming_response)
 from manager_rest import models
 from manager_rest import responses_v2
+from manager_rest import requests_schema
 from manager_rest import manager_exceptions
 from manager_rest import config
+from manager_rest import es_client
 from manager_rest import files
 from manager_rest.storage_manager import get_storage_manager
 from manager_rest.blueprints_manager import get_blueprints_manager
 from manager_rest.blueprints_manager import \
     TRANSIENT_WORKERS_MODE_ENABLED_DEFAULT
 
+CURSOR_HEADER = 'X-Cloudify-Cursor'
+TOTAL_HEADER = 'X-Cloudify-Total'
+OFFSET_HEADER = 'X-Cloudify-Offset'
+SIZE_HEADER = 'X-Cloudify-Size'
+DEFAULT_CURSOR_PAGE_SIZE = 500
+
+
+def _verify_and_convert_non_negative_int(param, value):
+    try:
+        value = int(value)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise manager_exceptions.BadParametersError(
+            '{0} must be a non-negative integer, got {1}'.format(
+                param, request.args[param]))
+    return value
+
 
 def paginate(func):
     """
-    Decorator for adding pagination
+    Decorator for adding pagination and sorting. Sort fields are passed using
+    the `_sort` parameter, which may be repeated, and are prefixed with `-`
+    for a descending order.
     """
     def verify_and_create_pagination_params(*args, **kw):
         offset = request.args.get("_offset")
         page_size = request.args.get("_size")
+        sort = request.args.getlist("_sort")
         pagination_params = {}
         if offset:
-            pagination_params["offset"] = int(offset)
-        if offset:
-            pagination_params["page_size"] = int(page_size)
+            pagination_params["offset"] = \
+                _verify_and_convert_non_negative_int('_offset', offset)
+        if page_size:
+            pagination_params["page_size"] = \
+                _verify_and_convert_non_negative_int('_size', page_size)
+        if sort:
+            pagination_params["sort"] = [
+                (field[1:], 'desc') if field.startswith('-')
+                else (field, 'asc') for field in sort]
         return func(pagination=pagination_params, *args, **kw)
     return verify_and_create_pagination_params
 
 
+def list_items(model_class, list_func, include=None, filters=None,
+               pagination=None):
+    """
+    Lists items of the given model class in one of three ways:
+    1. When the `_cursor` request argument is passed, a single page of a
+    cursor based listing is returned. An empty cursor starts a new listing,
+    and the cursor for the next page is returned in the `X-Cloudify-Cursor`
+    response header, which is missing once all items have been listed.
+    2. When pagination or sort parameters are passed, `list_func` is called
+    to list the requested page, and the total number of matching items, the
+    offset and the size of the page are returned in the `X-Cloudify-Total`,
+    `X-Cloudify-Offset` and `X-Cloudify-Size` response headers.
+    3. Otherwise, all matching items are streamed from storage.
+    """
+    pagination = pagination or {}
+    if '_cursor' in request.args:
+        size = pagination.get('page_size', DEFAULT_CURSOR_PAGE_SIZE)
+        if size < 1:
+            # an empty page would never advance the cursor
+            raise manager_exceptions.BadParametersError(
+                '_size must be a positive integer when listing with a '
+                'cursor, got {0}'.format(size))
+        items, next_cursor = get_storage_manager().scroll_list(
+            model_class, include=include, filters=filters,
+            cursor=request.args['_cursor'] or None, size=size)
+        headers = {CURSOR_HEADER: next_cursor} if next_cursor else {}
+        return items, 200, headers
+    if pagination:
+        unknowns = [field for field, _ in pagination.get('sort', [])
+                    if field not in model_class.fields]
+        if unknowns:
+            raise manager_exceptions.BadParametersError(
+                'Sort keys \'{key_names}\' do not exist. Allowed sort keys '
+                'are: {fields}'.format(key_names=unknowns,
+                                       fields=list(model_class.fields)))
+        items = list_func(include=include, filters=filters,
+                          pagination=pagination)
+        headers = {
+            TOTAL_HEADER: str(items.total),
+            OFFSET_HEADER: str(pagination.get('offset', 0)),
+            SIZE_HEADER: str(pagination.get('page_size', len(items)))
+        }
+        return items, 200, headers
+    return get_storage_manager().iter_list(model_class, include=include,
+                                           filters=filters)
+
+
 def verify_and_create_filters(fields):
     """
     Decorator for extracting filter parameters from the request arguments and
@@ -119,8 +195,11 @@ class Blueprints(resources.Blueprints):
         """
         List uploaded blueprints
         """
-        return get_blueprints_manager().blueprints_list(
-            include=_include, filters=filters, pagination=pagination)
+        return list_items(models.BlueprintState,
+                          get_blueprints_manager().blueprints_list,
+                          include=_include,
+                          filters=filters,
+                          pagination=pagination)
 
 
 class BlueprintsId(resources.BlueprintsId):
@@ -163,6 +242,16 @@ class BlueprintsId(resources.BlueprintsId):
                      'allowMultiple': False,
                      'dataType': 'string',
                      'paramType': 'query'},
+                    {'name': 'async',
+                     'description': 'Return once the archive is received, '
+                                    'and extract and parse it in the '
+                                    'background. The blueprint state is '
+                                    'ready once it is done, or failed.',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'bool',
+                     'paramType': 'query',
+                     'defaultValue': False},
                     {
                         'name': 'body',
                         'description': 'Binary form of the tar '
@@ -182,9 +271,10 @@ class BlueprintsId(resources.BlueprintsId):
         """
         Upload a blueprint (id specified)
         """
-        with resources.skip_nested_marshalling():
-            return super(BlueprintsId, self).put(blueprint_id=blueprint_id,
-                                                 **kwargs)
+        async_upload = verify_and_convert_bool(
+            'async', request.args.get('async', 'false'))
+        return resources.BlueprintsUpload().do_request(
+            blueprint_id=blueprint_id, async_upload=async_upload)
 
     @swagger.operation(
         responseClass=responses_v2.BlueprintState,
@@ -235,11 +325,13 @@ class Executions(resources.Executions):
             '_include_system_workflows',
             request.args.get('_include_system_workflows', 'false'))
 
-        executions = get_blueprints_manager().executions_list(
-            filters=filters, pagination=pagination,
-            is_include_system_workflows=is_include_system_workflows,
-            include=_include)
-        return executions
+        filters = get_blueprints_manager().create_executions_filters(
+            filters, is_include_system_workflows)
+        return list_items(models.Execution,
+                          get_storage_manager().executions_list,
+                          include=_include,
+                          filters=filters,
+                          pagination=pagination)
 
 
 class Deployments(resources.Deployments):
@@ -261,9 +353,11 @@ class Deployments(resources.Deployments):
         """
         List deployments
         """
-        deployments = get_blueprints_manager().deployments_list(
-            include=_include, filters=filters, pagination=pagination)
-        return deployments
+        return list_items(models.Deployment,
+                          get_blueprints_manager().deployments_list,
+                          include=_include,
+                          filters=filters,
+                          pagination=pagination)
 
 
 class DeploymentModifications(resources.DeploymentModifications):
@@ -287,9 +381,11 @@ class DeploymentModifications(resources.DeploymentModifications):
         """
         List deployment modifications
         """
-        modifications = get_storage_manager().deployment_modifications_list(
-            include=_include, filters=filters, pagination=pagination)
-        return modifications
+        return list_items(models.DeploymentModification,
+                          get_storage_manager().deployment_modifications_list,
+                          include=_include,
+                          filters=filters,
+                          pagination=pagination)
 
 
 class Nodes(resources.Nodes):
@@ -311,10 +407,11 @@ class Nodes(resources.Nodes):
         """
         List nodes
         """
-        nodes = get_storage_manager().get_nodes(include=_include,
-                                                pagination=pagination,
-                                                filters=filters)
-        return nodes
+        return list_items(models.DeploymentNode,
+                          get_storage_manager().get_nodes,
+                          include=_include,
+                          filters=filters,
+                          pagination=pagination)
 
 
 class NodeInstances(resources.NodeInstances):
@@ -337,9 +434,80 @@ class NodeInstances(resources.NodeInstances):
         """
         List node instances
         """
-        node_instances = get_storage_manager().get_node_instances(
-            include=_include, filters=filters, pagination=pagination)
-        return node_instances
+        return list_items(models.DeploymentNodeInstance,
+                          get_storage_manager().get_node_instances,
+                          include=_include,
+                          filters=filters,
+                          pagination=pagination)
+
+    @swagger.operation(
+        responseClass='List[{0}]'.format(
+            responses_v2.NodeInstanceUpdate.__name__),
+        nickname="patchNodeInstances",
+        notes="Updates many node instances in a single request. Expecting "
+              "the request body to be a dictionary containing "
+              "'node_instances', a list of dictionaries each containing "
+              "'id', 'version' which is used for optimistic locking during "
+              "the update, and optionally 'runtime_properties' (dictionary) "
+              "and/or 'state' (string). Node instances are updated "
+              "independently of each other, and the result of each update "
+              "(its new version, or the error that prevented it) is "
+              "returned in the same order as the request.",
+        parameters=[{'name': 'node_instances',
+                     'description': 'the node instance updates',
+                     'required': True,
+                     'allowMultiple': False,
+                     'dataType': 'list',
+                     'paramType': 'body'}],
+        consumes=["application/json"]
+    )
+    @exceptions_handled
+    @marshal_with(responses_v2.NodeInstanceUpdate)
+    def patch(self, **kwargs):
+        """
+        Update node instances
+        """
+        verify_json_content_type()
+        request_json = request.json
+        verify_parameter_in_request_body('node_instances', request_json,
+                                         param_type=list)
+        node_updates = []
+        for node_update in request_json['node_instances']:
+            if not isinstance(node_update, dict):
+                raise manager_exceptions.BadParametersError(
+                    'node_instances is expected to be a list of maps')
+            verify_parameter_in_request_body('id', node_update,
+                                             param_type=basestring)
+            verify_parameter_in_request_body('version', node_update,
+                                             param_type=int)
+            verify_parameter_in_request_body('runtime_properties',
+                                             node_update,
+                                             param_type=dict,
+                                             optional=True)
+            verify_parameter_in_request_body('state', node_update,
+                                             param_type=basestring,
+                                             optional=True)
+            node_updates.append(models.DeploymentNodeInstance(
+                id=node_update['id'],
+                node_id=None,
+                relationships=None,
+                host_id=None,
+                deployment_id=None,
+                runtime_properties=node_update.get('runtime_properties'),
+                state=node_update.get('state'),
+                version=node_update['version']))
+
+        results = get_storage_manager().update_node_instances(node_updates)
+        return [_node_instance_update_result(node_update.id, result)
+                for node_update, result in zip(node_updates, results)]
+
+
+def _node_instance_update_result(node_instance_id, result):
+    if isinstance(result, manager_exceptions.ManagerException):
+        return {'id': node_instance_id,
+                'error_code': result.error_code,
+                'message': str(result)}
+    return {'id': node_instance_id, 'version': result.version}
 
 
 class ProviderContext(resources.ProviderContext):
@@ -393,10 +561,88 @@ class ProviderContext(resources.ProviderContext):
         bootstrap_ctx['transient_deployment_workers_mode'] = \
             trans_dep_workers_mode
         provider_ctx.context['cloudify'] = bootstrap_ctx
-        get_storage_manager().update_provider_context(provider_ctx)
+        get_blueprints_manager().update_provider_context(True, provider_ctx)
         return get_storage_manager().get_provider_context()
 
 
+class Status(resources.Status):
+
+    @swagger.operation(
+        responseClass=responses_v2.Status,
+        nickname="status",
+        notes="Returns state of running system services and usage "
+              "statistics of the storage connection pool"
+    )
+    @exceptions_handled
+    @marshal_with(responses_v2.Status)
+    def get(self, **kwargs):
+        """
+        Get the status of running system services
+        """
+        with resources.skip_nested_marshalling():
+            status = super(Status, self).get(**kwargs)
+        status['storage_connection_pool'] = es_client.pool_stats()
+        return status
+
+
+class EvaluateFunctionsBatch(SecuredResource):
+
+    @swagger.operation(
+        responseClass='List[{0}]'.format(
+            responses_v2.EvaluatedFunctionsResult.__name__),
+        nickname='evaluateFunctionsBatch',
+        notes="Evaluates the intrinsic functions in many payloads of a "
+              "deployment in a single request. Expecting the request body "
+              "to be a dictionary containing 'deployment_id' and 'items', a "
+              "list of dictionaries each containing 'payload' and "
+              "optionally 'context'. All payloads are evaluated against the "
+              "same snapshot of the deployment's nodes and node instances, "
+              "independently of each other, and the result of each "
+              "evaluation (the evaluated payload, or the error that "
+              "prevented it) is returned in the same order as the request.",
+        parameters=[{'name': 'body',
+                     'description': '',
+                     'required': True,
+                     'allowMultiple': False,
+                     'dataType': requests_schema.EvaluateFunctionsBatchRequest.__name__,  # noqa
+                     'paramType': 'body'}],
+        consumes=["application/json"]
+    )
+    @exceptions_handled
+    @marshal_with(responses_v2.EvaluatedFunctionsResult)
+    def post(self, **kwargs):
+        """
+        Evaluate intrinsic functions in many payloads
+        """
+        verify_json_content_type()
+        request_json = request.json
+        verify_parameter_in_request_body('deployment_id', request_json)
+        verify_parameter_in_request_body('items', request_json,
+                                         param_type=list)
+        items = []
+        for item in request_json['items']:
+            if not isinstance(item, dict):
+                raise manager_exceptions.BadParametersError(
+                    'items is expected to be a list of maps')
+            verify_parameter_in_request_body('context', item,
+                                             optional=True,
+                                             param_type=dict)
+            verify_parameter_in_request_body('payload', item,
+                                             param_type=dict)
+            items.append((item.get('context', {}), item['payload']))
+        results = get_blueprints_manager().evaluate_functions_batch(
+            deployment_id=request_json['deployment_id'],
+            items=items)
+        return [_evaluated_functions_result(result) for result in results]
+
+
+def _evaluated_functions_result(result):
+    if isinstance(result, manager_exceptions.ManagerException):
+        return {'error_code': result.error_code,
+                'message': str(result)}
+    return {'payload': result}
+
+
 class Plugins(SecuredResource):
     @swagger.operation(
         responseClass='List[{0}]'.format(responses_v2.NodeInstance.__name__),
@@ -416,10 +662,11 @@ class Plugins(SecuredResource):
         """
         List uploaded plugins
         """
-        plugins = get_storage_manager().get_plugins(include=_include,
-                                                    filters=filters,
-                                                    pagination=pagination)
-        return plugins
+        return list_items(models.Plugin,
+                          get_storage_manager().get_plugins,
+                          include=_include,
+                          filters=filters,
+                          pagination=pagination)
 
     @swagger.operation(
         responseClass=responses_v2.Plugin,
@@ -470,9 +717,10 @@ class UploadedPluginsManager(files.UploadedDataManager):
         return 'tar.gz'
 
     def _prepare_and_process_doc(self, data_id, file_server_root,
-                                 archive_target_path):
+                                 archive_target_path, sha256):
         new_plugin = self._create_plugin_from_archive(data_id,
-                                                      archive_target_path)
+                                                      archive_target_path,
+                                                      sha256)
 
         filter_by_name = {'package_name': new_plugin.package_name}
         plugins = get_storage_manager().get_plugins(filters=filter_by_name)
@@ -490,7 +738,7 @@ class UploadedPluginsManager(files.UploadedDataManager):
 
         return new_plugin, new_plugin.archive_name
 
-    def _create_plugin_from_archive(self, plugin_id, archive_path):
+    def _create_plugin_from_archive(self, plugin_id, archive_path, sha256):
         plugin = self._load_plugin_package_json(archive_path)
         build_props = plugin.get('build_server_os_properties')
         now = str(datetime.now())
@@ -507,7 +755,8 @@ class UploadedPluginsManager(files.UploadedDataManager):
             wheels=plugin.get('wheels'),
             excluded_wheels=plugin.get('excluded_wheels'),
             supported_py_versions=plugin.get('supported_python_versions'),
-            uploaded_at=now)
+            uploaded_at=now,
+            sha256=sha256)
 
     @staticmethod
     def _load_plugin_package_json(tar_source):
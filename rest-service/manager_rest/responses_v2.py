@@ -23,7 +23,8 @@ from manager_rest.responses import (BlueprintState as BlueprintStateV1,  # NOQA
                                     DeploymentModification,
                                     Node,
                                     NodeInstance,
-                                    ProviderContext)
+                                    ProviderContext,
+                                    Status as StatusV1)
 
 
 @swagger.model
@@ -31,13 +32,63 @@ class BlueprintState(BlueprintStateV1):
 
     resource_fields = dict(BlueprintStateV1.resource_fields.items() + {
         'description': fields.String,
-        'main_file_name': fields.String
+        'main_file_name': fields.String,
+        'sha256': fields.String,
+        'state': fields.String,
+        'error': fields.String
     }.items())
 
     def __init__(self, **kwargs):
         super(BlueprintState, self).__init__(**kwargs)
         self.description = kwargs['description']
         self.main_file_name = kwargs['main_file_name']
+        self.sha256 = kwargs.get('sha256')
+        self.state = kwargs.get('state')
+        self.error = kwargs.get('error')
+
+
+@swagger.model
+class Status(StatusV1):
+
+    resource_fields = dict(StatusV1.resource_fields.items() + {
+        'storage_connection_pool': fields.Raw
+    }.items())
+
+    def __init__(self, **kwargs):
+        super(Status, self).__init__(**kwargs)
+        self.storage_connection_pool = kwargs['storage_connection_pool']
+
+
+@swagger.model
+class NodeInstanceUpdate(object):
+
+    resource_fields = {
+        'id': fields.String,
+        'version': fields.Raw,
+        'error_code': fields.String,
+        'message': fields.String
+    }
+
+    def __init__(self, **kwargs):
+        self.id = kwargs['id']
+        self.version = kwargs.get('version')
+        self.error_code = kwargs.get('error_code')
+        self.message = kwargs.get('message')
+
+
+@swagger.model
+class EvaluatedFunctionsResult(object):
+
+    resource_fields = {
+        'payload': fields.Raw,
+        'error_code': fields.String,
+        'message': fields.String
+    }
+
+    def __init__(self, **kwargs):
+        self.payload = kwargs.get('payload')
+        self.error_code = kwargs.get('error_code')
+        self.message = kwargs.get('message')
 
 
 @swagger.model
@@ -56,11 +107,13 @@ class Plugin(object):
         'excluded_wheels': fields.Raw,
         'supported_py_versions': fields.Raw,
         'uploaded_at': fields.String,
+        'sha256': fields.String,
     }
     fields = {'id', 'package_name', 'archive_name', 'package_source',
               'package_version', 'supported_platform', 'distribution',
               'distribution_version', 'distribution_release', 'wheels',
-              'excluded_wheels', 'supported_py_versions', 'uploaded_at'}
+              'excluded_wheels', 'supported_py_versions', 'uploaded_at',
+              'sha256'}
 
     def __init__(self, **kwargs):
         self.id = kwargs['id']
@@ -76,3 +129,4 @@ class Plugin(object):
         self.excluded_wheels = kwargs['excluded_wheels']
         self.supported_py_versions = kwargs['supported_py_versions']
         self.uploaded_at = kwargs['uploaded_at']
+        self.sha256 = kwargs.get('sha256')
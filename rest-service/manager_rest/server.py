@@ -15,6 +15,7 @@
 
 import StringIO
 import functools
+import json
 import traceback
 import os
 import yaml
@@ -32,12 +33,22 @@ from flask_securest.rest_security import SecuREST
 
 from manager_rest import endpoint_mapper
 from manager_rest import config
+from manager_rest import blueprint_parsing
+from manager_rest import blueprint_uploads
+from manager_rest import es_client
+from manager_rest import import_resolver_cache
+from manager_rest import plan_cache
+from manager_rest import outputs_cache
+from manager_rest import provider_context_cache
 from manager_rest import storage_manager
 from manager_rest import manager_exceptions
 from manager_rest import utils
 
 
 SECURITY_BYPASS_PORT = '8101'
+# larger request bodies (e.g. uploaded archives) are streamed by the
+# resources rather than read into memory, so they are never logged
+LOGGED_JSON_MAX_SIZE = 64 * 1024
 
 
 # app factory
@@ -100,6 +111,10 @@ def setup_app(warnings=None):
         flask_restful_handle_user_exception)
 
     endpoint_mapper.setup_resources(api)
+
+    # the parsing pool forks its processes, which is only safe before the
+    # process starts serving requests and running threads
+    blueprint_parsing.start()
     return app
 
 
@@ -111,7 +126,18 @@ def log_request():
     args_data = request.args.to_dict(False)
     # json data; other data (e.g. binary) is available via request.data,
     #  but is not logged
-    json_data = request.json if hasattr(request, 'json') else None
+    json_data = None
+    content_length = request.content_length
+    if request.mimetype == 'application/json' and \
+            content_length is not None and \
+            content_length <= LOGGED_JSON_MAX_SIZE and \
+            'Transfer-Encoding' not in request.headers:
+        # the data is cached on the request, while parsing errors are
+        # left for the resource to report
+        try:
+            json_data = json.loads(request.get_data())
+        except ValueError:
+            pass
 
     # content-type and content-length are already included in headers
 
@@ -158,6 +184,13 @@ def reset_state(configuration=None):
     config.reset(configuration)
     # this doesn't really do anything
     # blueprints_manager.reset()
+    es_client.reset()
+    provider_context_cache.invalidate()
+    plan_cache.reset()
+    outputs_cache.reset()
+    blueprint_uploads.reset()
+    blueprint_parsing.reset()
+    import_resolver_cache.reset()
     storage_manager.reset()
     app = setup_app()
 
@@ -0,0 +1,733 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from manager_rest import config
+from manager_rest import manager_exceptions
+from manager_rest.models import (ListResult,
+                                 BlueprintState,
+                                 Deployment,
+                                 DeploymentModification,
+                                 Execution,
+                                 Plugin,
+                                 DeploymentNode,
+                                 DeploymentNodeInstance,
+                                 ProviderContext)
+
+DEFAULT_DB_PATH = '/opt/manager/storage.db'
+# seconds to wait for a lock held by another connection
+BUSY_TIMEOUT = 30
+# well below sqlite's limit on the number of variables in a statement
+QUERY_CHUNK_SIZE = 500
+DEFAULT_SCROLL_SIZE = 500
+PROVIDER_CONTEXT_ID = 'CONTEXT'
+
+
+def _quote(identifier):
+    return '"{0}"'.format(identifier)
+
+
+def _chunks(items, size=QUERY_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class _Table(object):
+    """
+    Maps a model class to a table with a column per model field. Fields
+    holding structured values are stored as JSON, while all others are
+    stored as is, so that they can be indexed, filtered on and sorted by.
+    """
+
+    def __init__(self, name, model_class, key='id', json_fields=(),
+                 extra_columns=(), indexes=()):
+        self.name = name
+        self.model_class = model_class
+        self.key = key
+        self.json_fields = set(json_fields)
+        self.fields = sorted(model_class.fields)
+        self.columns = [key] if key not in model_class.fields else []
+        self.columns += self.fields + list(extra_columns)
+        self.indexes = indexes
+
+    def schema(self):
+        columns = ', '.join(
+            '{0} PRIMARY KEY'.format(_quote(column)) if column == self.key
+            else _quote(column) for column in self.columns)
+        statements = ['CREATE TABLE IF NOT EXISTS {0} ({1})'.format(
+            _quote(self.name), columns)]
+        for column in self.indexes:
+            statements.append(
+                'CREATE INDEX IF NOT EXISTS {0} ON {1} ({2})'.format(
+                    _quote('{0}_{1}_idx'.format(self.name, column)),
+                    _quote(self.name),
+                    _quote(column)))
+        return statements
+
+    def add_missing_columns(self, connection):
+        # a table created before a field was added to its model lacks the
+        # field's column
+        existing = set(row[1] for row in connection.execute(
+            'PRAGMA table_info({0})'.format(_quote(self.name))))
+        for column in self.columns:
+            if column not in existing:
+                connection.execute('ALTER TABLE {0} ADD COLUMN {1}'.format(
+                    _quote(self.name), _quote(column)))
+
+    def encode(self, column, value):
+        return json.dumps(value) if column in self.json_fields else value
+
+    def to_row(self, obj, **extra_values):
+        row = dict((field, self.encode(field, getattr(obj, field)))
+                   for field in self.fields)
+        row.update(extra_values)
+        return [row.get(column) for column in self.columns]
+
+    def from_row(self, row):
+        values = dict((field, None) for field in self.fields)
+        for column in row.keys():
+            if column in values and row[column] is not None:
+                values[column] = json.loads(row[column]) \
+                    if column in self.json_fields else row[column]
+        return self.model_class(**values)
+
+    def select_columns(self, include=None):
+        if not include:
+            return self.fields
+        return [field for field in self.fields if field in include]
+
+    def verify_column(self, column):
+        if column not in self.columns:
+            raise manager_exceptions.BadParametersError(
+                'Unknown field {0} for {1}'.format(column, self.name))
+        return _quote(column)
+
+
+TABLES = {
+    BlueprintState: _Table('blueprints', BlueprintState,
+                           json_fields=['plan']),
+    Deployment: _Table('deployments', Deployment,
+                       json_fields=['workflows', 'inputs', 'policy_types',
+                                    'policy_triggers', 'groups', 'outputs'],
+                       indexes=['blueprint_id']),
+    DeploymentModification: _Table('deployment_modifications',
+                                   DeploymentModification,
+                                   json_fields=['modified_nodes',
+                                                'node_instances', 'context'],
+                                   indexes=['deployment_id', 'status']),
+    Execution: _Table('executions', Execution,
+                      json_fields=['parameters', 'is_system_workflow'],
+                      indexes=['deployment_id', 'status', 'blueprint_id']),
+    DeploymentNode: _Table('nodes', DeploymentNode, key='storage_id',
+                           json_fields=['type_hierarchy', 'properties',
+                                        'operations', 'plugins',
+                                        'relationships',
+                                        'plugins_to_install'],
+                           indexes=['deployment_id', 'blueprint_id']),
+    DeploymentNodeInstance: _Table('node_instances', DeploymentNodeInstance,
+                                   json_fields=['runtime_properties',
+                                                'relationships'],
+                                   indexes=['deployment_id', 'node_id']),
+    Plugin: _Table('plugins', Plugin,
+                   json_fields=['wheels', 'excluded_wheels',
+                                'supported_py_versions']),
+    ProviderContext: _Table('provider_context', ProviderContext,
+                            json_fields=['context'],
+                            extra_columns=['version'])
+}
+
+# a counter of the changes made to each deployment's node instances, which
+# is maintained by triggers and never deleted, so that it doesn't repeat for
+# a deployment re-created with the same id
+DEPLOYMENT_CHANGES_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS deployment_changes '
+    '(deployment_id TEXT PRIMARY KEY, changes INTEGER NOT NULL)'
+] + [
+    'CREATE TRIGGER IF NOT EXISTS node_instances_{0} '
+    'AFTER {1} ON node_instances BEGIN '
+    'INSERT OR IGNORE INTO deployment_changes VALUES ({2}.deployment_id, 0); '
+    'UPDATE deployment_changes SET changes = changes + 1 '
+    'WHERE deployment_id = {2}.deployment_id; '
+    'END'.format(event.lower(), event, row)
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'),
+                       ('DELETE', 'OLD'))
+]
+
+
+class SQLiteStorageManager(object):
+    """
+    Storage manager backed by an embedded SQLite database, for managers
+    which run without elasticsearch.
+
+    Every thread uses its own connection. Writes are made in transactions
+    which lock the database for writing as soon as they begin, so that
+    reads made as part of a write are consistent with it.
+    """
+
+    def __init__(self, db_path):
+        self._db_path = db_path
+        self._local = threading.local()
+        with self._transaction() as connection:
+            for table in TABLES.values():
+                for statement in table.schema():
+                    connection.execute(statement)
+                table.add_missing_columns(connection)
+            for statement in DEPLOYMENT_CHANGES_SCHEMA:
+                connection.execute(statement)
+
+    def refresh_pending(self):
+        # writes are immediately visible once committed
+        pass
+
+    def searchable_on_write(self, model_class):
+        return True
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # transactions are managed explicitly by _transaction
+            connection = sqlite3.connect(self._db_path,
+                                         timeout=BUSY_TIMEOUT,
+                                         isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            # readers don't block the writer and vice versa
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    @staticmethod
+    def _where(table, filters=None, extra_conditions=()):
+        # the parameters of extra conditions are appended by the caller
+        conditions = []
+        params = []
+        for column, values in (filters or {}).iteritems():
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            values = list(values)
+            if not values:
+                conditions.append('0')
+                continue
+            conditions.append('{0} IN ({1})'.format(
+                table.verify_column(column),
+                ', '.join('?' * len(values))))
+            params.extend(table.encode(column, value) for value in values)
+        conditions.extend(extra_conditions)
+        if not conditions:
+            return '', params
+        return ' WHERE ' + ' AND '.join(conditions), params
+
+    def _select(self, connection, table, include=None, filters=None,
+                extra_conditions=(), extra_params=(), order_by=None,
+                limit=None, offset=None, extra_columns=()):
+        where, params = self._where(table, filters, extra_conditions)
+        query = 'SELECT {0} FROM {1}{2}'.format(
+            ', '.join(list(extra_columns) +
+                      [_quote(c) for c in table.select_columns(include)]),
+            _quote(table.name),
+            where)
+        params.extend(extra_params)
+        if order_by:
+            query += ' ORDER BY ' + ', '.join(order_by)
+        if limit is not None or offset:
+            query += ' LIMIT ? OFFSET ?'
+            params.extend([-1 if limit is None else limit, offset or 0])
+        return connection.execute(query, params).fetchall()
+
+    def _get(self, model_class, key, include=None, name=None,
+             connection=None):
+        table = TABLES[model_class]
+        rows = self._select(connection or self._connection, table,
+                            include=include,
+                            extra_conditions=['{0} = ?'.format(
+                                _quote(table.key))],
+                            extra_params=[key])
+        if not rows:
+            raise manager_exceptions.NotFoundError(
+                '{0} {1} not found'.format(name or table.name, key))
+        return table.from_row(rows[0])
+
+    def _list(self, model_class, include=None, filters=None,
+              pagination=None):
+        table = TABLES[model_class]
+        pagination = pagination or {}
+        order_by = ['{0} {1}'.format(table.verify_column(field),
+                                     'DESC' if order == 'desc' else 'ASC')
+                    for field, order in pagination.get('sort', [])]
+        connection = self._connection
+        rows = self._select(connection, table,
+                            include=include,
+                            filters=filters,
+                            order_by=order_by,
+                            limit=pagination.get('page_size'),
+                            offset=pagination.get('offset'))
+        items = [table.from_row(row) for row in rows]
+        if pagination.get('page_size') is None and \
+                not pagination.get('offset'):
+            return ListResult(items, len(items))
+        return ListResult(items, self._count(connection, table, filters))
+
+    def _count(self, connection, table, filters=None):
+        where, params = self._where(table, filters)
+        return connection.execute(
+            'SELECT COUNT(*) FROM {0}{1}'.format(_quote(table.name), where),
+            params).fetchone()[0]
+
+    @staticmethod
+    def _insert(connection, table, rows):
+        connection.executemany(
+            'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                _quote(table.name),
+                ', '.join(_quote(column) for column in table.columns),
+                ', '.join('?' * len(table.columns))),
+            rows)
+
+    def _put(self, model_class, obj, name=None, **extra_values):
+        table = TABLES[model_class]
+        row = table.to_row(obj, **extra_values)
+        try:
+            with self._transaction() as connection:
+                self._insert(connection, table, [row])
+        except sqlite3.IntegrityError:
+            raise manager_exceptions.ConflictError(
+                '{0} {1} already exists'.format(
+                    name or table.name, row[table.columns.index(table.key)]))
+
+    def _put_many(self, model_class, rows):
+        """
+        Stores the given rows in a single transaction. Rows which don't
+        already exist are stored even if others already exist.
+
+        :return: the keys of the rows which already exist.
+        """
+        table = TABLES[model_class]
+        key_index = table.columns.index(table.key)
+        keys = [row[key_index] for row in rows]
+        with self._transaction() as connection:
+            existing = self._existing_keys(connection, table, keys)
+            self._insert(connection, table,
+                         [row for row, key in zip(rows, keys)
+                          if key not in existing])
+        return [key for key in keys if key in existing]
+
+    @staticmethod
+    def _existing_keys(connection, table, keys):
+        existing = set()
+        for chunk in _chunks(keys):
+            existing.update(row[0] for row in connection.execute(
+                'SELECT {0} FROM {1} WHERE {0} IN ({2})'.format(
+                    _quote(table.key),
+                    _quote(table.name),
+                    ', '.join('?' * len(chunk))),
+                chunk))
+        return existing
+
+    @staticmethod
+    def _update(connection, table, key, changes, extra_assignments=()):
+        assignments = ['{0} = ?'.format(_quote(column)) for column in changes]
+        assignments.extend(extra_assignments)
+        if not assignments:
+            assignments = ['{0} = {0}'.format(_quote(table.key))]
+        return connection.execute(
+            'UPDATE {0} SET {1} WHERE {2} = ?'.format(
+                _quote(table.name),
+                ', '.join(assignments),
+                _quote(table.key)),
+            [table.encode(column, value)
+             for column, value in changes.iteritems()] + [key]).rowcount
+
+    def _delete(self, model_class, key, name=None):
+        table = TABLES[model_class]
+        with self._transaction() as connection:
+            obj = self._get(model_class, key, name=name,
+                            connection=connection)
+            connection.execute('DELETE FROM {0} WHERE {1} = ?'.format(
+                _quote(table.name), _quote(table.key)), [key])
+        return obj
+
+    @staticmethod
+    def _storage_node_id(deployment_id, node_id):
+        return '{0}_{1}'.format(deployment_id, node_id)
+
+    def blueprints_list(self, include=None, filters=None, pagination=None):
+        return self._list(BlueprintState, include, filters, pagination)
+
+    def deployments_list(self, include=None, filters=None, pagination=None):
+        return self._list(Deployment, include, filters, pagination)
+
+    def executions_list(self, include=None, filters=None, pagination=None):
+        return self._list(Execution, include, filters, pagination)
+
+    def get_nodes(self, include=None, filters=None, pagination=None):
+        return self._list(DeploymentNode, include, filters, pagination)
+
+    def get_node_instances(self, include=None, filters=None, pagination=None):
+        return self._list(DeploymentNodeInstance, include, filters,
+                          pagination)
+
+    def get_plugins(self, include=None, filters=None, pagination=None):
+        return self._list(Plugin, include, filters, pagination)
+
+    def deployment_modifications_list(self, include=None, filters=None,
+                                      pagination=None):
+        return self._list(DeploymentModification, include, filters,
+                          pagination)
+
+    def scroll_list(self, model_class, include=None, filters=None,
+                    cursor=None, size=DEFAULT_SCROLL_SIZE):
+        """
+        Lists items page by page, using the rowid of the last listed item
+        as the cursor, so that each page is read using the table's primary
+        index regardless of how deep into the listing it is.
+        """
+        try:
+            last_rowid = int(cursor) if cursor else 0
+        except ValueError:
+            raise manager_exceptions.BadParametersError(
+                'Cursor {0} has expired or is invalid'.format(cursor))
+        table = TABLES[model_class]
+        rows = self._select(self._connection, table,
+                            include=include,
+                            filters=filters,
+                            extra_conditions=['rowid > ?'],
+                            extra_params=[last_rowid],
+                            order_by=['rowid'],
+                            limit=size + 1,
+                            extra_columns=['rowid AS _rowid'])
+        next_cursor = str(rows[size - 1]['_rowid']) \
+            if len(rows) > size else None
+        return [table.from_row(row) for row in rows[:size]], next_cursor
+
+    def iter_list(self, model_class, include=None, filters=None):
+        cursor = None
+        while True:
+            items, cursor = self.scroll_list(model_class, include, filters,
+                                             cursor)
+            for item in items:
+                yield item
+            if cursor is None:
+                return
+
+    def executions_count(self, filters=None):
+        return self._count(self._connection, TABLES[Execution], filters)
+
+    def get_blueprint_deployments(self, blueprint_id, include=None):
+        return self.deployments_list(include=include,
+                                     filters={'blueprint_id': [blueprint_id]})
+
+    def get_blueprint(self, blueprint_id, include=None):
+        return self._get(BlueprintState, blueprint_id, include, 'Blueprint')
+
+    def get_deployment(self, deployment_id, include=None):
+        return self._get(Deployment, deployment_id, include, 'Deployment')
+
+    def get_execution(self, execution_id, include=None):
+        return self._get(Execution, execution_id, include, 'Execution')
+
+    def get_plugin(self, plugin_id, include=None):
+        return self._get(Plugin, plugin_id, include, 'Plugin')
+
+    def get_node(self, deployment_id, node_id, include=None):
+        return self._get(DeploymentNode,
+                         self._storage_node_id(deployment_id, node_id),
+                         include, 'Node')
+
+    def get_node_instance(self, node_instance_id, include=None):
+        return self._get(DeploymentNodeInstance, node_instance_id, include,
+                         'Node instance')
+
+    def get_node_instances_by_ids(self, node_instance_ids, include=None):
+        table = TABLES[DeploymentNodeInstance]
+        connection = self._connection
+        node_instances = {}
+        for chunk in _chunks(list(node_instance_ids)):
+            for row in self._select(connection, table,
+                                    include=include,
+                                    filters={'id': chunk},
+                                    extra_columns=['id AS _key']):
+                node_instances[row['_key']] = table.from_row(row)
+        missing = [node_instance_id for node_instance_id in node_instance_ids
+                   if node_instance_id not in node_instances]
+        if missing:
+            raise manager_exceptions.NotFoundError(
+                'Node instances {0} not found'.format(missing))
+        return [node_instances[node_instance_id]
+                for node_instance_id in node_instance_ids]
+
+    def get_deployment_modification(self, modification_id, include=None):
+        return self._get(DeploymentModification, modification_id, include,
+                         'Deployment modification')
+
+    def put_blueprint(self, blueprint_id, blueprint):
+        self._put(BlueprintState, blueprint, 'Blueprint')
+
+    def put_deployment(self, deployment_id, deployment):
+        self._put(Deployment, deployment, 'Deployment')
+
+    def put_execution(self, execution_id, execution):
+        self._put(Execution, execution, 'Execution')
+
+    def put_plugin(self, plugin):
+        self._put(Plugin, plugin, 'Plugin')
+
+    def put_deployment_modification(self, modification_id, modification):
+        self._put(DeploymentModification, modification,
+                  'Deployment modification')
+
+    def put_node(self, node):
+        self._put(DeploymentNode, node, 'Node',
+                  storage_id=self._storage_node_id(node.deployment_id,
+                                                   node.id))
+        return 1
+
+    def put_nodes(self, nodes):
+        table = TABLES[DeploymentNode]
+        conflicts = self._put_many(DeploymentNode, [
+            table.to_row(node, storage_id=self._storage_node_id(
+                node.deployment_id, node.id)) for node in nodes])
+        if conflicts:
+            raise manager_exceptions.ConflictError(
+                'Nodes {0} already exist'.format(conflicts))
+
+    def put_node_instance(self, node_instance):
+        # versions start at 1, the same as elasticsearch document versions
+        self._put(DeploymentNodeInstance, node_instance, 'Node instance',
+                  version=1)
+        return 1
+
+    def put_node_instances(self, node_instances):
+        table = TABLES[DeploymentNodeInstance]
+        conflicts = self._put_many(DeploymentNodeInstance, [
+            table.to_row(node_instance, version=1)
+            for node_instance in node_instances])
+        if conflicts:
+            raise manager_exceptions.ConflictError(
+                'Node instances {0} already exist'.format(conflicts))
+
+    def update_execution_status(self, execution_id, status, error):
+        with self._transaction() as connection:
+            updated = self._update(connection, TABLES[Execution],
+                                   execution_id,
+                                   {'status': status, 'error': error})
+        if not updated:
+            raise manager_exceptions.NotFoundError(
+                'Execution {0} not found'.format(execution_id))
+
+    def update_node(self, deployment_id, node_id,
+                    number_of_instances=None,
+                    planned_number_of_instances=None):
+        changes = {}
+        if number_of_instances is not None:
+            changes['number_of_instances'] = number_of_instances
+        if planned_number_of_instances is not None:
+            changes['planned_number_of_instances'] = \
+                planned_number_of_instances
+        with self._transaction() as connection:
+            updated = self._update(
+                connection, TABLES[DeploymentNode],
+                self._storage_node_id(deployment_id, node_id), changes)
+        if not updated:
+            raise manager_exceptions.NotFoundError(
+                'Node {0} not found'.format(node_id))
+
+    def update_node_instance(self, node):
+        """
+        Updates the given fields of a node instance, rejecting the update if
+        the node instance has changed since it was read. A version of 0
+        skips the check.
+
+        :return: the updated node instance.
+        """
+        with self._transaction() as connection:
+            return self._update_node_instance(connection, node)
+
+    def update_node_instances(self, node_instances):
+        """
+        Updates many node instances in a single transaction. Each node
+        instance is updated independently of the others.
+
+        :return: a list, in the same order as the given node instances, of
+                 either the updated node instance or the ManagerException
+                 describing why it wasn't updated.
+        """
+        results = []
+        with self._transaction() as connection:
+            for node in node_instances:
+                try:
+                    results.append(
+                        self._update_node_instance(connection, node))
+                except manager_exceptions.ManagerException as e:
+                    results.append(e)
+        return results
+
+    def _update_node_instance(self, connection, node):
+        current = self._get(DeploymentNodeInstance, node.id,
+                            include=['version'], name='Node instance',
+                            connection=connection)
+        if node.version and node.version != current.version:
+            raise manager_exceptions.ConflictError(
+                'Node instance update conflict [updated_version={0}]'
+                .format(node.version))
+        changes = {}
+        if node.state is not None:
+            changes['state'] = node.state
+        if node.runtime_properties is not None:
+            changes['runtime_properties'] = node.runtime_properties
+        if node.relationships is not None:
+            changes['relationships'] = node.relationships
+        self._update(connection, TABLES[DeploymentNodeInstance], node.id,
+                     changes, extra_assignments=['version = version + 1'])
+        return self._get(DeploymentNodeInstance, node.id,
+                         connection=connection)
+
+    def update_blueprint(self, blueprint_id, blueprint):
+        changes = dict(
+            (field, value) for field, value in blueprint.to_dict().iteritems()
+            if value is not None and field != 'id')
+        with self._transaction() as connection:
+            updated = self._update(connection, TABLES[BlueprintState],
+                                   blueprint_id, changes)
+        if not updated:
+            raise manager_exceptions.NotFoundError(
+                'Blueprint {0} not found'.format(blueprint_id))
+
+    def update_deployment_modification(self, modification):
+        changes = {}
+        if modification.status is not None:
+            changes['status'] = modification.status
+        if modification.ended_at is not None:
+            changes['ended_at'] = modification.ended_at
+        if modification.node_instances is not None:
+            changes['node_instances'] = modification.node_instances
+        with self._transaction() as connection:
+            updated = self._update(connection,
+                                   TABLES[DeploymentModification],
+                                   modification.id, changes)
+        if not updated:
+            raise manager_exceptions.NotFoundError(
+                'Modification {0} not found'.format(modification.id))
+
+    def delete_blueprint(self, blueprint_id):
+        return self._delete(BlueprintState, blueprint_id, 'Blueprint')
+
+    def delete_plugin(self, plugin_id):
+        return self._delete(Plugin, plugin_id, 'Plugin')
+
+    def delete_execution(self, execution_id):
+        return self._delete(Execution, execution_id, 'Execution')
+
+    def delete_node(self, node_id):
+        return self._delete(DeploymentNode, node_id, 'Node')
+
+    def delete_node_instance(self, node_instance_id):
+        return self._delete(DeploymentNodeInstance, node_instance_id,
+                            'Node instance')
+
+    def delete_node_instances(self, node_instance_ids):
+        """
+        Deletes many node instances in a single transaction. Node instances
+        which exist are deleted even if others don't.
+
+        :raises manager_exceptions.NotFoundError: if any of the node
+                instances doesn't exist.
+        """
+        table = TABLES[DeploymentNodeInstance]
+        with self._transaction() as connection:
+            existing = self._existing_keys(connection, table,
+                                           list(node_instance_ids))
+            connection.executemany(
+                'DELETE FROM {0} WHERE id = ?'.format(_quote(table.name)),
+                [[node_instance_id] for node_instance_id in existing])
+        missing = [node_instance_id for node_instance_id in node_instance_ids
+                   if node_instance_id not in existing]
+        if missing:
+            raise manager_exceptions.NotFoundError(
+                'Node instances {0} not found'.format(missing))
+
+    def delete_deployment(self, deployment_id):
+        with self._transaction() as connection:
+            deployment = self._get(Deployment, deployment_id,
+                                   name='Deployment', connection=connection)
+            for model_class in (Execution, DeploymentNodeInstance,
+                                DeploymentNode, DeploymentModification):
+                connection.execute(
+                    'DELETE FROM {0} WHERE deployment_id = ?'.format(
+                        _quote(TABLES[model_class].name)),
+                    [deployment_id])
+            connection.execute('DELETE FROM {0} WHERE id = ?'.format(
+                _quote(TABLES[Deployment].name)), [deployment_id])
+        return deployment
+
+    def put_provider_context(self, provider_context):
+        table = TABLES[ProviderContext]
+        try:
+            with self._transaction() as connection:
+                self._insert(connection, table, [table.to_row(
+                    provider_context, id=PROVIDER_CONTEXT_ID, version=1)])
+        except sqlite3.IntegrityError:
+            raise manager_exceptions.ConflictError(
+                'Provider context already set')
+
+    def update_provider_context(self, provider_context):
+        with self._transaction() as connection:
+            updated = self._update(
+                connection, TABLES[ProviderContext], PROVIDER_CONTEXT_ID,
+                {'name': provider_context.name,
+                 'context': provider_context.context},
+                extra_assignments=['version = version + 1'])
+        if not updated:
+            raise manager_exceptions.NotFoundError(
+                'Provider Context not found')
+
+    def get_provider_context(self, include=None):
+        return self._get(ProviderContext, PROVIDER_CONTEXT_ID, include,
+                         'Provider context')
+
+    def get_provider_context_version(self):
+        row = self._connection.execute(
+            'SELECT version FROM {0} WHERE id = ?'.format(
+                _quote(TABLES[ProviderContext].name)),
+            [PROVIDER_CONTEXT_ID]).fetchone()
+        if row is None:
+            raise manager_exceptions.NotFoundError(
+                'Provider context not set')
+        return row[0]
+
+    def get_deployment_changes(self, deployment_id):
+        row = self._connection.execute(
+            'SELECT changes FROM deployment_changes WHERE deployment_id = ?',
+            [deployment_id]).fetchone()
+        return row[0] if row else 0
+
+
+def create():
+    return SQLiteStorageManager(config.instance().db_sqlite_path or
+                                DEFAULT_DB_PATH)
@@ -13,10 +13,13 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import copy
 import importlib
+import json
 
 from flask import g, current_app
 
+from manager_rest import config
 from manager_rest.utils import maybe_register_teardown
 
 # storage_manager_module_name = 'file_storage_manager'
@@ -26,12 +29,20 @@ _instance = None
 
 
 def _create_instance():
-    module = importlib.import_module(storage_manager_module_name)
+    # the storage_manager_module configuration, when set, overrides the
+    # module name
+    module = importlib.import_module(
+        config.instance().storage_manager_module or
+        storage_manager_module_name)
     return module.create()
 
 
 def reset():
     global _instance
+    # storage managers which keep resources open (e.g. the journal of the
+    # resident file storage) release them before being replaced
+    if _instance is not None and hasattr(_instance, 'close'):
+        _instance.close()
     _instance = _create_instance()
 
 
@@ -42,17 +53,98 @@ def instance():
     return _instance
 
 
+class RequestScopedStorageManager(object):
+    """
+    An identity map in front of the storage manager, which lives for the
+    duration of a single request.
+
+    Repeated get-by-id and identical list queries made during the request
+    are served from the map. Each call gets its own copy of the stored
+    result, so callers mutating what they read (e.g. before writing it
+    back) don't affect later reads in the same request.
+    Any other storage manager call, i.e. any write, clears the map.
+    """
+
+    # methods whose results depend only on their arguments
+    CACHED_METHODS = frozenset([
+        'blueprints_list',
+        'deployments_list',
+        'executions_list',
+        'executions_count',
+        'deployment_modifications_list',
+        'get_blueprint',
+        'get_blueprint_deployments',
+        'get_deployment',
+        'get_deployment_modification',
+        'get_deployment_changes',
+        'get_execution',
+        'get_node',
+        'get_nodes',
+        'get_node_instance',
+        'get_node_instances',
+        'get_node_instances_by_ids',
+        'get_plugin',
+        'get_plugins',
+        'get_provider_context',
+        'get_provider_context_version'
+    ])
+    # methods which neither read through the map nor modify the storage
+    UNCACHED_READ_METHODS = frozenset([
+        'scroll_list',
+        'iter_list',
+        'refresh_pending',
+        'searchable_on_write'
+    ])
+
+    def __init__(self, storage_manager):
+        self._storage_manager = storage_manager
+        self._identity_map = {}
+
+    def __getattr__(self, name):
+        # the method is looked up on every call, so that methods replaced
+        # on the storage manager instance are respected
+        attr = getattr(self._storage_manager, name)
+        if not callable(attr) or name in self.UNCACHED_READ_METHODS:
+            return attr
+        if name in self.CACHED_METHODS:
+            return lambda *args, **kwargs: self._cached_call(
+                name, args, kwargs)
+        return lambda *args, **kwargs: self._write_call(name, args, kwargs)
+
+    def _cached_call(self, name, args, kwargs):
+        try:
+            key = json.dumps([name, args, kwargs], sort_keys=True)
+        except TypeError:
+            # arguments which can't be used as a key are not cached
+            return getattr(self._storage_manager, name)(*args, **kwargs)
+        if key not in self._identity_map:
+            self._identity_map[key] = \
+                getattr(self._storage_manager, name)(*args, **kwargs)
+        return copy.deepcopy(self._identity_map[key])
+
+    def _write_call(self, name, args, kwargs):
+        self._identity_map.clear()
+        try:
+            return getattr(self._storage_manager, name)(*args, **kwargs)
+        finally:
+            # the write may have partially succeeded before failing
+            self._identity_map.clear()
+
+
 def teardown_storage_manager(exception):
-    # print "tearing down storage manager!"
-    pass
+    # writes made with a batched refresh policy during the request are
+    # made visible to searches once the request is over
+    if 'storage_manager' in g:
+        g.storage_manager.refresh_pending()
 
 
 def get_storage_manager():
     if 'storage_manager' not in g:
         # g.storage_manager = _create_instance()  # TODO: import only once!
 
-        # need to persist same instance across requests...
-        g.storage_manager = instance()
+        # need to persist same instance across requests, while reads are
+        # only shared within the request
+        g.storage_manager = RequestScopedStorageManager(instance())
         maybe_register_teardown(current_app, teardown_storage_manager)
 
     return g.storage_manager
@@ -156,6 +156,8 @@ class MockHTTPClient(HTTPClient):
 @attr(client_min_version=1, client_max_version=LATEST_API_VERSION)
 class BaseServerTestCase(unittest.TestCase):
 
+    storage_manager_module_name = STORAGE_MANAGER_MODULE_NAME
+
     def __init__(self, *args, **kwargs):
         super(BaseServerTestCase, self).__init__(*args, **kwargs)
 
@@ -189,7 +191,7 @@ class BaseServerTestCase(unittest.TestCase):
         self.addCleanup(self.cleanup)
         self.file_server.start()
         storage_manager.storage_manager_module_name = \
-            STORAGE_MANAGER_MODULE_NAME
+            self.storage_manager_module_name
 
         # workaround for setting the rest service log path, since it's
         # needed when 'server' module is imported.
@@ -232,6 +234,10 @@ class BaseServerTestCase(unittest.TestCase):
         test_config = Config()
         test_config.test_mode = True
         test_config.file_server_root = self.tmpdir
+        test_config.db_sqlite_path = os.path.join(self.tmpdir, 'storage.db')
+        # blueprints are parsed in the test process, where the parser may
+        # be mocked
+        test_config.blueprint_parsing = {'processes': 0}
         test_config.file_server_base_uri = 'http://localhost:{0}'.format(
             FILE_SERVER_PORT)
         test_config.file_server_blueprints_folder = \
@@ -16,6 +16,7 @@
 import uuid
 from nose.plugins.attrib import attr
 
+from manager_rest import manager_exceptions
 from manager_rest.test import base_test
 from cloudify_rest_client.exceptions import FunctionsEvaluationError
 
@@ -114,3 +115,40 @@ class AttributesTestCase(base_test.BaseServerTestCase):
             self.fail()
         except FunctionsEvaluationError as e:
             self.assertIn('Multi instances of node', e.message)
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_batch_evaluation(self):
+        response = self.post('/evaluate/functions/batch', {
+            'deployment_id': self.id_,
+            'items': [
+                {'context': {'self': self.node1.id},
+                 'payload': {'a': {'get_attribute': ['SELF', 'key1']}}},
+                {'payload': {'a': {'get_attribute': ['SELF', 'key1']}}},
+                {'payload': {'a': {'get_attribute': ['node4', 'key4']},
+                             'b': 'plain'}},
+                {'context': {'self': 'missing_instance'},
+                 'payload': {'a': {'get_attribute': ['SELF', 'key1']}}}
+            ]
+        })
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'a': 'value1'}, response.json[0]['payload'])
+        self.assertEqual(
+            manager_exceptions.FunctionsEvaluationError.ERROR_CODE,
+            response.json[1]['error_code'])
+        self.assertIn('SELF is missing', response.json[1]['message'])
+        self.assertEqual({'a': 'value4', 'b': 'plain'},
+                         response.json[2]['payload'])
+        self.assertEqual(
+            manager_exceptions.NotFoundError.NOT_FOUND_ERROR_CODE,
+            response.json[3]['error_code'])
+        self.assertIn('missing_instance', response.json[3]['message'])
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_bad_batch_evaluation(self):
+        response = self.post('/evaluate/functions/batch', {
+            'deployment_id': self.id_,
+            'items': [{'context': {}}]
+        })
+        self.assertEqual(400, response.status_code)
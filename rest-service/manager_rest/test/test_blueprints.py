@@ -14,11 +14,26 @@
 #  * limitations under the License.
 
 import os
+import json
+import time
+import hashlib
+import zipfile
 import tempfile
+import threading
+import contextlib
+from datetime import datetime, timedelta
 
+import flask
+import mock
 from nose.plugins.attrib import attr
+from dsl_parser import tasks
 
 from manager_rest import archiving
+from manager_rest import blueprint_parsing
+from manager_rest import config
+from manager_rest import models
+from manager_rest import plugin_zips
+from manager_rest import storage_manager
 from manager_rest.file_server import FileServer
 from manager_rest.test import base_test
 from cloudify_rest_client.exceptions import CloudifyClientError
@@ -61,6 +76,136 @@ class BlueprintsTestCase(base_test.BaseServerTestCase):
     def test_put_blueprint(self):
         self._test_put_blueprint(archiving.make_targzfile, 'tar.gz')
 
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_put_blueprint_sha256(self):
+        resource_path, archive_path, _ = self.put_blueprint_args()
+        with open(archive_path) as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        response = self.put_file(resource_path, archive_path)
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(sha256, response.json['sha256'])
+        self.assertEqual(sha256, self.get('/blueprints/blueprint')
+                         .json['sha256'])
+
+    def _put_blueprint_as_json(self):
+        resource_path, archive_path, _ = self.put_blueprint_args()
+        with open(archive_path) as f:
+            data = f.read()
+        response = self.app.put(resource_path,
+                                content_type='application/json',
+                                data=data)
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(hashlib.sha256(data).hexdigest(),
+                         json.loads(response.data)['sha256'])
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_put_blueprint_with_json_content_type(self):
+        # the body is read by the request logging before the upload
+        self._put_blueprint_as_json()
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_put_large_blueprint_with_json_content_type(self):
+        # the body is too large to be logged, and is streamed as it is
+        with mock.patch('manager_rest.server.LOGGED_JSON_MAX_SIZE', 0), \
+                mock.patch.object(flask.Request, 'get_data',
+                                  side_effect=AssertionError) as get_data:
+            self._put_blueprint_as_json()
+        self.assertFalse(get_data.called)
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_put_blueprint_async(self):
+        resource_path, archive_path, _ = self.put_blueprint_args()
+        response = self.put_file(resource_path, archive_path,
+                                 {'async': 'true'})
+        self.assertEqual(202, response.status_code)
+        self.assertIn(response.json['state'],
+                      ['uploading', 'parsing', 'ready'])
+
+        blueprint = self._wait_for_blueprint_upload('blueprint')
+        self.assertEqual('ready', blueprint['state'])
+        self.assertEqual('blueprint.yaml', blueprint['main_file_name'])
+        self.assertEqual(
+            200,
+            self.app.get(self._version_url('/blueprints/blueprint/archive'))
+            .status_code)
+        self.client.deployments.create('blueprint', 'deployment')
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_stale_async_upload_fails_when_polled(self):
+        sm = storage_manager.instance()
+        for blueprint_id, updated_at in [
+                ('stale', datetime.now() - timedelta(hours=2)),
+                ('recent', datetime.now())]:
+            sm.put_blueprint(blueprint_id, models.BlueprintState(
+                id=blueprint_id, plan=None, description=None,
+                created_at=str(updated_at), updated_at=str(updated_at),
+                main_file_name=None,
+                state=models.BlueprintState.PARSING))
+
+        blueprint = self.get('/blueprints/stale').json
+        self.assertEqual('failed', blueprint['state'])
+        self.assertIn('did not progress', blueprint['error'])
+        self.assertEqual('parsing',
+                         self.get('/blueprints/recent').json['state'])
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_put_blueprint_async_failure(self):
+        resource_path, archive_path, _ = self.put_blueprint_args()
+        response = self.put_file(resource_path, archive_path,
+                                 {'async': 'true',
+                                  'application_file_name': 'missing.yaml'})
+        self.assertEqual(202, response.status_code)
+
+        blueprint = self._wait_for_blueprint_upload('blueprint')
+        self.assertEqual('failed', blueprint['state'])
+        self.assertIn('missing.yaml does not exist', blueprint['error'])
+        try:
+            self.client.deployments.create('blueprint', 'deployment')
+            self.fail('Expected deployment creation to fail')
+        except CloudifyClientError, e:
+            self.assertEqual(400, e.status_code)
+            self.assertIn('not ready', e.message)
+        self.assertEqual(200, self.delete('/blueprints/blueprint')
+                         .status_code)
+
+    def test_put_identical_blueprint_reuses_plan(self):
+        with mock.patch('dsl_parser.tasks.parse_dsl',
+                        wraps=tasks.parse_dsl) as mock_parse_dsl:
+            first = self.put_file(
+                *self.put_blueprint_args(blueprint_id='first')).json
+            second = self.put_file(
+                *self.put_blueprint_args(blueprint_id='second')).json
+        self.assertEqual(1, mock_parse_dsl.call_count)
+        self.assertEqual('second', second['id'])
+        self.assertEqual(first['plan'], second['plan'])
+
+    def test_put_identical_blueprint_with_changed_import(self):
+        # the mock blueprint imports cloudify/types/types.yaml, which is
+        # not part of the blueprint's own files
+        with mock.patch('dsl_parser.tasks.parse_dsl',
+                        wraps=tasks.parse_dsl) as mock_parse_dsl:
+            self.put_file(*self.put_blueprint_args(blueprint_id='first'))
+            types_path = os.path.join(self.tmpdir, 'cloudify', 'types',
+                                      'types.yaml')
+            with open(types_path, 'a') as f:
+                f.write('\n# changed\n')
+            self.put_file(*self.put_blueprint_args(blueprint_id='second'))
+        self.assertEqual(2, mock_parse_dsl.call_count)
+
+    def test_put_blueprint_exceeding_max_upload_size(self):
+        config.instance().file_server_max_upload_size_MB = 0.0001
+        response = self.put_file(*self.put_blueprint_args())
+        self.assertEqual(413, response.status_code)
+        self.assertEqual('payload_too_large_error',
+                         response.json['error_code'])
+        self.assertEqual(404, self.get('/blueprints/blueprint').status_code)
+
     def test_post_without_application_file_form_data(self):
         post_blueprints_response = self.put_file(
             *self.put_blueprint_args('blueprint_with_workflows.yaml',
@@ -122,6 +267,96 @@ class BlueprintsTestCase(base_test.BaseServerTestCase):
         self.check_if_resource_on_fileserver('hello_world',
                                              'plugins/stub-installer.zip')
 
+    def test_unchanged_plugin_is_not_zipped_again(self):
+        plugins_dir = tempfile.mkdtemp(dir=self.tmpdir)
+        plugin_dir = os.path.join(plugins_dir, 'plugin')
+        os.mkdir(plugin_dir)
+        with open(os.path.join(plugin_dir, 'setup.py'), 'w') as f:
+            f.write('setup()')
+        plugin_zip_path = plugin_dir + '.zip'
+
+        plugin_zips.zip_plugins(plugins_dir)
+        zip_inode = os.stat(plugin_zip_path).st_ino
+        plugin_zips.zip_plugins(plugins_dir)
+        self.assertEqual(zip_inode, os.stat(plugin_zip_path).st_ino)
+
+        with open(os.path.join(plugin_dir, 'setup.py'), 'w') as f:
+            f.write('setup(name="plugin")')
+        plugin_zips.zip_plugins(plugins_dir)
+        self.assertNotEqual(zip_inode, os.stat(plugin_zip_path).st_ino)
+        with contextlib.closing(zipfile.ZipFile(plugin_zip_path)) as zipf:
+            self.assertEqual('setup(name="plugin")',
+                             zipf.read('plugin/setup.py'))
+
+    def _plugins_dir(self, files):
+        plugins_dir = tempfile.mkdtemp(dir=self.tmpdir)
+        plugin_dir = os.path.join(plugins_dir, 'plugin')
+        os.mkdir(plugin_dir)
+        for name, content in files.iteritems():
+            with open(os.path.join(plugin_dir, name), 'w') as f:
+                f.write(content)
+        return plugins_dir
+
+    def _cached_plugin_zips(self):
+        cache_folder = os.path.join(self.tmpdir, 'plugin_zips_cache')
+        return sorted(os.path.join(cache_folder, name)
+                      for name in os.listdir(cache_folder))
+
+    def test_plugin_compressed_files_stored(self):
+        plugins_dir = self._plugins_dir({'setup.py': 'setup()',
+                                         'plugin.whl': 'wheel'})
+        plugin_zip_path = os.path.join(plugins_dir, 'plugin.zip')
+
+        def compress_types():
+            with contextlib.closing(zipfile.ZipFile(plugin_zip_path)) as zf:
+                return dict((info.filename, info.compress_type)
+                            for info in zf.infolist())
+
+        plugin_zips.zip_plugins(plugins_dir)
+        self.assertEqual({'plugin/setup.py': zipfile.ZIP_DEFLATED,
+                          'plugin/plugin.whl': zipfile.ZIP_STORED},
+                         compress_types())
+
+        config.instance().plugin_zips = {'store_compressed_files': False}
+        plugin_zips.zip_plugins(plugins_dir)
+        self.assertEqual({'plugin/setup.py': zipfile.ZIP_DEFLATED,
+                          'plugin/plugin.whl': zipfile.ZIP_DEFLATED},
+                         compress_types())
+
+    def test_cached_plugin_zip_is_reused(self):
+        first_dir = self._plugins_dir({'setup.py': 'setup()'})
+        second_dir = self._plugins_dir({'setup.py': 'setup()'})
+
+        plugin_zips.zip_plugins(first_dir)
+        cached_zips = self._cached_plugin_zips()
+        self.assertEqual(1, len(cached_zips))
+        with mock.patch('manager_rest.plugin_zips._zip_dir') as mock_zip_dir:
+            plugin_zips.zip_plugins(second_dir)
+        self.assertFalse(mock_zip_dir.called)
+        self.assertEqual(
+            os.stat(cached_zips[0]).st_ino,
+            os.stat(os.path.join(second_dir, 'plugin.zip')).st_ino)
+
+    def test_plugin_zips_cache_eviction(self):
+        config.instance().plugin_zips = {'cache_max_entries': 2}
+
+        def zip_plugin(content):
+            plugins_dir = self._plugins_dir({'setup.py': content})
+            plugin_zips.zip_plugins(plugins_dir)
+            with contextlib.closing(zipfile.ZipFile(
+                    os.path.join(plugins_dir, 'plugin.zip'))) as zipf:
+                return os.path.join(self.tmpdir, 'plugin_zips_cache',
+                                    '{0}.zip'.format(zipf.comment))
+        first_zip = zip_plugin('first')
+        os.utime(first_zip, (0, 0))
+        second_zip = zip_plugin('second')
+        os.utime(second_zip, (1, 1))
+        # reusing the first zip makes the second the least recently used
+        self.assertEqual(first_zip, zip_plugin('first'))
+        third_zip = zip_plugin('third')
+        self.assertEqual(sorted([first_zip, third_zip]),
+                         self._cached_plugin_zips())
+
     def test_put_blueprint_from_url(self):
         port = 53230
         blueprint_id = 'new_blueprint_id'
@@ -270,6 +505,15 @@ class BlueprintsTestCase(base_test.BaseServerTestCase):
         self.assertEqual(blueprint_id, response.id)
         self.assertEqual(main_file_name, response.main_file_name)
 
+    def _wait_for_blueprint_upload(self, blueprint_id, timeout=30):
+        deadline = time.time() + timeout
+        while True:
+            blueprint = self.get('/blueprints/{0}'.format(blueprint_id)).json
+            if blueprint['state'] in ('ready', 'failed') or \
+                    time.time() > deadline:
+                return blueprint
+            time.sleep(0.1)
+
     def _test_put_blueprint(self, archive_func, archive_type):
         blueprint_id = 'new_blueprint_id'
         put_blueprints_response = self.put_file(
@@ -286,3 +530,70 @@ class BlueprintsTestCase(base_test.BaseServerTestCase):
                         response.headers['Content-Disposition'])
         self.assertTrue(archive_filename in
                         response.headers['X-Accel-Redirect'])
+
+
+def _slow_parse_dsl(*args, **kwargs):
+    time.sleep(60)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class BlueprintParsingPoolTestCase(base_test.BaseServerTestCase):
+
+    def create_configuration(self):
+        test_config = super(BlueprintParsingPoolTestCase,
+                            self).create_configuration()
+        test_config.blueprint_parsing = {'processes': 2, 'timeout': 1}
+        return test_config
+
+    def _restart_pool(self):
+        # the parsing processes are forked with the patches that are active
+        # when the pool is created
+        blueprint_parsing.reset()
+        blueprint_parsing.start()
+
+    def test_put_blueprint(self):
+        with mock.patch('dsl_parser.tasks.parse_dsl') as mock_parse_dsl:
+            response = self.put_file(
+                *self.put_blueprint_args(blueprint_id='blueprint'))
+        self.assertEqual(201, response.status_code)
+        self.assertFalse(mock_parse_dsl.called)
+        self.assertIn('nodes', response.json['plan'])
+
+    def test_put_blueprint_parsing_timeout(self):
+        with mock.patch('dsl_parser.tasks.parse_dsl', _slow_parse_dsl):
+            self._restart_pool()
+            response = self.put_file(
+                *self.put_blueprint_args(blueprint_id='slow'))
+        self.assertEqual(400, response.status_code)
+        self.assertIn('timed out after 1 seconds', response.json['message'])
+        self.assertEqual(404, self.get('/blueprints/slow').status_code)
+
+        # the terminated pool is replaced
+        response = self.put_file(
+            *self.put_blueprint_args(blueprint_id='blueprint'))
+        self.assertEqual(201, response.status_code)
+
+    def test_timeout_fails_other_parsing_in_progress(self):
+        args = ('blueprint.yaml', 'http://localhost', None, False)
+        with mock.patch('dsl_parser.tasks.parse_dsl', _slow_parse_dsl):
+            pool = blueprint_parsing.ParsingPool(2)
+        errors = []
+
+        def parse():
+            try:
+                pool.parse(args, 60)
+            except blueprint_parsing.BlueprintParsingError, ex:
+                errors.append(str(ex))
+        thread = threading.Thread(target=parse)
+        thread.start()
+        try:
+            self.assertRaisesRegexp(blueprint_parsing.BlueprintParsingError,
+                                    'timed out', pool.parse, args, 1)
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual([blueprint_parsing._TERMINATED_ERROR], errors)
+            self.assertRaisesRegexp(blueprint_parsing.BlueprintParsingError,
+                                    'aborted', pool.parse, args, 1)
+        finally:
+            pool.terminate()
+            thread.join()
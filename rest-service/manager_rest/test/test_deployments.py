@@ -13,12 +13,15 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import json
 import uuid
 
+import mock
 from nose.plugins.attrib import attr
 
 from manager_rest.test import base_test
 from manager_rest import manager_exceptions
+from manager_rest import storage_manager
 from cloudify_rest_client.exceptions import CloudifyClientError
 
 
@@ -42,6 +45,17 @@ class DeploymentsTestCase(base_test.BaseServerTestCase):
         self.assertIsNotNone(deployment_response['created_at'])
         self.assertIsNotNone(deployment_response['updated_at'])
 
+    def test_put_reuses_cached_blueprint_plan(self):
+        (blueprint_id, _, _, _) = self.put_deployment(self.DEPLOYMENT_ID)
+
+        sm = storage_manager.instance()
+        with mock.patch.object(sm, 'get_blueprint',
+                               wraps=sm.get_blueprint) as get_blueprint:
+            self.client.deployments.create(blueprint_id, 'deployment2')
+        for call in get_blueprint.call_args_list:
+            self.assertNotIn('plan', call[1].get('include') or ['plan'])
+        self.assertEqual(2, len(self.client.deployments.list()))
+
     def test_delete_blueprint_which_has_deployments(self):
         (blueprint_id,
          deployment_id,
@@ -361,6 +375,84 @@ class DeploymentsTestCase(base_test.BaseServerTestCase):
         self.assertEqual(8080, endpoint['port'])
         self.assertEqual(81, outputs['port2'])
 
+    def test_outputs_prefetch_node_instances(self):
+        id_ = str(uuid.uuid4())
+        self.put_deployment(
+            blueprint_file_name='blueprint_with_outputs.yaml',
+            blueprint_id=id_,
+            deployment_id=id_)
+        sm = storage_manager.instance()
+        patch_instances = mock.patch.object(sm, 'get_node_instances',
+                                            wraps=sm.get_node_instances)
+        patch_instance = mock.patch.object(sm, 'get_node_instance',
+                                           wraps=sm.get_node_instance)
+        patch_nodes = mock.patch.object(sm, 'get_nodes', wraps=sm.get_nodes)
+        with patch_instances as instances_mock, \
+                patch_instance as instance_mock, \
+                patch_nodes as nodes_mock:
+            outputs = self.client.deployments.outputs.get(id_).outputs
+        self.assertEqual(80, outputs['port'])
+        self.assertEqual(1, instances_mock.call_count)
+        self.assertEqual(0, instance_mock.call_count)
+        self.assertEqual(1, nodes_mock.call_count)
+
+    def test_outputs_prefetch_only_deployment_node_instances(self):
+        # the id of one deployment is a substring of the other's id
+        self.put_deployment(
+            blueprint_file_name='blueprint_with_outputs.yaml',
+            blueprint_id='blueprint',
+            deployment_id='dep')
+        self.client.deployments.create('blueprint', 'dep-2')
+        for deployment_id in ['dep', 'dep-2']:
+            vm = [x for x in self.client.node_instances.list(
+                deployment_id=deployment_id) if x.node_id == 'vm'][0]
+            self.client.node_instances.update(
+                vm.id, runtime_properties={'ip': deployment_id})
+        outputs = self.client.deployments.outputs.get('dep-2').outputs
+        self.assertEqual('dep-2', outputs['ip_address'])
+
+    def test_outputs_etag(self):
+        id_ = str(uuid.uuid4())
+        self.put_deployment(
+            blueprint_file_name='blueprint_with_outputs.yaml',
+            blueprint_id=id_,
+            deployment_id=id_)
+        outputs_url = self._version_url(
+            '/deployments/{0}/outputs'.format(id_))
+        response = self.app.get(outputs_url)
+        self.assertEqual(200, response.status_code)
+        etag = response.headers['ETag']
+
+        response = self.app.get(outputs_url, headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response.headers['ETag'])
+
+        vm = [x for x in self.client.node_instances.list(deployment_id=id_)
+              if x.node_id == 'vm'][0]
+        self.client.node_instances.update(
+            vm.id, runtime_properties={'ip': '10.0.0.1'})
+        response = self.app.get(outputs_url, headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.headers['ETag'])
+        self.assertEqual('10.0.0.1',
+                         json.loads(response.data)['outputs']['ip_address'])
+
+    def test_outputs_not_cached_when_not_searchable_on_write(self):
+        id_ = str(uuid.uuid4())
+        self.put_deployment(
+            blueprint_file_name='blueprint_with_outputs.yaml',
+            blueprint_id=id_,
+            deployment_id=id_)
+        sm = storage_manager.instance()
+        patch_searchable = mock.patch.object(sm, 'searchable_on_write',
+                                             return_value=False)
+        patch_instances = mock.patch.object(sm, 'get_node_instances',
+                                            wraps=sm.get_node_instances)
+        with patch_searchable, patch_instances as instances_mock:
+            self.client.deployments.outputs.get(id_)
+            self.client.deployments.outputs.get(id_)
+        self.assertEqual(2, instances_mock.call_count)
+
     def test_illegal_output(self):
         id_ = str(uuid.uuid4())
         self.put_deployment(
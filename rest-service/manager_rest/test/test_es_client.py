@@ -0,0 +1,163 @@
+#########
+# Copyright (c) 2013 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import io
+import gzip
+import json
+import zlib
+import socket
+
+import mock
+from nose.plugins.attrib import attr
+from urllib3.connection import HTTPConnection
+from urllib3.response import HTTPResponse
+from elasticsearch import exceptions as es_exceptions
+
+from manager_rest import es_client
+from manager_rest.test import base_test
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class PooledHttpConnectionTests(base_test.BaseServerTestCase):
+
+    def test_keepalive_extends_default_socket_options(self):
+        connection = es_client.PooledHttpConnection(keepalive=True)
+        socket_options = connection.pool.conn_kw['socket_options']
+        for option in HTTPConnection.default_socket_options:
+            self.assertIn(option, socket_options)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+                      socket_options)
+
+    def test_keepalive_disabled(self):
+        connection = es_client.PooledHttpConnection(keepalive=False)
+        self.assertNotIn('socket_options', connection.pool.conn_kw)
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class StreamedSearchTests(base_test.BaseServerTestCase):
+
+    # deliberately not formatted as json.dumps would, so that a response
+    # which was decoded and re-encoded can be told apart
+    ES_RESPONSE = '{"hits" : {"total" : 1,"hits" : [ ]}}'
+
+    def setUp(self):
+        super(StreamedSearchTests, self).setUp()
+        self.es_connection = es_client.PooledHttpConnection()
+        self.http_connection = mock.Mock()
+        self.pool = mock.Mock()
+        patch_urlopen = mock.patch.object(self.es_connection.pool, 'urlopen')
+        self.urlopen = patch_urlopen.start()
+        self.addCleanup(patch_urlopen.stop)
+        es = mock.Mock()
+        es.transport.get_connection.return_value = self.es_connection
+        patch_client = mock.patch('manager_rest.es_client.get_client',
+                                  return_value=es)
+        patch_client.start()
+        self.addCleanup(patch_client.stop)
+
+    def _es_response(self, body, headers=None, status=200):
+        response = HTTPResponse(body=io.BytesIO(body),
+                                headers=headers or {},
+                                status=status,
+                                preload_content=False,
+                                decode_content=False,
+                                pool=self.pool,
+                                connection=self.http_connection)
+        self.urlopen.return_value = response
+        return response
+
+    def _search(self, data, headers=None):
+        return self.app.post(self._version_url('/search'),
+                             content_type='application/json',
+                             data=data,
+                             headers=headers)
+
+    def _assert_released(self, closed=False):
+        self.pool._put_conn.assert_called_once_with(self.http_connection)
+        self.assertEqual(closed, self.http_connection.close.called)
+        self.assertEqual(0, self.es_connection.stats()['in_use'])
+
+    def test_raw_passthrough(self):
+        self._es_response(self.ES_RESPONSE, headers={
+            'content-length': str(len(self.ES_RESPONSE))})
+        query = '{"query" : {"match_all" : {}}}'
+        response = self._search(query)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.ES_RESPONSE, response.data)
+        self.assertEqual(str(len(self.ES_RESPONSE)),
+                         response.headers['Content-Length'])
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(query, self.urlopen.call_args[0][2])
+        self.assertNotIn('Accept-Encoding',
+                         self.urlopen.call_args[1]['headers'])
+        self._assert_released()
+
+    def test_gzip_compressed_by_elasticsearch(self):
+        compressed = _gzip(self.ES_RESPONSE)
+        self._es_response(compressed, headers={'content-encoding': 'gzip'})
+        response = self._search('{}', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual(compressed, response.data)
+        self.assertEqual('gzip', self.urlopen.call_args[1]['headers'][
+            'Accept-Encoding'])
+        self._assert_released()
+
+    def test_gzip_compressed_on_the_fly(self):
+        self._es_response(self.ES_RESPONSE)
+        response = self._search('{}', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(self.ES_RESPONSE, zlib.decompress(
+            response.data, 16 + zlib.MAX_WBITS))
+        self._assert_released()
+
+    def test_invalid_json_query(self):
+        response = self._search('{"query": ')
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(self.urlopen.called)
+
+    def test_error_response(self):
+        error = json.dumps({'error': 'SearchPhaseExecutionException'})
+        self._es_response(error, status=400)
+        self.assertRaises(es_exceptions.RequestError,
+                          self.es_connection.stream_request,
+                          'POST', '/_search', body='{}')
+        self._assert_released()
+
+    def test_partially_read_body_closes_connection(self):
+        self._es_response(self.ES_RESPONSE * 100000)
+        _, _, body = self.es_connection.stream_request('POST', '/_search',
+                                                       body='{}')
+        chunks = iter(body)
+        next(chunks)
+        body.close()
+        self._assert_released(closed=True)
+
+    def test_exhausted_body_keeps_connection(self):
+        self._es_response(self.ES_RESPONSE * 100000)
+        _, _, body = self.es_connection.stream_request('POST', '/_search',
+                                                       body='{}')
+        self.assertEqual(self.ES_RESPONSE * 100000, ''.join(body))
+        body.close()
+        self._assert_released()
@@ -0,0 +1,352 @@
+#########
+# Copyright (c) 2013 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from datetime import datetime
+
+import mock
+import elasticsearch.exceptions
+from flask import Flask
+from nose.plugins.attrib import attr
+
+from manager_rest import es_storage_manager, storage_manager, models
+from manager_rest import manager_exceptions
+from manager_rest.test import base_test
+
+
+def _node_instance(node_instance_id, **kwargs):
+    node_instance = dict(
+        id=node_instance_id, node_id='node', deployment_id='dep',
+        runtime_properties={}, state='uninitialized', version=None,
+        relationships=[], host_id=None)
+    node_instance.update(kwargs)
+    return models.DeploymentNodeInstance(**node_instance)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESStorageManagerTestCase(base_test.BaseServerTestCase):
+
+    def setUp(self):
+        super(ESStorageManagerTestCase, self).setUp()
+        self.es = mock.MagicMock()
+        patch_client = mock.patch('manager_rest.es_client.get_client',
+                                  return_value=self.es)
+        patch_client.start()
+        self.addCleanup(patch_client.stop)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESStorageManagerRefreshPolicyTests(ESStorageManagerTestCase):
+
+    def _storage_manager(self, refresh_policy):
+        return es_storage_manager.ESStorageManager(
+            'localhost', 9200, refresh_policy=refresh_policy)
+
+    def _write_in_request(self, sm):
+        now = str(datetime.now())
+        app = Flask(__name__)
+        with mock.patch.object(storage_manager, 'instance',
+                               return_value=sm):
+            with app.app_context():
+                request_sm = storage_manager.get_storage_manager()
+                request_sm.put_blueprint('bp', models.BlueprintState(
+                    id='bp', created_at=now, updated_at=now,
+                    description=None, plan={}, source=None,
+                    main_file_name='bp.yaml'))
+                request_sm.put_execution('ex', models.Execution(
+                    id='ex', status=models.Execution.PENDING,
+                    deployment_id='dep', workflow_id='install',
+                    blueprint_id='bp', created_at=now, error='',
+                    parameters={}, is_system_workflow=False))
+                self.assertEqual(0, self.es.indices.refresh.call_count)
+
+    def _assert_writes_not_refreshed(self):
+        self.assertEqual(2, self.es.create.call_count)
+        for call in self.es.create.call_args_list:
+            self.assertNotIn('refresh', call[1])
+
+    def test_illegal_refresh_policy(self):
+        self.assertRaises(ValueError, self._storage_manager,
+                          {'default': 'immediate', 'execution': 'eventually'})
+
+    def test_immediate_refresh_policy(self):
+        self._write_in_request(self._storage_manager(None))
+        for call in self.es.create.call_args_list:
+            self.assertTrue(call[1]['refresh'])
+        self.assertEqual(0, self.es.indices.refresh.call_count)
+
+    def test_batched_refresh_policy(self):
+        self._write_in_request(self._storage_manager({'default': 'batched'}))
+        self._assert_writes_not_refreshed()
+        self.es.indices.refresh.assert_called_once_with(
+            index=es_storage_manager.STORAGE_INDEX_NAME)
+
+    def test_searchable_on_write(self):
+        sm = self._storage_manager({'default': 'batched',
+                                    'execution': 'immediate'})
+        self.assertTrue(sm.searchable_on_write(models.Execution))
+        self.assertFalse(
+            sm.searchable_on_write(models.DeploymentNodeInstance))
+
+    def test_deferred_refresh_policy(self):
+        sm = self._storage_manager({'default': 'deferred'})
+        self._write_in_request(sm)
+        sm.refresh_pending()
+        self._assert_writes_not_refreshed()
+        self.assertEqual(0, self.es.indices.refresh.call_count)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESStorageManagerScrollTests(ESStorageManagerTestCase):
+
+    def _scroll_list(self, cursor):
+        sm = es_storage_manager.ESStorageManager('localhost', 9200)
+        return sm.scroll_list(models.Deployment, cursor=cursor)
+
+    def _assert_invalid_cursor(self, error):
+        self.es.scroll.side_effect = error
+        self.assertRaises(manager_exceptions.BadParametersError,
+                          self._scroll_list, 'not-a-cursor')
+
+    def test_expired_cursor(self):
+        self._assert_invalid_cursor(
+            elasticsearch.exceptions.NotFoundError(404, 'not found'))
+
+    def test_malformed_cursor(self):
+        self._assert_invalid_cursor(
+            elasticsearch.exceptions.RequestError(400, 'bad request'))
+
+    def test_cursor_server_error(self):
+        self.es.scroll.side_effect = elasticsearch.exceptions.TransportError(
+            500, 'ElasticsearchException')
+        self.assertRaises(elasticsearch.exceptions.TransportError,
+                          self._scroll_list, 'a-cursor')
+
+    def test_cursor_connection_error(self):
+        self.es.scroll.side_effect = \
+            elasticsearch.exceptions.ConnectionError('N/A', 'refused')
+        self.assertRaises(elasticsearch.exceptions.ConnectionError,
+                          self._scroll_list, 'a-cursor')
+
+    def test_last_page_clears_scroll(self):
+        self.es.scroll.return_value = {'_scroll_id': 'next',
+                                       'hits': {'hits': []}}
+        items, cursor = self._scroll_list('a-cursor')
+        self.assertEqual([], items)
+        self.assertIsNone(cursor)
+        self.es.clear_scroll.assert_called_once_with(scroll_id='next')
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESStorageManagerBulkTests(ESStorageManagerTestCase):
+
+    def setUp(self):
+        super(ESStorageManagerBulkTests, self).setUp()
+        self.sm = es_storage_manager.ESStorageManager('localhost', 9200)
+        self.es.bulk.side_effect = self._bulk
+        self.conflicts = set()
+        patch_chunk_size = mock.patch.object(es_storage_manager,
+                                             'BULK_CHUNK_SIZE', 2)
+        patch_chunk_size.start()
+        self.addCleanup(patch_chunk_size.stop)
+
+    def _bulk(self, body, index, doc_type, **kwargs):
+        items = []
+        for action in body[::2]:
+            doc_id = action.values()[0]['_id']
+            status = 409 if doc_id in self.conflicts else 201
+            items.append({'create': {'_id': doc_id, 'status': status}})
+        return {'items': items}
+
+    def _bulk_calls(self, doc_type):
+        return [call[1] for call in self.es.bulk.call_args_list
+                if call[1]['doc_type'] == doc_type]
+
+    def test_put_nodes_in_chunks(self):
+        self.sm.put_nodes([models.DeploymentNode(
+            id='node{0}'.format(i), deployment_id='dep', blueprint_id='bp',
+            type='type', type_hierarchy=['type'], number_of_instances=1,
+            planned_number_of_instances=1, deploy_number_of_instances=1,
+            host_id=None, properties={}, operations={}, plugins=[],
+            relationships=[], plugins_to_install=[]) for i in range(5)])
+
+        calls = self._bulk_calls(es_storage_manager.NODE_TYPE)
+        self.assertEqual([4, 4, 2], [len(call['body']) for call in calls])
+        self.assertEqual(['dep_node0', 'dep_node1'],
+                         [action['create']['_id']
+                          for action in calls[0]['body'][::2]])
+        # only the last chunk refreshes the index
+        self.assertEqual([False, False, True],
+                         ['refresh' in call for call in calls])
+
+    def test_put_node_instances_in_chunks(self):
+        self.sm.put_node_instances(
+            [_node_instance('ni{0}'.format(i)) for i in range(4)])
+
+        calls = self._bulk_calls(es_storage_manager.NODE_INSTANCE_TYPE)
+        self.assertEqual(2, len(calls))
+        for call in calls:
+            for doc in call['body'][1::2]:
+                self.assertNotIn('version', doc)
+        self.assertEqual([False, True],
+                         ['refresh' in call for call in calls])
+        self.assertEqual(
+            1, len(self._bulk_calls(
+                es_storage_manager.DEPLOYMENT_CHANGES_TYPE)))
+
+    def test_put_node_instances_conflicts(self):
+        self.conflicts = {'ni0', 'ni3'}
+        try:
+            self.sm.put_node_instances(
+                [_node_instance('ni{0}'.format(i)) for i in range(4)])
+            self.fail('ConflictError expected')
+        except manager_exceptions.ConflictError, e:
+            self.assertIn("['ni0', 'ni3']", str(e))
+        # all chunks were sent despite the conflict in the first one, and
+        # the deployment's changes were still recorded
+        self.assertEqual(2, len(self._bulk_calls(
+            es_storage_manager.NODE_INSTANCE_TYPE)))
+        self.assertEqual(1, len(self._bulk_calls(
+            es_storage_manager.DEPLOYMENT_CHANGES_TYPE)))
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESStorageManagerExecutionsCountTests(ESStorageManagerTestCase):
+
+    def test_executions_count(self):
+        self.es.count.return_value = {'count': 3}
+        sm = es_storage_manager.ESStorageManager('localhost', 9200)
+        self.assertEqual(3, sm.executions_count(
+            filters={'status': models.Execution.ACTIVE_STATES}))
+
+        self.es.count.assert_called_once_with(
+            index=es_storage_manager.STORAGE_INDEX_NAME,
+            doc_type=es_storage_manager.EXECUTION_TYPE,
+            body=mock.ANY)
+        body = self.es.count.call_args[1]['body']
+        self.assertNotIn('size', body)
+        self.assertEqual(
+            [{'terms': {'status': models.Execution.ACTIVE_STATES}}],
+            body['query']['filtered']['filter']['bool']['must'])
+        self.assertFalse(self.es.search.called)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESStorageManagerNodeInstanceUpdateTests(ESStorageManagerTestCase):
+
+    def setUp(self):
+        super(ESStorageManagerNodeInstanceUpdateTests, self).setUp()
+        self.sm = es_storage_manager.ESStorageManager('localhost', 9200)
+
+    def _update(self, **kwargs):
+        changes = dict(runtime_properties=None, state=None,
+                       relationships=None, version=3)
+        changes.update(kwargs)
+        return self.sm.update_node_instance(_node_instance('ni', **changes))
+
+    def _updated(self, version, **source):
+        doc = dict(id='ni', node_id='node', deployment_id='dep',
+                   runtime_properties={}, state='uninitialized',
+                   relationships=[], host_id=None)
+        doc.update(source)
+        return {'_version': version, 'get': {'_source': doc}}
+
+    def test_update(self):
+        self.es.update.return_value = self._updated(
+            4, state='started', runtime_properties={'a': 1})
+        node_instance = self._update(state='started',
+                                     runtime_properties={'a': 1})
+
+        self.assertEqual('started', node_instance.state)
+        self.assertEqual(4, node_instance.version)
+        update_kwargs = self.es.update.call_args[1]
+        self.assertEqual(3, update_kwargs['version'])
+        self.assertEqual({'doc': {'state': 'started',
+                                  'runtime_properties': {'a': 1}}},
+                         update_kwargs['body'])
+        self.assertFalse(self.es.index.called)
+
+    def test_update_without_version(self):
+        self.es.update.return_value = self._updated(4, state='started')
+        self._update(state='started', version=0)
+        self.assertNotIn('version', self.es.update.call_args[1])
+
+    def test_update_conflict(self):
+        self.es.update.side_effect = elasticsearch.exceptions.ConflictError(
+            409, 'version conflict')
+        self.assertRaises(manager_exceptions.ConflictError,
+                          self._update, state='started')
+        self.assertFalse(self.es.bulk.called)
+
+    def test_update_missing_node_instance(self):
+        self.es.update.side_effect = elasticsearch.exceptions.NotFoundError(
+            404, 'not found')
+        self.assertRaises(manager_exceptions.NotFoundError,
+                          self._update, state='started')
+
+    def test_update_removing_runtime_properties(self):
+        # the partial update merges the removed property back in
+        self.es.update.return_value = self._updated(
+            4, runtime_properties={'a': 1, 'b': 2})
+        self.es.index.return_value = {'_version': 5}
+        node_instance = self._update(runtime_properties={'a': 1})
+
+        self.assertEqual({'a': 1}, node_instance.runtime_properties)
+        self.assertEqual(5, node_instance.version)
+        index_kwargs = self.es.index.call_args[1]
+        self.assertEqual(4, index_kwargs['version'])
+        self.assertEqual({'a': 1}, index_kwargs['body']['runtime_properties'])
+
+    def test_update_removing_runtime_properties_conflict(self):
+        self.es.update.return_value = self._updated(
+            4, runtime_properties={'a': 1, 'b': 2})
+        self.es.index.side_effect = elasticsearch.exceptions.ConflictError(
+            409, 'version conflict')
+        self.assertRaises(manager_exceptions.ConflictError,
+                          self._update, runtime_properties={'a': 1})
+
+    def _doc(self, node_instance_id, version):
+        return {'_id': node_instance_id, 'found': True, '_version': version,
+                '_source': {'id': node_instance_id, 'node_id': 'node',
+                            'deployment_id': 'dep', 'runtime_properties': {},
+                            'state': 'uninitialized', 'relationships': [],
+                            'host_id': None}}
+
+    def test_update_many_with_stale_versions(self):
+        self.es.mget.return_value = {'docs': [
+            self._doc('ni1', 4),
+            self._doc('ni2', 3),
+            self._doc('ni3', 3),
+            {'_id': 'ni4', 'found': False}]}
+        # ni3 is updated by someone else between the get and the bulk update
+        self.es.bulk.side_effect = [
+            {'items': [{'index': {'_id': 'ni2', 'status': 200,
+                                  '_version': 4}},
+                       {'index': {'_id': 'ni3', 'status': 409}}]},
+            {'items': []}]
+        results = self.sm.update_node_instances(
+            [_node_instance('ni{0}'.format(i), version=3, state='started')
+             for i in range(1, 5)])
+
+        self.assertIsInstance(results[0], manager_exceptions.ConflictError)
+        self.assertEqual(4, results[1].version)
+        self.assertEqual('started', results[1].state)
+        self.assertIsInstance(results[2], manager_exceptions.ConflictError)
+        self.assertIsInstance(results[3], manager_exceptions.NotFoundError)
+        # the stale ni1 isn't written, and the others are written with the
+        # version they were read with
+        body = self.es.bulk.call_args_list[0][1]['body']
+        self.assertEqual([{'index': {'_id': 'ni2', '_version': 3}},
+                          {'index': {'_id': 'ni3', '_version': 3}}],
+                         body[::2])
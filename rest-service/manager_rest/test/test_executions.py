@@ -436,6 +436,25 @@ class ExecutionsTestCase(BaseServerTestCase):
         expected_status_code = 400 if IS_TRANSIENT_WORKERS_MODE else 201
         self._test_execute_more_than_one_workflow(True, expected_status_code)
 
+    def test_execute_after_workflow_ended(self):
+        # only executions in an active state block executing a workflow
+        self.put_deployment(self.DEPLOYMENT_ID)
+        for status in models.Execution.END_STATES:
+            execution = self.client.executions.start(self.DEPLOYMENT_ID,
+                                                     'install')
+            self._modify_execution_status(execution.id, status)
+        execution = self.client.executions.start(self.DEPLOYMENT_ID,
+                                                 'install')
+        self._modify_execution_status(execution.id, 'cancelling')
+        try:
+            self.client.executions.start(self.DEPLOYMENT_ID, 'install')
+            self.fail('Expected the cancelling execution to block executing '
+                      'a workflow')
+        except exceptions.CloudifyClientError, e:
+            self.assertEqual(
+                manager_exceptions.ExistingRunningExecutionError.
+                EXISTING_RUNNING_EXECUTION_ERROR_CODE, e.error_code)
+
     def _test_execute_more_than_one_workflow(self, is_use_force,
                                              expected_status_code):
         (blueprint_id, deployment_id, blueprint_response,
@@ -552,6 +571,21 @@ class TransientDeploymentWorkersExecutionsTestCase(BaseServerTestCase):
         # deployment workers mode is disabled
         self._run_parallel_executions_and_verify_result(expect_failure=False)
 
+    @test_config(enabled=True,
+                 global_parallel_executions_limit=1)
+    def test_transient_dep_workers_global_executions_limit_ignores_ended(
+            self):
+        # verifies only executions in an active state are counted towards
+        # the global executions limit
+        deployment1 = self.DEPLOYMENT_ID + '1'
+        deployment2 = self.DEPLOYMENT_ID + '2'
+        (blueprint_id, _, _, _) = self.put_deployment(deployment1)
+        self.client.deployments.create(blueprint_id, deployment2)
+        for status in models.Execution.END_STATES:
+            execution = self.client.executions.start(deployment1, 'install')
+            self.client.executions.update(execution.id, status)
+        self.client.executions.start(deployment2, 'install')
+
     @test_config(enabled=True,
                  global_parallel_executions_limit=LIMITLESS_GLOBAL_EXECUTIONS)
     def test_transient_dep_workers_limitless_global_executions(self):
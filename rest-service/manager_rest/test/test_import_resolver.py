@@ -13,13 +13,18 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import os
 import mock
+import requests
 from nose.plugins.attrib import attr
 
+from manager_rest import import_resolver_cache
 from manager_rest.test import base_test
 from cloudify_rest_client.exceptions import CloudifyClientError
 from dsl_parser import constants
 from dsl_parser.utils import ResolverInstantiationError
+from dsl_parser.import_resolver.default_import_resolver import \
+    DefaultImportResolver
 
 
 @attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
@@ -62,12 +67,17 @@ class UploadBlueprtinsWithImportResolverTests(base_test.BaseServerTestCase):
         # asserts
         mock_parse_dsl.assert_called_once_with(
             mock.ANY, mock.ANY,
-            resolver='mock expected import resolver',
+            resolver=mock.ANY,
             validate_version=mock.ANY)
+        # the resolved imports are recorded for the plan cache
+        resolver = mock_parse_dsl.call_args[1]['resolver'].resolver
+        self.assertIsInstance(resolver,
+                              import_resolver_cache.CachingImportResolver)
+        self.assertEqual(resolver.resolver, 'mock expected import resolver')
         self.assertEqual(create_import_resolver_inputs[0],
                          resolver_section)
-        self.assertEqual(self.app.application.parser_context['resolver'],
-                         'mock expected import resolver')
+        self.assertIs(self.app.application.parser_context['resolver'],
+                      resolver)
 
     def test_resolver_update_in_app(self):
         # upload blueprint
@@ -83,8 +93,11 @@ class UploadBlueprtinsWithImportResolverTests(base_test.BaseServerTestCase):
             self.put_file(*self.put_blueprint_args())
             mock_parse_dsl.assert_called_once_with(
                 mock.ANY, mock.ANY,
-                resolver='mock resolver',
+                resolver=mock.ANY,
                 validate_version=mock.ANY)
+            self.assertEqual(
+                'mock resolver',
+                mock_parse_dsl.call_args[1]['resolver'].resolver)
 
     def test_failed_to_initialize_resolver(self):
 
@@ -100,3 +113,113 @@ class UploadBlueprtinsWithImportResolverTests(base_test.BaseServerTestCase):
                 self.fail('CloudifyClientError expected')
             except CloudifyClientError, ex:
                 self.assertIn(err_msg, str(ex))
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ImportCacheTests(base_test.BaseServerTestCase):
+
+    IMPORT_URL = 'http://example.com/types.yaml'
+
+    def setUp(self):
+        super(ImportCacheTests, self).setUp()
+        self.cache = import_resolver_cache.ImportCache(
+            path=os.path.join(self.tmpdir, 'imports'), max_age=60)
+        self.resolver = DefaultImportResolver()
+
+    def _response(self, status_code, text='', headers=None):
+        return mock.Mock(status_code=status_code, text=text,
+                         headers=headers or {})
+
+    @mock.patch('requests.get')
+    def test_cached_import(self, mock_get):
+        mock_get.return_value = self._response(200, 'types',
+                                               {'ETag': '"1"'})
+        self.assertEqual('types',
+                         self.cache.resolve(self.IMPORT_URL, self.resolver))
+        self.assertEqual('types',
+                         self.cache.resolve(self.IMPORT_URL, self.resolver))
+        self.assertEqual(1, mock_get.call_count)
+
+        # served from disk by a new cache
+        cache = import_resolver_cache.ImportCache(path=self.cache.path)
+        self.assertEqual('types',
+                         cache.resolve(self.IMPORT_URL, self.resolver))
+        self.assertEqual(1, mock_get.call_count)
+
+    @mock.patch('requests.get')
+    def test_revalidated_import(self, mock_get):
+        mock_get.return_value = self._response(200, 'types',
+                                               {'ETag': '"1"'})
+        self.cache.resolve(self.IMPORT_URL, self.resolver)
+        self.cache.max_age = 0
+
+        mock_get.return_value = self._response(304)
+        self.assertEqual('types',
+                         self.cache.resolve(self.IMPORT_URL, self.resolver))
+        self.assertEqual({'If-None-Match': '"1"'},
+                         mock_get.call_args[1]['headers'])
+
+        mock_get.return_value = self._response(200, 'new types')
+        self.assertEqual('new types',
+                         self.cache.resolve(self.IMPORT_URL, self.resolver))
+
+        mock_get.side_effect = requests.Timeout('timed out')
+        self.assertEqual('new types',
+                         self.cache.resolve(self.IMPORT_URL, self.resolver))
+
+    @mock.patch('requests.get')
+    def test_seeded_import(self, mock_get):
+        seed_path = os.path.join(self.tmpdir, 'seed.yaml')
+        with open(seed_path, 'w') as f:
+            f.write('seeded types')
+        self.cache.seed(self.IMPORT_URL, seed_path)
+        self.assertEqual('seeded types',
+                         self.cache.resolve(self.IMPORT_URL, self.resolver))
+        self.assertFalse(mock_get.called)
+
+    @mock.patch('requests.get')
+    def test_default_seed(self, mock_get):
+        types_url = 'http://www.getcloudify.org/spec/cloudify/3.3/types.yaml'
+        with open(os.path.join(self.tmpdir, 'cloudify', 'types',
+                               'types.yaml')) as f:
+            types = f.read()
+        cache = import_resolver_cache._get_cache()
+        self.assertEqual(types, cache.resolve(types_url, self.resolver))
+        self.assertFalse(mock_get.called)
+
+    @mock.patch('requests.get')
+    def test_memory_bounded(self, mock_get):
+        mock_get.return_value = self._response(200, 'types')
+        cache = import_resolver_cache.ImportCache(max_entries=1)
+        other_url = 'http://example.com/other.yaml'
+        cache.resolve(self.IMPORT_URL, self.resolver)
+        cache.resolve(other_url, self.resolver)
+        cache.resolve(other_url, self.resolver)
+        self.assertEqual(2, mock_get.call_count)
+
+        # evicted by the other import
+        cache.resolve(self.IMPORT_URL, self.resolver)
+        self.assertEqual(3, mock_get.call_count)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class FileServerImportsTests(base_test.BaseServerTestCase):
+
+    def create_configuration(self):
+        test_config = super(FileServerImportsTests,
+                            self).create_configuration()
+        test_config.import_resolver_cache = {
+            'path': os.path.join(self.tmpdir, 'imports'),
+            'seed': {}
+        }
+        return test_config
+
+    def test_file_server_imports_not_cached(self):
+        # the mock blueprint imports hello_world.yaml, relative to it, and
+        # cloudify/types/types.yaml, both served by the file server
+        response = self.put_file(*self.put_blueprint_args())
+        self.assertEqual(201, response.status_code)
+
+        cache = import_resolver_cache._get_cache()
+        self.assertEqual(0, len(cache._entries))
+        self.assertEqual([], os.listdir(cache.path))
@@ -18,6 +18,7 @@ import uuid
 import mock
 from nose.plugins.attrib import attr
 
+from manager_rest import models
 from manager_rest.test import base_test
 from cloudify_rest_client.exceptions import NoSuchIncludeFieldError
 
@@ -36,25 +37,47 @@ class IncludeQueryParamTests(base_test.BaseServerTestCase):
     @attr(client_min_version=2,
           client_max_version=base_test.LATEST_API_VERSION)
     def test_include_propagation_to_model(self):
-        self._test_include_propagation_to_model(dict(include=[u'id'],
-                                                     filters={},
-                                                     pagination={}))
+        # unpaginated v2 lists are streamed from storage
+        self._test_include_propagation_to_model(
+            'manager_rest.file_storage_manager.FileStorageManager.iter_list',
+            (item for item in []),
+            models.BlueprintState,
+            include=[u'id'],
+            filters={})
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_include_propagation_to_model_paginated(self):
+        self._test_include_propagation_to_model(
+            'manager_rest.blueprints_manager.BlueprintsManager'
+            '.blueprints_list',
+            models.ListResult([], 0),
+            include=[u'id'],
+            filters={},
+            pagination={'offset': 0, 'page_size': 10},
+            _offset=0,
+            _size=10)
 
     @attr(client_min_version=1, client_max_version=1)
     def test_include_propagation_to_model_v1(self):
-        self._test_include_propagation_to_model(dict(include=[u'id']))
-
-    def _test_include_propagation_to_model(self,
-                                           expected_blueprints_list_kwargs):
+        self._test_include_propagation_to_model(
+            'manager_rest.blueprints_manager.BlueprintsManager'
+            '.blueprints_list',
+            list(),
+            include=[u'id'])
+
+    def _test_include_propagation_to_model(self, list_method, return_value,
+                                           *expected_args, **expected_kwargs):
         # test that the "include" parameter does not only filter the response
         # fields at the end of the request, but also propagates to the Model
         # section, for more efficient storage queries
-        with mock.patch('manager_rest.blueprints_manager.BlueprintsManager'
-                        '.blueprints_list') as bpm_bp_list:
-            bpm_bp_list.return_value = list()
-            self.client.blueprints.list(_include=['id'])
-            bpm_bp_list.assert_called_once_with(
-                **expected_blueprints_list_kwargs)
+        list_params = {k: expected_kwargs.pop(k)
+                       for k in expected_kwargs.keys() if k.startswith('_')}
+        with mock.patch(list_method) as list_mock:
+            list_mock.return_value = return_value
+            self.client.blueprints.list(_include=['id'], **list_params)
+            list_mock.assert_called_once_with(*expected_args,
+                                              **expected_kwargs)
 
     def test_blueprints(self):
         response = self.client.blueprints.list(_include=['id'])
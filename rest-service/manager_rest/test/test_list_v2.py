@@ -127,3 +127,68 @@ class ResourceListTestCase(BaseListTest):
         self.assertEqual(10, len(response), 'no pagination applied, '
                                             'expecting 10 results, got {0}'
                          .format(len(response)))
+
+    def test_deployments_list_by_cursor(self):
+        deployment_ids = []
+        cursor = ''
+        while cursor is not None:
+            response = self.get('/deployments',
+                                query_params={'_cursor': cursor,
+                                              '_size': 4})
+            self.assertLessEqual(len(response.json), 4)
+            deployment_ids.extend(d['id'] for d in response.json)
+            cursor = response.headers.get('X-Cloudify-Cursor')
+        self.assertEqual(sorted('test{0}'.format(i) for i in range(10)),
+                         sorted(deployment_ids))
+
+    def test_deployments_list_by_invalid_cursor(self):
+        response = self.get('/deployments',
+                            query_params={'_cursor': 'not-a-cursor'})
+        self.assertEqual(400, response.status_code)
+
+    def test_deployments_list_by_cursor_with_empty_page(self):
+        response = self.get('/deployments',
+                            query_params={'_cursor': '', '_size': 0})
+        self.assertEqual(400, response.status_code)
+        self.assertIn('_size must be a positive integer',
+                      response.json['message'])
+
+    def test_node_instances_list_streamed(self):
+        response = self.get('/node-instances',
+                            query_params={'_include': 'id,deployment_id'})
+        self.assertEqual(20, len(response.json))
+        for node_instance in response.json:
+            self.assertEqual({'id', 'deployment_id'},
+                             set(node_instance.keys()))
+
+    def test_deployments_list_paginated_by_size_only(self):
+        response = self.get('/deployments', query_params={'_size': 3})
+        self.assertEqual(3, len(response.json))
+        self.assertEqual('10', response.headers['X-Cloudify-Total'])
+        self.assertEqual('0', response.headers['X-Cloudify-Offset'])
+        self.assertEqual('3', response.headers['X-Cloudify-Size'])
+
+    def test_deployments_list_paginated_metadata(self):
+        response = self.get('/deployments',
+                            query_params={'_offset': 9, '_size': 3})
+        self.assertEqual(1, len(response.json))
+        self.assertEqual('10', response.headers['X-Cloudify-Total'])
+        self.assertEqual('9', response.headers['X-Cloudify-Offset'])
+        self.assertEqual('3', response.headers['X-Cloudify-Size'])
+
+    def test_deployments_list_sorted(self):
+        response = self.get('/deployments',
+                            query_params={'_sort': '-id', '_size': 3})
+        self.assertEqual(['test9', 'test8', 'test7'],
+                         [d['id'] for d in response.json])
+        response = self.client.deployments.list(_sort='id', _offset=8)
+        self.assertEqual(['test8', 'test9'], [d.id for d in response])
+
+    def test_deployments_list_sorted_by_unknown_field(self):
+        response = self.get('/deployments',
+                            query_params={'_sort': 'no_such_field'})
+        self.assertEqual(400, response.status_code)
+
+    def test_deployments_list_paginated_bad_size(self):
+        response = self.get('/deployments', query_params={'_size': 'abc'})
+        self.assertEqual(400, response.status_code)
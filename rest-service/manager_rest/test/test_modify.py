@@ -16,6 +16,7 @@
 import copy
 import uuid
 import dateutil.parser
+import mock
 from datetime import datetime, timedelta
 from nose.plugins.attrib import attr
 
@@ -42,8 +43,16 @@ class ModifyTests(base_test.BaseServerTestCase):
             expected_after_end_runtime_property='after_start')
 
     def test_data_model_with_rollback(self):
-        def expected_after_end_func(before_modification, _):
-            return before_modification
+        def expected_after_end_func(before_modification, before_end):
+            # the added node1 instance is removed, and only the instances
+            # affected by the modification are restored
+            before_modification_ids = [instance.id for instance
+                                       in before_modification]
+            return [instance for instance in before_end
+                    if instance.node_id == 'node1' and
+                    instance.id in before_modification_ids] + \
+                [instance for instance in before_modification
+                 if instance.node_id == 'node2']
         self._test_data_model_impl(
             end_func=self.client.deployment_modifications.rollback,
             expected_end_status=DeploymentModification.ROLLEDBACK,
@@ -91,12 +100,18 @@ class ModifyTests(base_test.BaseServerTestCase):
             runtime_properties={'test': 'before_start'},
             version=0)
 
+        def affected(node_instances):
+            # the existing node1 instance isn't affected by adding another
+            # one, while the node2 instance gets a relationship to it
+            return [instance for instance in node_instances
+                    if instance.id != node1_instance.id]
+
         before_modification = self.client.node_instances.list(deployment.id)
         modified_nodes = {'node1': {'instances': 2}}
         modification = self.client.deployment_modifications.start(
             deployment.id, nodes=modified_nodes, context=mock_context)
         self.assertEqual(modification.node_instances.before_modification,
-                         before_modification)
+                         affected(before_modification))
         self.assertIsNone(modification.ended_at)
 
         self.client.node_instances.update(
@@ -141,13 +156,17 @@ class ModifyTests(base_test.BaseServerTestCase):
         self.assertEqual([], self.client.deployment_modifications.list(
             deployment_id='i_really_should_not_exist'))
         self.assertEqual(modification.node_instances.before_modification,
-                         before_modification)
-        self.assertEqual(modification.node_instances.before_rollback,
-                         expected_before_end_func(before_end))
-
-        self.assertEqual(after_end,
-                         expected_after_end_func(before_modification,
-                                                 before_end))
+                         affected(before_modification))
+        self.assertEqual(
+            sorted(modification.node_instances.before_rollback,
+                   key=lambda instance: instance['id']),
+            sorted(expected_before_end_func(affected(before_end)),
+                   key=lambda instance: instance['id']))
+
+        self.assertEqual(sorted(after_end, key=lambda instance: instance.id),
+                         sorted(expected_after_end_func(before_modification,
+                                                        before_end),
+                                key=lambda instance: instance.id))
         self.assertEqual(modification.context, mock_context)
 
         self.assertEqual(expected_after_end_count, len(after_end))
@@ -155,12 +174,44 @@ class ModifyTests(base_test.BaseServerTestCase):
         self.assertEqual(
             self.client.node_instances.get(
                 node1_instance.id).runtime_properties['test'],
-            expected_after_end_runtime_property)
+            'after_start')
         self.assertEqual(
             self.client.node_instances.get(
                 node2_instance.id).runtime_properties['test'],
             expected_after_end_runtime_property)
 
+    def test_rollback_keeps_unaffected_node_instances(self):
+        _, _, _, deployment = self.put_deployment(
+            deployment_id=str(uuid.uuid4()),
+            blueprint_file_name='modify3.yaml')
+        node3_instance = self.client.node_instances.list(
+            deployment_id=deployment.id, node_name='node3')[0]
+
+        modification = self.client.deployment_modifications.start(
+            deployment.id, nodes={'node1': {'instances': 2}})
+        self.assertEqual(
+            ['node2'],
+            sorted(instance.node_id for instance
+                   in modification.node_instances.before_modification))
+        self.client.node_instances.update(
+            node3_instance.id,
+            runtime_properties={'test': 'after_start'},
+            version=0)
+
+        # only the affected node instances are read, rather than all of the
+        # deployment's node instances
+        with mock.patch('manager_rest.file_storage_manager.'
+                        'FileStorageManager.get_node_instances') \
+                as get_node_instances:
+            self.client.deployment_modifications.rollback(modification.id)
+        self.assertFalse(get_node_instances.called)
+        self.assertEqual(3, len(self.client.node_instances.list(
+            deployment_id=deployment.id)))
+        self.assertEqual(
+            {'test': 'after_start'},
+            self.client.node_instances.get(
+                node3_instance.id).runtime_properties)
+
     def test_no_concurrent_modifications(self):
         _, _, _, deployment = self.put_deployment(
             deployment_id=str(uuid.uuid4()),
@@ -16,6 +16,7 @@
 from nose.plugins.attrib import attr
 
 import manager_rest.storage_manager as sm
+from manager_rest.models import DeploymentNodeInstance
 from manager_rest.test import base_test
 
 
@@ -267,6 +268,41 @@ class NodesTest(base_test.BaseServerTestCase):
         assert_dep_and_node(2, '222', '3', dep2_n3_instances)
         assert_dep_and_node(2, '222', '4', dep2_n4_instances)
 
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_patch_node_instances(self):
+        self.put_node_instance(instance_id='11', deployment_id='111',
+                               runtime_properties={'key': 'value'})
+        self.put_node_instance(instance_id='12', deployment_id='111')
+        response = self.patch('/node-instances', {
+            'node_instances': [
+                {'id': '11', 'version': 0,
+                 'runtime_properties': {'key': 'new_value'}},
+                {'id': '1234', 'version': 0, 'state': 'started'},
+                {'id': '12', 'version': 0, 'state': 'started'}
+            ]
+        })
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['11', '1234', '12'],
+                         [result['id'] for result in response.json])
+        self.assertIsNone(response.json[0]['error_code'])
+        self.assertEqual('not_found_error', response.json[1]['error_code'])
+        self.assertIsNone(response.json[2]['error_code'])
+
+        node_instance_11 = self.client.node_instances.get('11')
+        self.assertEqual({'key': 'new_value'},
+                         node_instance_11.runtime_properties)
+        self.assertEqual('started',
+                         self.client.node_instances.get('12').state)
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_bad_patch_node_instances(self):
+        response = self.patch('/node-instances', {
+            'node_instances': [{'id': '11', 'version': 'not_an_int'}]
+        })
+        self.assertEqual(400, response.status_code)
+
     def test_patch_before_put(self):
         response = self.patch('/node-instances/1234',
                               {'runtime_properties': {'key': 'value'},
@@ -289,3 +325,46 @@ class NodesTest(base_test.BaseServerTestCase):
                                       relationships=None,
                                       host_id=None)
         sm.instance().put_node_instance(node)
+
+
+@attr(client_min_version=2, client_max_version=base_test.LATEST_API_VERSION)
+class VersionedNodeInstancesTest(base_test.BaseServerTestCase):
+    """
+    Node instances tests using a storage manager which, unlike the file
+    storage manager, checks node instance versions.
+    """
+
+    storage_manager_module_name = 'manager_rest.sqlite_storage_manager'
+
+    def test_patch_node_instances_version_conflict(self):
+        for instance_id in ['11', '12']:
+            sm.instance().put_node_instance(DeploymentNodeInstance(
+                id=instance_id, node_id='1', deployment_id='111',
+                runtime_properties={}, state='uninitialized', version=None,
+                relationships=[], host_id=None))
+        response = self.patch('/node-instances', {
+            'node_instances': [
+                {'id': '11', 'version': 1, 'state': 'started'},
+                {'id': '12', 'version': 1, 'state': 'started'}
+            ]
+        })
+        self.assertEqual([2, 2],
+                         [result['version'] for result in response.json])
+
+        # 11 was updated since version 1 was read
+        response = self.patch('/node-instances', {
+            'node_instances': [
+                {'id': '11', 'version': 1, 'state': 'stopped'},
+                {'id': '12', 'version': 2, 'state': 'stopped'}
+            ]
+        })
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('conflict_error', response.json[0]['error_code'])
+        self.assertIn('updated_version=1', response.json[0]['message'])
+        self.assertIsNone(response.json[0]['version'])
+        self.assertIsNone(response.json[1]['error_code'])
+        self.assertEqual(3, response.json[1]['version'])
+        self.assertEqual('started',
+                         self.client.node_instances.get('11').state)
+        self.assertEqual('stopped',
+                         self.client.node_instances.get('12').state)
@@ -16,7 +16,10 @@
 from nose.plugins.attrib import attr
 
 from manager_rest import manager_exceptions
+from manager_rest import models
+from manager_rest import provider_context_cache
 from manager_rest import resources_v2
+from manager_rest import storage_manager
 from manager_rest.test import base_test
 from cloudify_rest_client import exceptions
 from manager_rest.blueprints_manager import \
@@ -53,6 +56,24 @@ class ProviderContextTestCase(base_test.BaseServerTestCase):
                 manager_exceptions.ConflictError.CONFLICT_ERROR_CODE,
                 e.error_code)
 
+    def test_provider_context_cache_detects_external_update(self):
+        self.test_post_provider_context()
+        sm = storage_manager.instance()
+        cached = provider_context_cache.get_provider_context(sm)
+        self.assertEqual('value', cached.context['key'])
+
+        # an update made by another process doesn't invalidate this
+        # process' cache, but it does bump the version stamp in storage
+        sm.update_provider_context(models.ProviderContext(
+            name='test_provider', context={'key': 'new-value'}))
+        cached = provider_context_cache.get_provider_context(sm)
+        self.assertEqual('new-value', cached.context['key'])
+
+        # modifying the returned context doesn't affect the cache
+        cached.context['key'] = 'modified'
+        cached = provider_context_cache.get_provider_context(sm)
+        self.assertEqual('new-value', cached.context['key'])
+
     @attr(client_min_version=2,
           client_max_version=base_test.LATEST_API_VERSION)
     def test_modify_global_parallel_executions_limit(self):
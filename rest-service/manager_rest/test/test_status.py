@@ -28,3 +28,11 @@ class StatusTestCase(base_test.BaseServerTestCase):
     def test_get_services(self):
         result = self.get('/status')
         self.assertEqual(type(result.json['services']), list)
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_get_storage_connection_pool(self):
+        result = self.get('/status')
+        pool_stats = result.json['storage_connection_pool']
+        self.assertEqual({'in_use', 'idle', 'created', 'errors', 'maxsize'},
+                         set(pool_stats.keys()))
@@ -13,11 +13,15 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import os
+import threading
 from datetime import datetime
 
+import mock
 from nose.plugins.attrib import attr
 
-from manager_rest import storage_manager, models
+from manager_rest import storage_manager, models, manager_exceptions
+from manager_rest import file_storage_manager
 from manager_rest.test import base_test
 
 
@@ -161,3 +165,289 @@ class StorageManagerTests(base_test.BaseServerTestCase):
         self.assertEquals(None, blueprint_restored.updated_at)
         self.assertEquals(None, blueprint_restored.plan)
         self.assertEquals(None, blueprint_restored.main_file_name)
+
+    def test_fields_query_in_lists(self):
+        execution = models.Execution(id='execution-id',
+                                     status=models.Execution.PENDING,
+                                     deployment_id='dep-id',
+                                     workflow_id='install',
+                                     blueprint_id='bp-id',
+                                     created_at=str(datetime.now()),
+                                     error='',
+                                     parameters={'param': 'value'},
+                                     is_system_workflow=False)
+        storage_manager.instance().put_execution('execution-id', execution)
+
+        executions = storage_manager.instance().executions_list(
+            include=['id', 'status'],
+            filters={'deployment_id': ['dep-id']})
+        self.assertEquals(1, len(executions))
+        self.assertEquals('execution-id', executions[0].id)
+        self.assertEquals(models.Execution.PENDING, executions[0].status)
+        self.assertEquals(None, executions[0].parameters)
+        self.assertEquals(None, executions[0].deployment_id)
+
+        execution_restored = storage_manager.instance().get_execution(
+            'execution-id', include=['workflow_id'])
+        self.assertEquals('install', execution_restored.workflow_id)
+        self.assertEquals(None, execution_restored.parameters)
+
+    def test_put_node_instances_reports_conflicts(self):
+        def node_instance(instance_id):
+            return models.DeploymentNodeInstance(id=instance_id,
+                                                 node_id='node',
+                                                 host_id=None,
+                                                 relationships=[],
+                                                 deployment_id='dep-id',
+                                                 state='uninitialized',
+                                                 runtime_properties={},
+                                                 version=None)
+        sm = storage_manager.instance()
+        sm.put_node_instances([node_instance('node_1'),
+                               node_instance('node_2')])
+        try:
+            sm.put_node_instances([node_instance('node_2'),
+                                   node_instance('node_3')])
+            self.fail('Expected a conflict error')
+        except manager_exceptions.ConflictError as e:
+            self.assertIn('node_2', str(e))
+            self.assertNotIn('node_3', str(e))
+        self.assertEquals(
+            {'node_1', 'node_2', 'node_3'},
+            set(instance.id for instance in sm.get_node_instances()))
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class SQLiteStorageManagerTests(StorageManagerTests):
+
+    storage_manager_module_name = 'manager_rest.sqlite_storage_manager'
+
+    def _node_instance(self, instance_id, runtime_properties=None,
+                       version=None):
+        return models.DeploymentNodeInstance(
+            id=instance_id,
+            node_id='node',
+            host_id=None,
+            relationships=[],
+            deployment_id='dep-id',
+            state='uninitialized',
+            runtime_properties=runtime_properties or {},
+            version=version)
+
+    def test_update_node_instance_version_conflict(self):
+        sm = storage_manager.instance()
+        sm.put_node_instance(self._node_instance('node_1'))
+        updated = sm.update_node_instance(self._node_instance(
+            'node_1', runtime_properties={'key': 'value'}, version=1))
+        self.assertEquals(2, updated.version)
+        self.assertEquals({'key': 'value'}, updated.runtime_properties)
+        self.assertRaises(manager_exceptions.ConflictError,
+                          sm.update_node_instance,
+                          self._node_instance('node_1', version=1))
+
+    def test_list_filters_sort_and_pagination(self):
+        sm = storage_manager.instance()
+        sm.put_node_instances([self._node_instance('node_{0}'.format(i))
+                               for i in range(5)])
+        node_instances = sm.get_node_instances(
+            filters={'id': ['node_1', 'node_2', 'node_3']},
+            pagination={'offset': 1, 'page_size': 1,
+                        'sort': [('id', 'desc')]})
+        self.assertEquals(3, node_instances.total)
+        self.assertEquals(['node_2'], [n.id for n in node_instances])
+
+    def test_delete_deployment_removes_dependents(self):
+        sm = storage_manager.instance()
+        sm.put_deployment('dep-id', models.Deployment(id='dep-id',
+                                                      created_at=None,
+                                                      updated_at=None,
+                                                      blueprint_id='bp-id',
+                                                      workflows={},
+                                                      inputs={},
+                                                      policy_types={},
+                                                      policy_triggers={},
+                                                      groups={},
+                                                      outputs={}))
+        sm.put_node_instances([self._node_instance('node_1')])
+        self.assertEquals('dep-id', sm.delete_deployment('dep-id').id)
+        self.assertEquals(0, len(sm.get_node_instances()))
+        self.assertRaises(manager_exceptions.NotFoundError,
+                          sm.get_deployment, 'dep-id')
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class InMemoryFileStorageManagerTests(StorageManagerTests):
+
+    def create_configuration(self):
+        test_config = super(InMemoryFileStorageManagerTests,
+                            self).create_configuration()
+        test_config.file_storage = {
+            'path': os.path.join(self.tmpdir, 'storage.json'),
+            'in_memory': True
+        }
+        return test_config
+
+    def _node_instance(self, instance_id, deployment_id='dep-id',
+                       node_id='node'):
+        return models.DeploymentNodeInstance(
+            id=instance_id,
+            node_id=node_id,
+            host_id=None,
+            relationships=[],
+            deployment_id=deployment_id,
+            state='uninitialized',
+            runtime_properties={},
+            version=None)
+
+    def _storage_manager(self, compaction_threshold=1000):
+        return file_storage_manager.FileStorageManager(
+            os.path.join(self.tmpdir, 'resident.json'),
+            in_memory=True,
+            compaction_threshold=compaction_threshold)
+
+    def test_indexed_filters(self):
+        sm = self._storage_manager()
+        sm.put_node_instances([
+            self._node_instance('node_1', node_id='node_a'),
+            self._node_instance('node_2', node_id='node_b'),
+            self._node_instance('node_3', deployment_id='dep-2')])
+        sm.delete_node_instance('node_2')
+        node_instances = sm.get_node_instances(
+            filters={'deployment_id': ['dep-id'],
+                     'node_id': ['node_a', 'node_b']})
+        self.assertEquals(['node_1'], [n.id for n in node_instances])
+
+    def test_recover_from_snapshot_and_journal(self):
+        sm = self._storage_manager(compaction_threshold=3)
+        sm.put_node_instances([self._node_instance('node_1'),
+                               self._node_instance('node_2'),
+                               self._node_instance('node_3')])
+        sm.delete_node_instance('node_1')
+        with open(os.path.join(self.tmpdir, 'resident.json.journal'),
+                  'a') as f:
+            # a partially written journal entry is ignored on recovery
+            f.write('["node_instances", "node_')
+
+        recovered = self._storage_manager()
+        self.assertEquals(['node_2', 'node_3'],
+                          [n.id for n in recovered.get_node_instances()])
+
+    def test_journal_synced(self):
+        sm = self._storage_manager()
+        with mock.patch('os.fsync') as fsync:
+            sm.put_node_instance(self._node_instance('node_1'))
+        fsync.assert_called_once_with(sm._store._journal.fileno())
+
+    def test_concurrent_writes_serialized(self):
+        sm = self._storage_manager()
+        sm.put_node_instance(self._node_instance('node_1'))
+        view = file_storage_manager._ResidentStore.view
+        viewed = threading.Event()
+        proceed = threading.Event()
+
+        def view_and_wait(store):
+            data = view(store)
+            if threading.current_thread().name == 'first':
+                viewed.set()
+                proceed.wait(10)
+            return data
+
+        def update(name, **changes):
+            node_instance = self._node_instance('node_1')
+            node_instance.state = None
+            node_instance.runtime_properties = None
+            for field, value in changes.iteritems():
+                setattr(node_instance, field, value)
+            thread = threading.Thread(name=name,
+                                      target=sm.update_node_instance,
+                                      args=(node_instance,))
+            thread.start()
+            return thread
+
+        with mock.patch.object(file_storage_manager._ResidentStore, 'view',
+                               view_and_wait):
+            first = update('first', state='started')
+            self.assertTrue(viewed.wait(10))
+            second = update('second', runtime_properties={'key': 'value'})
+            # the second update waits for the first to be applied, rather
+            # than applying its own changes to the data the first one read
+            second.join(0.5)
+            self.assertTrue(second.is_alive())
+            proceed.set()
+            first.join()
+            second.join()
+
+        node_instance = sm.get_node_instance('node_1')
+        self.assertEquals('started', node_instance.state)
+        self.assertEquals({'key': 'value'}, node_instance.runtime_properties)
+
+    def test_reset_closes_journal(self):
+        store = storage_manager.instance()._store
+        journal = store._journal
+        storage_manager.reset()
+        self.assertTrue(journal.closed)
+        self.assertIsNone(store._journal)
+        self.assertIsNot(store, storage_manager.instance()._store)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class RequestScopedStorageManagerTests(base_test.BaseServerTestCase):
+
+    def _put_execution(self, execution_id):
+        storage_manager.instance().put_execution(
+            execution_id, models.Execution(id=execution_id,
+                                           status=models.Execution.PENDING,
+                                           created_at=str(datetime.now()),
+                                           blueprint_id='bp-id',
+                                           workflow_id='install',
+                                           deployment_id='dep-id',
+                                           error='',
+                                           parameters={},
+                                           is_system_workflow=False))
+
+    def test_reads_are_deduplicated_within_request(self):
+        from manager_rest import server
+        self._put_execution('execution-id')
+        sm = storage_manager.instance()
+        with mock.patch.object(sm, 'get_execution',
+                               wraps=sm.get_execution) as get_mock, \
+                server.app.test_request_context():
+            request_sm = storage_manager.get_storage_manager()
+            execution = request_sm.get_execution('execution-id')
+            self.assertEquals(
+                execution.to_dict(),
+                request_sm.get_execution('execution-id').to_dict())
+            request_sm.get_execution('execution-id', include=['id'])
+            self.assertEquals(2, get_mock.call_count)
+
+        with mock.patch.object(sm, 'get_execution',
+                               wraps=sm.get_execution) as get_mock, \
+                server.app.test_request_context():
+            storage_manager.get_storage_manager().get_execution(
+                'execution-id')
+            self.assertEquals(1, get_mock.call_count)
+
+    def test_writes_invalidate_reads(self):
+        from manager_rest import server
+        self._put_execution('execution-id')
+        with server.app.test_request_context():
+            request_sm = storage_manager.get_storage_manager()
+            self.assertEquals(models.Execution.PENDING,
+                              request_sm.get_execution('execution-id').status)
+            request_sm.update_execution_status(
+                'execution-id', models.Execution.STARTED, '')
+            self.assertEquals(models.Execution.STARTED,
+                              request_sm.get_execution('execution-id').status)
+
+    def test_cached_reads_are_copies(self):
+        from manager_rest import server
+        self._put_execution('execution-id')
+        with server.app.test_request_context():
+            request_sm = storage_manager.get_storage_manager()
+            execution = request_sm.get_execution('execution-id')
+            execution.status = models.Execution.STARTED
+            execution.parameters['key'] = 'value'
+            cached = request_sm.get_execution('execution-id')
+            self.assertIsNot(execution, cached)
+            self.assertEquals(models.Execution.PENDING, cached.status)
+            self.assertEquals({}, cached.parameters)
@@ -13,6 +13,7 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import os
 import sys
 import logging
 import shutil
@@ -72,6 +73,23 @@ def copy_resources(file_server_root, resources_path=None):
                                                   'cloudify'))
 
 
+def update_directory_digest(digest, directory, buffer_size=64 * 1024):
+    """
+    Updates the given hash object with the relative path, size and content
+    of each of the files under the given directory, in a stable order.
+    """
+    for base, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file_name in sorted(files):
+            file_path = os.path.join(base, file_name)
+            digest.update('{0}\0{1}\0'.format(
+                os.path.relpath(file_path, directory),
+                os.path.getsize(file_path)))
+            with open(file_path, 'rb') as f:
+                for buf in iter(lambda: f.read(buffer_size), ''):
+                    digest.update(buf)
+
+
 def maybe_register_teardown(app, f):
     """
     A way to add a cleanup hook on a given appcontext - but only do it once